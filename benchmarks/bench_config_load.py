@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+"""Benchmark metomi.rose.config.ConfigLoader.load on large config files.
+
+Usage:
+    python benchmarks/bench_config_load.py [--sections=N] [--runs=N]
+        [--baseline=FILE]
+
+Generate an application configuration in the style of a big UM app (many
+namelist sections with commented options, some with long multi-line array
+values) and a suite configuration in the style of a big suite (Jinja2
+variables with long multi-line lists), and time how long it takes to load
+each of them.
+
+To compare against another version of the module, extract it, e.g.:
+    git show REV:metomi/rose/config.py >/tmp/config_base.py
+and pass it with "--baseline=/tmp/config_base.py". The loaded nodes of both
+versions are checked to be identical.
+"""
+
+from argparse import ArgumentParser
+import importlib.util
+import os
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import metomi.rose.config
+
+
+def write_app_conf(handle, n_sections, n_options=50):
+    """Write a large application configuration to handle."""
+    handle.write("meta=um-atmos/vn11.0\n\n[command]\ndefault=um-atmos\n\n")
+    for i_section in range(n_sections):
+        state = "!!" if i_section % 7 == 0 else ""
+        handle.write("[%snamelist:nl_%d]\n" % (state, i_section))
+        for i_option in range(n_options):
+            if i_option % 5 == 0:
+                handle.write("# Comment for option %d\n" % i_option)
+            if i_option % 10 == 0:
+                handle.write("real_array_%d=%s\n" % (i_option, ",\n   =".join(
+                    ",".join("%d.5e-3" % i for i in range(10))
+                    for _ in range(20))))
+            else:
+                handle.write("%svar_%d=%d\n" % (
+                    "!" if i_option % 9 == 0 else "", i_option, i_option))
+        handle.write("\n")
+
+
+def write_suite_conf(handle, n_sections, n_items=200):
+    """Write a large suite configuration to handle."""
+    handle.write("[jinja2:suite.rc]\n")
+    for i_section in range(n_sections):
+        handle.write("RESOURCES_%d={\n" % i_section)
+        for i_item in range(n_items):
+            handle.write(
+                "    ='task_%d': ['-l walltime=%d', '-q normal'],\n" % (
+                    i_item, i_item))
+        handle.write("    =}\n")
+        handle.write("FLAG_%d=true\n" % i_section)
+    handle.write("\n[env]\n")
+    for i_section in range(n_sections):
+        handle.write("VAR_%d=value %d\n" % (i_section, i_section))
+
+
+def load_module(path):
+    """Load a config module from a file path."""
+    spec = importlib.util.spec_from_file_location("config_base", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_load(module, file_name, n_runs):
+    """Return (seconds, node) of loading file_name n_runs times."""
+    loader = module.ConfigLoader()
+    start = perf_counter()
+    for _ in range(n_runs):
+        node = loader.load(file_name)
+    return perf_counter() - start, node
+
+
+def main():
+    """Implement the benchmark."""
+    arg_parser = ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--sections", type=int, default=1000)
+    arg_parser.add_argument("--runs", type=int, default=3)
+    arg_parser.add_argument("--baseline")
+    args = arg_parser.parse_args()
+
+    base_module = None
+    if args.baseline:
+        base_module = load_module(args.baseline)
+    with TemporaryDirectory() as temp_dir:
+        for name, write_conf in [
+                ("rose-app.conf", write_app_conf),
+                ("rose-suite.conf", write_suite_conf)]:
+            file_name = os.path.join(temp_dir, name)
+            with open(file_name, "w") as handle:
+                write_conf(handle, args.sections)
+            print("%s: %d bytes, runs: %d" % (
+                name, os.path.getsize(file_name), args.runs))
+            elapsed, node = time_load(
+                metomi.rose.config, file_name, args.runs)
+            print("  current:  %8.3fs" % elapsed)
+            if base_module is None:
+                continue
+            base_elapsed, base_node = time_load(
+                base_module, file_name, args.runs)
+            print("  baseline: %8.3fs" % base_elapsed)
+            print("  speed up: %8.2fx" % (base_elapsed / elapsed))
+            if repr(node) != repr(base_node):
+                raise SystemExit("ERROR: loaded nodes differ")
+
+
+if __name__ == "__main__":
+    main()
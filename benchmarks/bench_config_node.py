@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+"""Benchmark metomi.rose.config.ConfigNode walk, get and set.
+
+Usage:
+    python benchmarks/bench_config_node.py [--settings=N] [--per-section=N]
+        [--baseline=FILE]
+
+Build a configuration with a large number of settings in the style of a big
+UM app (many namelist sections with many options each), then time how long
+it takes to "set" all the settings, "get" each setting by its keys, and
+"walk" the whole configuration (with and without ignored settings).
+
+To compare against another version of the module, extract it, e.g.:
+    git show REV:metomi/rose/config.py >/tmp/config_base.py
+and pass it with "--baseline=/tmp/config_base.py". The results of both
+versions are checked to be identical.
+"""
+
+from argparse import ArgumentParser
+import importlib.util
+from time import perf_counter
+
+import metomi.rose.config
+
+
+def get_keys_list(n_settings, n_per_section=100):
+    """Return a list of n_settings [section, option] keys."""
+    return [
+        ["namelist:nl_%d" % (i // n_per_section), "var_%d" % i]
+        for i in range(n_settings)]
+
+
+def load_module(path):
+    """Load a config module from a file path."""
+    spec = importlib.util.spec_from_file_location("config_base", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_module(module, keys_list):
+    """Return ({operation: seconds, ...}, results) for a config module."""
+    times = {}
+    results = []
+
+    start = perf_counter()
+    node = module.ConfigNode()
+    for i, keys in enumerate(keys_list):
+        state = None
+        if i % 10 == 0:
+            state = module.ConfigNode.STATE_USER_IGNORED
+        node.set(keys, str(i), state)
+    times["set"] = perf_counter() - start
+
+    start = perf_counter()
+    values = [node.get(keys).value for keys in keys_list]
+    times["get"] = perf_counter() - start
+    results.append(values)
+
+    start = perf_counter()
+    values = [node.get_value(keys) for keys in keys_list]
+    times["get_value"] = perf_counter() - start
+    results.append(values)
+
+    for no_ignore in (False, True):
+        start = perf_counter()
+        walked_keys = [keys for keys, _ in node.walk(no_ignore=no_ignore)]
+        times["walk(no_ignore=%s)" % no_ignore] = perf_counter() - start
+        results.append(walked_keys)
+    return times, results
+
+
+def main():
+    """Implement the benchmark."""
+    arg_parser = ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--settings", type=int, default=100000)
+    arg_parser.add_argument("--per-section", type=int, default=100)
+    arg_parser.add_argument("--baseline")
+    args = arg_parser.parse_args()
+
+    keys_list = get_keys_list(args.settings, args.per_section)
+    print("settings: %d, per section: %d" % (
+        args.settings, args.per_section))
+    times, results = time_module(metomi.rose.config, keys_list)
+    if args.baseline:
+        base_times, base_results = time_module(
+            load_module(args.baseline), keys_list)
+        print("%-24s %10s %10s %10s" % (
+            "operation", "current", "baseline", "speed up"))
+        for key, elapsed in times.items():
+            print("%-24s %9.3fs %9.3fs %9.2fx" % (
+                key, elapsed, base_times[key], base_times[key] / elapsed))
+        if results != base_results:
+            raise SystemExit("ERROR: results differ")
+    else:
+        for key, elapsed in times.items():
+            print("%-24s %9.3fs" % (key, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+"""Benchmark metomi.rose.formats.namelist.parse on large namelist files.
+
+Usage:
+    python benchmarks/bench_namelist.py [--groups=N] [--baseline=FILE]
+
+Generate a multi-megabyte namelist file in the style of a big UM/JULES
+namelist (thousands of array elements per object) and time how long it
+takes to parse it.
+
+To compare against another version of the parser, extract its module, e.g.:
+    git show REV:metomi/rose/formats/namelist.py >/tmp/namelist_base.py
+and pass it with "--baseline=/tmp/namelist_base.py". The outputs of both
+parsers are checked to be identical.
+"""
+
+from argparse import ArgumentParser
+import importlib.util
+import os
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+import metomi.rose.formats.namelist
+
+
+def write_namelist(handle, n_groups, n_objects=50, n_values=100):
+    """Write a large namelist file to handle."""
+    for i_group in range(n_groups):
+        handle.write("&group_%d\n" % i_group)
+        for i_object in range(n_objects):
+            handle.write(" real_array_%d(1:%d)=%s,\n" % (
+                i_object,
+                n_values,
+                ",".join("%d.5e-3" % i for i in range(n_values))))
+            handle.write("   %s ! comment\n" % ", ".join(
+                ".true." if i % 2 else "'str%d'" % i
+                for i in range(n_values // 2)))
+            handle.write(" int_array_%d=%d*0, 3*1, -2,\n" % (
+                i_object, n_values))
+        handle.write("/\n")
+
+
+def load_module(path):
+    """Load a namelist parser module from a file path."""
+    spec = importlib.util.spec_from_file_location("namelist_base", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_parse(module, path):
+    """Return (seconds, groups) of parsing path with module."""
+    start = perf_counter()
+    groups = module.parse([path])
+    return perf_counter() - start, groups
+
+
+def main():
+    """Implement the benchmark."""
+    arg_parser = ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--groups", type=int, default=100)
+    arg_parser.add_argument("--baseline")
+    args = arg_parser.parse_args()
+
+    with NamedTemporaryFile("w", suffix=".nl", delete=False) as handle:
+        write_namelist(handle, args.groups)
+    try:
+        size = os.stat(handle.name).st_size / 1e6
+        print("namelist size: %.1f MB" % size)
+        elapsed, groups = time_parse(metomi.rose.formats.namelist, handle.name)
+        print("current:  %8.3fs (%.2f MB/s)" % (elapsed, size / elapsed))
+        if args.baseline:
+            base_elapsed, base_groups = time_parse(
+                load_module(args.baseline), handle.name)
+            print("baseline: %8.3fs (%.2f MB/s)" % (
+                base_elapsed, size / base_elapsed))
+            print("speed up: %8.2fx" % (base_elapsed / elapsed))
+            if [repr(group) for group in groups] != [
+                    repr(group) for group in base_groups]:
+                raise SystemExit("ERROR: parser outputs differ")
+    finally:
+        os.unlink(handle.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+"""Benchmark the rose_bunch built-in application on many short commands.
+
+Usage:
+    python benchmarks/bench_rose_bunch.py [--commands=N] [--pool-size=N]
+
+Run N sub-second commands through RoseBunchApp.run in a temporary
+directory, and report the elapsed time and throughput. Run it against
+different versions of Rose to compare them.
+"""
+
+from argparse import ArgumentParser
+import os
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from metomi.rose.apps.rose_bunch import RoseBunchApp
+from metomi.rose.config import ConfigNode
+from metomi.rose.popen import RosePopener
+from metomi.rose.reporter import Reporter
+
+
+class _AppRunner(object):
+    """Minimal stand-in for metomi.rose.app_run.AppRunner."""
+
+    def __init__(self):
+        self.event_handler = Reporter(verbosity=0)
+        self.popen = RosePopener(self.event_handler)
+
+    def handle_event(self, *args, **kwargs):
+        """Report an event."""
+        return self.event_handler(*args, **kwargs)
+
+
+class _ConfigTree(object):
+    """Minimal stand-in for metomi.rose.config_tree.ConfigTree."""
+
+    def __init__(self, node):
+        self.node = node
+
+
+def main():
+    """Implement the benchmark."""
+    arg_parser = ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--commands", type=int, default=10000)
+    arg_parser.add_argument("--pool-size", type=int, default=16)
+    arg_parser.add_argument("--command", default="true")
+    arg_parser.add_argument("--incremental", action="store_true")
+    args = arg_parser.parse_args()
+
+    node = ConfigNode()
+    node.set(["bunch", "command-format"], args.command)
+    node.set(["bunch", "command-instances"], str(args.commands))
+    node.set(["bunch", "pool-size"], str(args.pool_size))
+    node.set(
+        ["bunch", "incremental"], str(args.incremental).lower())
+    cwd = os.getcwd()
+    with TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        os.environ.pop("ROSE_TASK_LOG_DIR", None)
+        try:
+            start = perf_counter()
+            RoseBunchApp(manager=None).run(
+                _AppRunner(), _ConfigTree(node), None, [], None, None)
+            elapsed = perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    print("commands: %d, pool-size: %d" % (args.commands, args.pool_size))
+    print("elapsed: %8.3fs (%.1f commands/s)" % (
+        elapsed, args.commands / elapsed))
+
+
+if __name__ == "__main__":
+    main()
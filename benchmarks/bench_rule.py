@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+"""Benchmark metomi.rose.macros.rule on a large metadata set.
+
+Usage:
+    python benchmarks/bench_rule.py [--settings=N] [--runs=N] [--baseline=FILE]
+
+Generate a configuration and metadata in the style of a big UM app, with
+"fail-if", "warn-if" and "range" rules on every setting, and time how long
+it takes to validate the configuration against the rules repeatedly (e.g.
+as the config editor does).
+
+To compare against another version of the module, extract it, e.g.:
+    git show REV:metomi/rose/macros/rule.py >/tmp/rule_base.py
+and pass it with "--baseline=/tmp/rule_base.py". The reports of both
+versions are checked to be identical.
+"""
+
+from argparse import ArgumentParser
+import importlib.util
+from time import perf_counter
+
+from metomi.rose.config import ConfigNode
+import metomi.rose.macros.rule
+import metomi.rose.macros.value
+
+
+RULES = [
+    "this > namelist:nl_%(group)d=var_%(next)d * 2",
+    "this < 0 and namelist:nl_%(group)d=var_%(next)d != 1.5e3",
+    "any(namelist:nl_%(group)d=arr_%(index)d == this)",
+    "len(namelist:nl_%(group)d=arr_%(index)d) > 4",
+    "this == \"'bad'\" or namelist:nl_%(group)d=var_%(next)d %% 7 == 3",
+]
+
+
+def get_config(n_settings, n_per_group=50):
+    """Return (config, meta_config) with n_settings settings with rules."""
+    config = ConfigNode()
+    meta_config = ConfigNode()
+    for i in range(n_settings):
+        group, index = divmod(i, n_per_group)
+        section = "namelist:nl_%d" % group
+        config.set([section, "var_%d" % index], str(i % 17))
+        config.set(
+            [section, "arr_%d" % index],
+            ",".join(str((i + j) % 5) for j in range(index % 4 + 2)))
+        form_dict = {
+            "group": group,
+            "index": index,
+            "next": (index + 1) % n_per_group}
+        meta_config.set(
+            [section + "=var_%d" % index, "fail-if"],
+            RULES[i % len(RULES)] % form_dict)
+        meta_config.set(
+            [section + "=var_%d" % index, "warn-if"],
+            RULES[(i + 1) % len(RULES)] % form_dict)
+        meta_config.set(
+            [section + "=var_%d" % index, "range"],
+            "this != 13 and this < 1e2")
+    return config, meta_config
+
+
+def load_module(path):
+    """Load a rule module from a file path."""
+    spec = importlib.util.spec_from_file_location("rule_base", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_validate(module, config, meta_config, n_runs):
+    """Return (seconds, reports) of validating config n_runs times."""
+    metomi.rose.macros.value.metomi.rose.macros.rule = module
+    reports = []
+    start = perf_counter()
+    for _ in range(n_runs):
+        for checker in [
+                module.FailureRuleChecker(),
+                metomi.rose.macros.value.ValueChecker()]:
+            reports.append(
+                [str(report) for report in checker.validate(
+                    config, meta_config)])
+    return perf_counter() - start, reports
+
+
+def main():
+    """Implement the benchmark."""
+    arg_parser = ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--settings", type=int, default=2000)
+    arg_parser.add_argument("--runs", type=int, default=3)
+    arg_parser.add_argument("--baseline")
+    args = arg_parser.parse_args()
+
+    config, meta_config = get_config(args.settings)
+    print("settings: %d, runs: %d" % (args.settings, args.runs))
+    current = metomi.rose.macros.rule
+    elapsed, reports = time_validate(current, config, meta_config, args.runs)
+    print("current:  %8.3fs" % elapsed)
+    if args.baseline:
+        base_elapsed, base_reports = time_validate(
+            load_module(args.baseline), config, meta_config, args.runs)
+        metomi.rose.macros.value.metomi.rose.macros.rule = current
+        print("baseline: %8.3fs" % base_elapsed)
+        print("speed up: %8.2fx" % (base_elapsed / elapsed))
+        if reports != base_reports:
+            raise SystemExit("ERROR: reports differ")
+
+
+if __name__ == "__main__":
+    main()
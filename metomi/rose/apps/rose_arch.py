@@ -27,7 +27,8 @@ from metomi.rose.app_run import (
     BuiltinApp,
     ConfigValueError,
     CompulsoryConfigValueError)
-from metomi.rose.checksum import get_checksum, get_checksum_func
+from metomi.rose.checksum import (
+    get_checksum, get_checksum_cache, get_checksum_func)
 from metomi.rose.env import env_var_process, UnboundEnvironmentVariableError
 from metomi.rose.popen import RosePopenError
 from metomi.rose.reporter import Event, Reporter
@@ -116,6 +117,9 @@ class RoseArchApp(BuiltinApp):
         finally:
             app_runner.fs_util.chdir(cwd)
             dao.close()
+            checksum_cache = get_checksum_cache()
+            if checksum_cache is not None:
+                checksum_cache.flush()
 
     def _run(self, dao, app_runner, config):
         """Transform and archive suite files.
@@ -215,7 +219,8 @@ class RoseArchApp(BuiltinApp):
             )
         update_check_str = self._get_conf(config, t_node, "update-check")
         try:
-            checksum_func = get_checksum_func(update_check_str)
+            checksum_func = get_checksum_func(
+                update_check_str, cache=get_checksum_cache())
         except ValueError as exc:
             raise RoseArchValueError(
                 target.name,
@@ -274,6 +279,32 @@ class RoseArchApp(BuiltinApp):
                 target.compress_scheme,
                 KeyError(target.compress_scheme)))
             target.status = target.ST_BAD
+        target.compress_mode = self._get_conf(
+            config, t_node, "compress-mode",
+            default=RoseArchTarget.COMPRESS_MODE_COMMAND)
+        if target.compress_mode not in RoseArchTarget.COMPRESS_MODES:
+            app_runner.handle_event(ConfigValueError(
+                [t_key, "compress-mode"],
+                target.compress_mode,
+                KeyError(target.compress_mode)))
+            target.status = target.ST_BAD
+        compress_level_str = self._get_conf(config, t_node, "compress-level")
+        if compress_level_str:
+            try:
+                target.compress_level = int(compress_level_str)
+                if not 1 <= target.compress_level <= 9:
+                    raise ValueError(compress_level_str)
+            except ValueError as exc:
+                target.status = target.ST_BAD
+                app_runner.handle_event(
+                    RoseArchValueError(
+                        target.name,
+                        "compress-level",
+                        compress_level_str,
+                        type(exc).__name__,
+                        exc
+                    )
+                )
         rename_format = self._get_conf(config, t_node, "rename-format")
         if rename_format:
             rename_parser_str = self._get_conf(config, t_node, "rename-parser")
@@ -412,9 +443,14 @@ class RoseArchTarget(object):
     ST_NEW = "+"
     ST_BAD = "!"
     ST_NULL = "0"
+    COMPRESS_MODE_COMMAND = "command"
+    COMPRESS_MODE_STREAM = "stream"
+    COMPRESS_MODES = [COMPRESS_MODE_COMMAND, COMPRESS_MODE_STREAM]
 
     def __init__(self, name):
         self.name = name
+        self.compress_level = None
+        self.compress_mode = self.COMPRESS_MODE_COMMAND
         self.compress_scheme = None
         self.command_format = None
         self.command_rc = 0
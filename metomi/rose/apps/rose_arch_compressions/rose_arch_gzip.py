@@ -20,7 +20,25 @@
 """Compress archive sources in gzip."""
 
 
+from concurrent.futures import ThreadPoolExecutor
 import os
+import zlib
+
+
+def gzip_file(path, path_gz, level):
+    """Compress file at path to a gzip file at path_gz.
+
+    Stream the content in chunks through zlib.
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with open(path, "rb") as handle, open(path_gz, "wb") as handle_gz:
+        while True:
+            data = handle.read(RoseArchGzip.BUFSIZE)
+            if not data:
+                break
+            handle_gz.write(compressor.compress(data))
+        handle_gz.write(compressor.flush())
 
 
 class RoseArchGzip(object):
@@ -28,6 +46,8 @@ class RoseArchGzip(object):
     """Compress archive sources in gzip."""
 
     SCHEMES = ["gz", "gzip"]
+    BUFSIZE = 1024 * 1024
+    LEVEL = 6
 
     def __init__(self, app_runner, *args, **kwargs):
         self.app_runner = app_runner
@@ -37,7 +57,11 @@ class RoseArchGzip(object):
 
         Use work_dir to dump results.
 
+        In "stream" compress mode, compress the sources concurrently in a
+        thread pool. Otherwise, use the "gzip" command on each source.
+
         """
+        items = []  # [(source, work_path_gz), ...]
         for source in target.sources.values():
             if source.path.endswith("." + target.compress_scheme):
                 continue  # assume already done
@@ -45,7 +69,25 @@ class RoseArchGzip(object):
             work_path_gz = os.path.join(work_dir, name_gz)
             self.app_runner.fs_util.makedirs(
                 self.app_runner.fs_util.dirname(work_path_gz))
-            # N.B. Python's gzip is slow
-            command = "gzip -c '%s' >'%s'" % (source.path, work_path_gz)
-            self.app_runner.popen.run_simple(command, shell=True)
+            items.append((source, work_path_gz))
+        if target.compress_mode == target.COMPRESS_MODE_STREAM:
+            level = target.compress_level
+            if level is None:
+                level = self.LEVEL
+            with ThreadPoolExecutor() as executor:
+                for future in [
+                        executor.submit(
+                            gzip_file, source.path, work_path_gz, level)
+                        for source, work_path_gz in items]:
+                    future.result()
+        else:
+            level_opt = ""
+            if target.compress_level is not None:
+                level_opt = "-%d " % target.compress_level
+            for source, work_path_gz in items:
+                # N.B. Python's gzip is slow
+                command = "gzip %s-c '%s' >'%s'" % (
+                    level_opt, source.path, work_path_gz)
+                self.app_runner.popen.run_simple(command, shell=True)
+        for source, work_path_gz in items:
             source.path = work_path_gz
@@ -19,6 +19,7 @@
 # -----------------------------------------------------------------------------
 """Compress archive sources in tar."""
 
+import gzip
 import os
 import tarfile
 from tempfile import mkstemp
@@ -31,6 +32,7 @@ class RoseArchTarGzip(object):
     SCHEMES = ["pax", "pax.gz", "tar", "tar.gz", "tgz"]
     SCHEME_FORMATS = {"pax": tarfile.PAX_FORMAT, "pax.gz": tarfile.PAX_FORMAT}
     GZIP_EXTS = ["pax.gz", "tar.gz", "tgz"]
+    GZIP_LEVEL = 6
 
     def __init__(self, app_runner, *args, **kwargs):
         self.app_runner = app_runner
@@ -40,32 +42,52 @@ class RoseArchTarGzip(object):
 
         Use work_dir to dump results.
 
+        In "stream" compress mode, a TAR-GZIP file is written in a single
+        pass through zlib. Otherwise, the "gzip" command is used on the TAR
+        file.
+
         """
         sources = list(target.sources.values())
         if (len(sources) == 1 and
                 sources[0].path.endswith("." + target.compress_scheme)):
             target.work_source_path = sources[0].path
             return  # Assume that it has been done
-        fdsec, tar_name = mkstemp(suffix=".tar", dir=work_dir)
+        is_gzip = target.compress_scheme in self.GZIP_EXTS
+        is_stream_gzip = (
+            is_gzip and target.compress_mode == target.COMPRESS_MODE_STREAM)
+        suffix = ".tar"
+        if is_stream_gzip:
+            suffix = "." + target.compress_scheme
+        fdsec, tar_name = mkstemp(suffix=suffix, dir=work_dir)
         os.close(fdsec)
         target.work_source_path = tar_name
         scheme_format = self.SCHEME_FORMATS.get(target.compress_scheme,
                                                 tarfile.DEFAULT_FORMAT)
         f_bsize = os.statvfs(work_dir).f_bsize
-        # @TODO This is not very Python3: context managers and tarhandle.add
-        tarhandle = tarfile.open(
-            tar_name, "w", bufsize=f_bsize, format=scheme_format)
-        for source in sources:
-            handle = open(source.path, 'rb')
-            tarinfo = tarhandle.gettarinfo(arcname=source.name, fileobj=handle)
-            tarhandle.addfile(tarinfo, handle)
-        tarhandle.close()
+        if is_stream_gzip:
+            level = target.compress_level
+            if level is None:
+                level = self.GZIP_LEVEL
+            fileobj = gzip.GzipFile(tar_name, "wb", compresslevel=level)
+        else:
+            fileobj = open(tar_name, "wb")
+        with fileobj, tarfile.open(
+                fileobj=fileobj, mode="w", bufsize=f_bsize,
+                format=scheme_format) as tarhandle:
+            for source in sources:
+                with open(source.path, 'rb') as handle:
+                    tarinfo = tarhandle.gettarinfo(
+                        arcname=source.name, fileobj=handle)
+                    tarhandle.addfile(tarinfo, handle)
         # N.B. Python's gzip is slow
-        if target.compress_scheme in self.GZIP_EXTS:
+        if is_gzip and not is_stream_gzip:
             fdsec, gz_name = mkstemp(
                 suffix="." + target.compress_scheme, dir=work_dir)
             os.close(fdsec)
             target.work_source_path = gz_name
-            command = "gzip -c '%s' >'%s'" % (tar_name, gz_name)
+            level_opt = ""
+            if target.compress_level is not None:
+                level_opt = "-%d " % target.compress_level
+            command = "gzip %s-c '%s' >'%s'" % (level_opt, tar_name, gz_name)
             self.app_runner.popen.run_simple(command, shell=True)
             self.app_runner.fs_util.delete(tar_name)
@@ -21,11 +21,12 @@
 """
 
 
+import asyncio
 import itertools
 import os
 import shlex
 import sqlite3
-from time import sleep
+from time import time
 
 from metomi.rose.app_run import (
     BuiltinApp,
@@ -90,12 +91,22 @@ class SummaryEvent(Event):
     KIND = Event.KIND_OUT
 
     def __str__(self):
-        n_ok, n_fail, n_skip, n_notconsidered = self.args
+        n_ok, n_fail, n_skip, n_notconsidered = self.args[0:4]
         total = n_ok + n_fail + n_skip + n_notconsidered
         msg_template = ("BUNCH TASK TOTALS:\n" +
                         "OK: %s\nFAIL: %s\nSKIP: %s\nNOT CONSIDERED: %s\n" +
                         "TOTAL: %s")
-        return msg_template % (n_ok, n_fail, n_skip, n_notconsidered, total)
+        msg = msg_template % (n_ok, n_fail, n_skip, n_notconsidered, total)
+        if len(self.args) > 4:
+            elapsed, durations = self.args[4:6]
+            msg += "\nELAPSED: %.3fs" % elapsed
+            if durations and elapsed:
+                msg += (
+                    "\nTHROUGHPUT: %.3f commands/s" % (
+                        len(durations) / elapsed) +
+                    "\nDURATION (MEAN/MAX): %.3fs/%.3fs" % (
+                        sum(durations) / len(durations), max(durations)))
+        return msg
 
 
 class NotRunEvent(Event):
@@ -114,7 +125,6 @@ class RoseBunchApp(BuiltinApp):
     SCHEME = "rose_bunch"
     ARGS_SECTION = "bunch-args"
     BUNCH_SECTION = "bunch"
-    SLEEP_DURATION = 0.5
     TYPE_ABORT_ON_FAIL = "abort"
     TYPE_CONTINUE_ON_FAIL = "continue"
     FAIL_MODE_TYPES = [TYPE_CONTINUE_ON_FAIL, TYPE_ABORT_ON_FAIL]
@@ -289,37 +299,55 @@ class RoseBunchApp(BuiltinApp):
             commands[name] = RoseBunchCmd(name, self.command, argsdict,
                                           self.isformatted)
 
-        procs = {}
         if 'ROSE_TASK_LOG_DIR' in os.environ:
             log_format = os.path.join(os.environ['ROSE_TASK_LOG_DIR'], "%s")
         else:
             log_format = os.path.join(os.getcwd(), "%s")
 
-        failed = {}
+        time_start = time()
+        loop = asyncio.get_event_loop()
+        run_ok, run_fail, run_skip, abort, durations = (
+            loop.run_until_complete(self._run_pool(
+                app_runner, commands, max_procs, log_format)))
+        time_end = time()
+
+        if abort and commands:
+            for key in self.invocation_names:
+                notrun += 1
+                cmd = commands.pop(key).get_command()
+                app_runner.handle_event(NotRunEvent(key, cmd),
+                                        prefix=self.PREFIX_NOTRUN)
+
+        if self.dao:
+            self.dao.close()
+
+        # Report summary data in job.out file
+        app_runner.handle_event(SummaryEvent(
+                                run_ok, run_fail, run_skip, notrun,
+                                time_end - time_start, durations))
+
+        if run_fail:
+            return 1
+        else:
+            return 0
+
+    async def _run_pool(self, app_runner, commands, max_procs, log_format):
+        """Run commands, keeping up to max_procs of them running at once.
+
+        A slot in the pool is refilled as soon as a command exits.
+
+        Return (run_ok, run_fail, run_skip, abort, durations), where
+        durations is a list of the run times of the commands.
+
+        """
+        run_ok = 0
+        run_fail = 0
+        run_skip = 0
         abort = False
+        durations = []
+        procs = {}  # {wait_task: (key, proc, handles, time_started), ...}
 
         while procs or (commands and not abort):
-            for key, proc in list(procs.items()):
-                if proc.poll() is not None:
-                    procs.pop(key)
-                    if proc.returncode:
-                        failed[key] = proc.returncode
-                        run_fail += 1
-                        app_runner.handle_event(RosePopenError(str(key),
-                                                proc.returncode,
-                                                None, None))
-                        if self.dao:
-                            self.dao.update_command_state(key, self.dao.S_FAIL)
-                        if self.fail_mode == self.TYPE_ABORT_ON_FAIL:
-                            abort = True
-                            app_runner.handle_event(AbortEvent())
-                    else:
-                        run_ok += 1
-                        app_runner.handle_event(SucceededEvent(key),
-                                                prefix=self.PREFIX_OK)
-                        if self.dao:
-                            self.dao.update_command_state(key, self.dao.S_PASS)
-
             while len(procs) < max_procs and commands and not abort:
                 key = self.invocation_names[0]
                 command = commands.pop(key)
@@ -343,33 +371,48 @@ class RoseBunchApp(BuiltinApp):
                         self.dao.add_command(key)
 
                 app_runner.handle_event(LaunchEvent(key, cmd))
-                procs[key] = app_runner.popen.run_bg(
+                handles = (open(cmd_stdout, 'w'), open(cmd_stderr, 'w'))
+                proc = await app_runner.popen.run_bg_async(
                     cmd,
                     shell=True,
-                    stdout=open(cmd_stdout, 'w'),
-                    stderr=open(cmd_stderr, 'w'),
+                    stdout=handles[0],
+                    stderr=handles[1],
                     env=bunch_environ)
+                procs[asyncio.ensure_future(proc.wait())] = (
+                    key, proc, handles, time())
+
+            if not procs:
+                continue
+            timeout = None
+            if self.dao:
+                timeout = self.dao.FLUSH_DELAY
+            done, _ = await asyncio.wait(
+                procs, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if self.dao:
+                self.dao.flush(force=False)
+            for task in done:
+                key, proc, handles, time_started = procs.pop(task)
+                durations.append(time() - time_started)
+                for handle in handles:
+                    handle.close()
+                if proc.returncode:
+                    run_fail += 1
+                    app_runner.handle_event(RosePopenError(str(key),
+                                            proc.returncode,
+                                            None, None))
+                    if self.dao:
+                        self.dao.update_command_state(key, self.dao.S_FAIL)
+                    if self.fail_mode == self.TYPE_ABORT_ON_FAIL:
+                        abort = True
+                        app_runner.handle_event(AbortEvent())
+                else:
+                    run_ok += 1
+                    app_runner.handle_event(SucceededEvent(key),
+                                            prefix=self.PREFIX_OK)
+                    if self.dao:
+                        self.dao.update_command_state(key, self.dao.S_PASS)
 
-            sleep(self.SLEEP_DURATION)
-
-        if abort and commands:
-            for key in self.invocation_names:
-                notrun += 1
-                cmd = commands.pop(key).get_command()
-                app_runner.handle_event(NotRunEvent(key, cmd),
-                                        prefix=self.PREFIX_NOTRUN)
-
-        if self.dao:
-            self.dao.close()
-
-        # Report summary data in job.out file
-        app_runner.handle_event(SummaryEvent(
-                                run_ok, run_fail, run_skip, notrun))
-
-        if failed:
-            return 1
-        else:
-            return 0
+        return run_ok, run_fail, run_skip, abort, durations
 
 
 class RoseBunchCmd(object):
@@ -407,7 +450,14 @@ class RoseBunchCmd(object):
 
 
 class RoseBunchDAO(object):
-    """Database object for rose_bunch"""
+    """Database object for rose_bunch
+
+    Command states are buffered in memory, and written to the database in
+    a single transaction when FLUSH_SIZE states are pending or FLUSH_DELAY
+    seconds have passed since the last write, whichever is sooner. A crash
+    will therefore lose at most the states of the last FLUSH_DELAY seconds.
+
+    """
 
     TABLE_COMMANDS = "commands"
     TABLE_CONFIG = "config"
@@ -418,11 +468,16 @@ class RoseBunchDAO(object):
 
     CONN_TIMEOUT = 0.1
     FILE_NAME = ".rose-bunch.db"
+    FLUSH_DELAY = 5.0
+    FLUSH_SIZE = 100
 
     def __init__(self, config):
         self.conn = None
         self.new_run = True
         self.db_file_name = os.path.abspath(self.FILE_NAME)
+        self.pending_states = {}  # {name: state, ...}
+        self.succeeded = set()
+        self.time_flushed = time()
         self.connect()
         self.create_tables()
 
@@ -431,11 +486,17 @@ class RoseBunchDAO(object):
         elif not self.same_prev_config(config):
             self.clear_command_states()
             self.record_config(config, clear_db=True)
+        self.load_succeeded()
 
     def connect(self):
         """Connect to the database."""
         if self.conn is None:
             self.conn = sqlite3.connect(self.db_file_name, self.CONN_TIMEOUT)
+            try:
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.Error:
+                pass  # e.g. file system does not support WAL
         return
 
     def create_tables(self):
@@ -467,43 +528,69 @@ class RoseBunchDAO(object):
         self.conn.commit()
         return
 
+    def load_succeeded(self):
+        """Load the names of commands that reached the "pass" state"""
+        s_stmt = ("SELECT name FROM " + self.TABLE_COMMANDS +
+                  " WHERE status==?")
+        self.succeeded = set(
+            str(row[0]) for row in self.conn.execute(s_stmt, [self.S_PASS]))
+
     def add_command(self, name):
         """Add a command to the commands table"""
-        i_stmt = ("INSERT OR REPLACE INTO " + self.TABLE_COMMANDS +
-                  " VALUES (?, ?)")
-        self.conn.execute(i_stmt, [name, self.S_STARTED])
-        self.conn.commit()
-        return
+        self.set_command_state(name, self.S_STARTED)
 
     def clear_command_states(self):
         """Deletes all recorded command entries"""
         d_stmt = "DELETE FROM " + self.TABLE_COMMANDS
         self.conn.execute(d_stmt)
         self.conn.commit()
+        self.pending_states.clear()
+        self.succeeded.clear()
         return
 
     def close(self):
         """Close database connection"""
         if self.conn is not None:
+            self.flush()
             self.conn.close()
             self.conn = None
 
     def update_command_state(self, name, state):
         """Update command state in CMDS table"""
-        u_stmt = ("UPDATE " + self.TABLE_COMMANDS +
-                  " SET status=? WHERE name==?")
-        self.conn.execute(u_stmt, [state, name])
-        self.conn.commit()
-        return
+        self.set_command_state(name, state)
+
+    def set_command_state(self, name, state):
+        """Buffer a command state, and flush states if due."""
+        name = str(name)
+        self.pending_states[name] = state
+        if state == self.S_PASS:
+            self.succeeded.add(name)
+        else:
+            self.succeeded.discard(name)
+        self.flush(force=False)
+
+    def flush(self, force=True):
+        """Write buffered command states to the database.
+
+        If force is False, only write if the buffer is full or if
+        FLUSH_DELAY seconds have passed since the last write.
+
+        """
+        if not self.pending_states:
+            return
+        if (not force and len(self.pending_states) < self.FLUSH_SIZE and
+                time() - self.time_flushed < self.FLUSH_DELAY):
+            return
+        i_stmt = ("INSERT OR REPLACE INTO " + self.TABLE_COMMANDS +
+                  " VALUES (?, ?)")
+        with self.conn:
+            self.conn.executemany(i_stmt, list(self.pending_states.items()))
+        self.pending_states.clear()
+        self.time_flushed = time()
 
     def check_has_succeeded(self, name):
         """See if a named command reached the "pass" state"""
-        s_stmt = ("SELECT * FROM " + self.TABLE_COMMANDS +
-                  " WHERE name==? AND status==?")
-        s_stmt_args = [name, self.S_PASS]
-        if self.conn.execute(s_stmt, s_stmt_args).fetchone():
-            return True
-        return False
+        return str(name) in self.succeeded
 
     @staticmethod
     def flatten_config(config):
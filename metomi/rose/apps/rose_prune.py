@@ -19,6 +19,7 @@
 # ----------------------------------------------------------------------------
 """Builtin application: rose_prune: suite housekeeping application."""
 
+import asyncio
 import os
 from random import shuffle
 from metomi.rose.app_run import BuiltinApp, ConfigValueError
@@ -27,15 +28,29 @@ from metomi.rose.env import env_var_process, UnboundEnvironmentVariableError
 from metomi.rose.fs_util import FileSystemEvent
 from metomi.rose.host_select import HostSelector
 from metomi.rose.popen import RosePopenError
+from metomi.rose.reporter import Event
 import shlex
 
 
+class SharedFileSystemSkipEvent(Event):
+
+    """Event raised when a host is skipped for sharing a file system."""
+
+    LEVEL = Event.V
+
+    def __str__(self):
+        return "%s: file system pruned via another host, skipped" % (
+            self.args[0])
+
+
 class RosePruneApp(BuiltinApp):
 
     """Prune files and directories generated by suite tasks."""
 
     SCHEME = "rose_prune"
     SECTION = "prune"
+    MARKER_BASE = ".rose-prune-%s"
+    MAX_PROCS = 16
 
     def run(self, app_runner, conf_tree, opts, args, uuid, work_files):
         """Suite housekeeping application.
@@ -95,44 +110,114 @@ class RosePruneApp(BuiltinApp):
         # between job hosts who share a file system.
         shuffle(hosts)
         suite_dir_rel = suite_engine_proc.get_suite_dir_rel(suite_name)
-        form_dict = {"d": suite_dir_rel, "g": " ".join(globs)}
-        sh_cmd_head = r"set -e; cd %(d)s; " % form_dict
+        suite_dir = suite_engine_proc.get_suite_dir(suite_name)
+        # Hosts sharing a file system are deduplicated using a marker file in
+        # the suite directory. The first host to create the marker file
+        # prunes the file system, the others skip. The suite host creates its
+        # marker file before any job hosts are contacted, and keeps it until
+        # all hosts have finished, so job hosts sharing the suite host's file
+        # system always skip.
+        # N.B. A job host removes its marker file when its command exits. The
+        # deduplication of job hosts sharing a file system other than the
+        # suite host's therefore assumes that their commands run concurrently
+        # (i.e. there are no more than MAX_PROCS hosts, and pruning is not
+        # too quick). Otherwise, a later host prunes the file system again.
+        # This is harmless, as the paths are already removed, just wasteful.
+        marker = self.MARKER_BASE % uuid
+        marker_path = os.path.join(suite_dir, marker)
+        try:
+            open(marker_path, "x").close()
+        except OSError:
+            marker_path = None
+        form_dict = {"d": suite_dir_rel, "g": " ".join(globs), "m": marker}
+        sh_cmd_head = (
+            r"set -e; cd %(d)s; " +
+            r"(set -C; : >%(m)s) 2>/dev/null || { echo %(m)s; exit 0; }; " +
+            r'trap "rm -f %(m)s" EXIT; ') % form_dict
         sh_cmd = (
             r"set +e; ls -d %(g)s; " +
             r"set -e; rm -fr %(g)s") % form_dict
-        cwd = os.getcwd()
         host_selector = HostSelector(
             app_runner.event_handler, app_runner.popen)
-        for host in hosts + [host_selector.get_local_host()]:
-            sdir = None
-            try:
-                if host_selector.is_local_host(host):
-                    sdir = suite_engine_proc.get_suite_dir(suite_name)
-                    app_runner.fs_util.chdir(sdir)
-                    out = app_runner.popen.run_ok(
-                        "bash", "-O", "extglob", "-c", sh_cmd)[0]
-                else:
-                    cmd = app_runner.popen.get_cmd(
-                        "ssh", host,
-                        "bash -O extglob -c '" + sh_cmd_head + sh_cmd + "'")
-                    out = app_runner.popen.run_ok(*cmd)[0]
-            except RosePopenError as exc:
+        host_cmds = []
+        for host in hosts:
+            if not host_selector.is_local_host(host):
+                host_cmds.append((host, app_runner.popen.get_cmd(
+                    "ssh", host,
+                    "bash -O extglob -c '" + sh_cmd_head + sh_cmd + "'")))
+        host_cmds.append((
+            host_selector.get_local_host(),
+            ["bash", "-O", "extglob", "-c", sh_cmd]))
+        try:
+            asyncio.get_event_loop().run_until_complete(self._run_pool(
+                app_runner, host_cmds, suite_dir, suite_dir_rel, marker))
+        finally:
+            if marker_path:
+                try:
+                    os.unlink(marker_path)
+                except OSError:
+                    pass
+        return
+
+    async def _run_pool(self, app_runner, host_cmds, suite_dir, suite_dir_rel,
+                        marker):
+        """Run the prune command on each host, MAX_PROCS at a time.
+
+        host_cmds is a list of (host, command). The last item is the command
+        to run in suite_dir on the suite host.
+
+        Report the results of each job host as they arrive. Report the results
+        of the suite host last.
+
+        """
+        semaphore = asyncio.Semaphore(self.MAX_PROCS)
+        tasks = []
+        for i, (host, cmd) in enumerate(host_cmds):
+            cwd = None
+            if i == len(host_cmds) - 1:
+                cwd = suite_dir
+            tasks.append(asyncio.ensure_future(self._run_prune_cmd(
+                semaphore, app_runner, host, cmd, cwd)))
+        for future in asyncio.as_completed(tasks[:-1]):
+            host, out, exc = await future
+            if exc is not None:
                 app_runner.handle_event(exc)
+            elif out.splitlines()[0:1] == [marker.encode()]:
+                app_runner.handle_event(SharedFileSystemSkipEvent(host))
             else:
-                if sdir is None:
-                    event = FileSystemEvent(FileSystemEvent.CHDIR,
-                                            host + ":" + suite_dir_rel)
-                    app_runner.handle_event(event)
+                app_runner.handle_event(FileSystemEvent(
+                    FileSystemEvent.CHDIR, host + ":" + suite_dir_rel))
                 for line in sorted(out.splitlines()):
-                    if not host_selector.is_local_host(host):
-                        line = host + ":" + line
-                    event = FileSystemEvent(
-                        FileSystemEvent.DELETE, line.decode())
-                    app_runner.handle_event(event)
-            finally:
-                if sdir:
-                    app_runner.fs_util.chdir(cwd)
-        return
+                    app_runner.handle_event(FileSystemEvent(
+                        FileSystemEvent.DELETE, host + ":" + line.decode()))
+        host, out, exc = await tasks[-1]
+        if exc is not None:
+            app_runner.handle_event(exc)
+        else:
+            cwd = os.getcwd()
+            if cwd != suite_dir:
+                app_runner.handle_event(FileSystemEvent(
+                    FileSystemEvent.CHDIR, suite_dir + "/"))
+            for line in sorted(out.splitlines()):
+                app_runner.handle_event(FileSystemEvent(
+                    FileSystemEvent.DELETE, line.decode()))
+            if cwd != suite_dir:
+                app_runner.handle_event(FileSystemEvent(
+                    FileSystemEvent.CHDIR, cwd + "/"))
+
+    @staticmethod
+    async def _run_prune_cmd(semaphore, app_runner, host, cmd, cwd):
+        """Run the prune command on a host, within a slot of semaphore.
+
+        Return (host, out, exc), where exc is a RosePopenError on failure.
+
+        """
+        async with semaphore:
+            try:
+                out = (await app_runner.popen.run_ok_async(*cmd, cwd=cwd))[0]
+            except RosePopenError as exc:
+                return host, None, exc
+            return host, out, None
 
     def _get_conf(self, app_runner, conf_tree, key, max_args=0):
         """Get a list of cycles from a configuration setting.
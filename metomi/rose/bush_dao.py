@@ -19,12 +19,17 @@
 # -----------------------------------------------------------------------------
 """Rose Bush: data access to cylc suite runtime databases."""
 
+from collections import OrderedDict
 from fnmatch import fnmatch
 from glob import glob
 import os
 import re
 import tarfile
+from threading import RLock
+from time import time
 
+from metomi.rose.checksum import ChecksumCache
+from metomi.rose.indexed_tar import extract, load_index
 from metomi.rose.suite_engine_procs.cylc import CylcProcessor, CylcSuiteDAO
 
 
@@ -33,6 +38,8 @@ class RoseBushDAO(object):
     """Rose Bush: data access to cylc suite runtime databases."""
 
     CYCLE_ORDERS = {"time_desc": " DESC", "time_asc": " ASC"}
+    DB_CACHE_SIZE = 1000  # Maximum number of cached results per database
+    DB_POOL_SIZE = 64  # Maximum number of open database connections
     JOB_ORDERS = {
         "time_desc": "time DESC, submit_num DESC, name DESC, cycle DESC",
         "time_asc": "time ASC, submit_num ASC, name ASC, cycle ASC",
@@ -109,7 +116,11 @@ class RoseBushDAO(object):
         "succeeded", "failed", "retrying")
 
     def __init__(self):
-        self.daos = {}
+        self.daos = OrderedDict()
+        self.db_caches = {}
+        self.db_lock = RLock()
+        self.db_signatures = {}
+        self.cycles_summaries = {}
 
     def get_suite_broadcast_states(self, user_name, suite_name):
         """Return broadcast states of a suite.
@@ -362,22 +373,20 @@ class RoseBushDAO(object):
 
         for cycle in relevant_targzip_log_cycles:
             path = os.path.join("log", "job-%s.tar.gz" % cycle)
-            tar = tarfile.open(os.path.join(user_suite_dir, path), "r:gz")
-            for member in tar.getmembers():
-                # member.name expected to be "job/cycle/task/submit_num/*"
-                if not member.isfile():
-                    continue
+            for member_name, size, mtime in self._get_job_logs_archive_members(
+                    os.path.join(user_suite_dir, path)):
+                # member_name expected to be "job/cycle/task/submit_num/*"
                 try:
                     cycle_str, name, submit_num_str = (
-                        member.name.split("/", 4)[1:4])
+                        member_name.split("/", 4)[1:4])
                     entry = entry_of[(cycle_str, name, int(submit_num_str))]
                 except (KeyError, ValueError):
                     continue
-                entry["logs"][os.path.basename(member.name)] = {
+                entry["logs"][os.path.basename(member_name)] = {
                     "path": path,
-                    "path_in_tar": member.name,
-                    "mtime": int(member.mtime),  # too precise otherwise
-                    "size": member.size,
+                    "path_in_tar": member_name,
+                    "mtime": int(mtime),  # too precise otherwise
+                    "size": size,
                     "exists": True,
                     "seq_key": None}
 
@@ -411,6 +420,39 @@ class RoseBushDAO(object):
                 if log_dict["seq_key"] not in entry["seq_logs_indexes"]:
                     log_dict["seq_key"] = None
 
+    @staticmethod
+    def _get_job_logs_archive_members(archive_path):
+        """Return [(name, size, mtime), ...] of files in a job logs archive.
+
+        Use the index of the archive if there is one. Otherwise, read the
+        whole archive.
+
+        """
+        index = load_index(archive_path)
+        if index is not None:
+            return [(name, size, mtime) for name, size, mtime, _, _ in index]
+        with tarfile.open(archive_path, "r:gz") as tar:
+            return [
+                (member.name, member.size, member.mtime)
+                for member in tar.getmembers() if member.isfile()]
+
+    def get_job_log_from_archive(
+            self, user_name, suite_name, path, path_in_tar):
+        """Return the content of a job log file in a job logs archive.
+
+        path -- The path of the archive relative to the suite directory.
+        path_in_tar -- The name of the job log file in the archive.
+
+        Raise KeyError if the job log file is not in the archive.
+
+        """
+        prefix = "~"
+        if user_name:
+            prefix += user_name
+        archive_path = os.path.expanduser(os.path.join(
+            prefix, self.get_suite_dir_rel(suite_name), path))
+        return extract(archive_path, path_in_tar)
+
     def get_suite_logs_info(self, user_name, suite_name):
         """Return the information of the suite logs.
 
@@ -493,12 +535,12 @@ class RoseBushDAO(object):
         and of_n_entries is the total number of entries.
 
         """
+        with self.db_lock:
+            cycles = self._get_suite_cycles_summary_map(user_name, suite_name)
         of_n_entries = 0
-        stmt = ("SELECT COUNT(DISTINCT cycle) FROM task_states WHERE " +
-                "submit_num > 0")
-        for row in self._db_exec(user_name, suite_name, stmt):
-            of_n_entries = row[0]
-            break
+        for item in cycles.values():
+            if item[4]:
+                of_n_entries += 1
         if not of_n_entries:
             return ([], 0)
 
@@ -523,34 +565,28 @@ class RoseBushDAO(object):
         except OSError:
             pass
 
-        states_stmt = {}
-        for key, names in self.TASK_STATUS_GROUPS.items():
-            states_stmt[key] = " OR ".join(
-                ["status=='%s'" % (name) for name in names])
-        stmt = (
-            "SELECT" +
-            " cycle," +
-            " max(time_updated)," +
-            " sum(" + states_stmt["active"] + ") AS n_active," +
-            " sum(" + states_stmt["success"] + ") AS n_success,"
-            " sum(" + states_stmt["fail"] + ") AS n_fail"
-            " FROM task_states" +
-            " GROUP BY cycle")
         if integer_mode:
-            stmt += " ORDER BY cast(cycle as number)"
+            def get_sort_key(cycle):
+                """Sort cycles as numbers."""
+                try:
+                    return float(cycle)
+                except ValueError:
+                    return 0
         else:
-            stmt += " ORDER BY cycle"
-        stmt += self.CYCLE_ORDERS.get(order, self.CYCLE_ORDERS["time_desc"])
-        stmt_args = []
+            get_sort_key = None
+        cycle_list = sorted(
+            cycles, key=get_sort_key,
+            reverse=(order != "time_asc"))
         if limit:
-            stmt += " LIMIT ? OFFSET ?"
-            stmt_args += [limit, offset]
-        entry_of = {}
+            cycle_list = cycle_list[offset:offset + limit]
         entries = []
-        for row in self._db_exec(user_name, suite_name, stmt, stmt_args):
-            cycle, max_time_updated, n_active, n_success, n_fail = row
+        for cycle in cycle_list:
+            (
+                max_time_updated, n_active, n_success, n_fail, _,
+                n_job_active, n_job_success, n_job_fail
+            ) = cycles[cycle]
             if n_active or n_success or n_fail:
-                entry_of[cycle] = {
+                entries.append({
                     "cycle": cycle,
                     "has_log_job_tar_gz": cycle in targzip_log_cycles,
                     "max_time_updated": max_time_updated,
@@ -558,18 +594,75 @@ class RoseBushDAO(object):
                         "active": n_active,
                         "success": n_success,
                         "fail": n_fail,
-                        "job_active": 0,
-                        "job_success": 0,
-                        "job_fail": 0,
+                        "job_active": n_job_active,
+                        "job_success": n_job_success,
+                        "job_fail": n_job_fail,
                     },
-                }
-                entries.append(entry_of[cycle])
+                })
+        self._db_close(user_name, suite_name)
+
+        return entries, of_n_entries
+
+    def _get_suite_cycles_summary_map(self, user_name, suite_name):
+        """Helper for "get_suite_cycles_summary".
+
+        Return a dict {cycle: [max_time_updated, n_active, n_success, n_fail,
+        n_submitted, n_job_active, n_job_success, n_job_fail], ...} for all
+        cycles in the suite database.
+
+        The summary is kept between calls. If the database has changed, only
+        the cycles with tasks updated since the last call are summarised
+        again, unless rows have been removed from the "task_states" table.
+
+        """
+        key = (user_name, suite_name)
+        self._db_init(user_name, suite_name)
+        signature = self.db_signatures[key]
+        summary = self.cycles_summaries.get(key)
+        if summary is not None and summary["signature"] == signature:
+            return summary["cycles"]
+        n_rows = 0
+        for row in self._db_exec(
+                user_name, suite_name, "SELECT COUNT(*) FROM task_states"):
+            n_rows = row[0]
+        time_updated = None
+        for row in self._db_exec(
+                user_name, suite_name,
+                "SELECT max(time_updated) FROM task_states"):
+            time_updated = row[0]
+        if summary is None or n_rows < summary["n_rows"]:
+            summary = {"cycles": {}, "time_updated": None}
+        # Summarise cycles with tasks updated at or after the last update
+        # time, as the time stamps are not precise.
+        where_expr = ""
+        where_args = []
+        if summary["time_updated"] is not None:
+            where_expr = (
+                " WHERE cycle IN (SELECT DISTINCT cycle FROM task_states" +
+                " WHERE time_updated >= ?)")
+            where_args.append(summary["time_updated"])
+        states_stmt = {}
+        for key_, names in self.TASK_STATUS_GROUPS.items():
+            states_stmt[key_] = " OR ".join(
+                ["status=='%s'" % (name) for name in names])
+        stmt = (
+            "SELECT" +
+            " cycle," +
+            " max(time_updated)," +
+            " sum(" + states_stmt["active"] + ") AS n_active," +
+            " sum(" + states_stmt["success"] + ") AS n_success,"
+            " sum(" + states_stmt["fail"] + ") AS n_fail,"
+            " sum(submit_num > 0) AS n_submitted"
+            " FROM task_states" +
+            where_expr +
+            " GROUP BY cycle")
+        cycles = dict(summary["cycles"])
+        for row in self._db_exec(user_name, suite_name, stmt, where_args):
+            cycles[row[0]] = list(row[1:]) + [0, 0, 0]
 
         # Check if "task_jobs" table is available or not.
         # Note: A single query with a JOIN is probably a more elegant solution.
         # However, timing tests suggest that it is cheaper with 2 queries.
-        # This 2nd query may return more results than is necessary, but should
-        # be a very cheap query as it does not have to do a lot of work.
         if self._db_has_table(user_name, suite_name, "task_jobs"):
             stmt = (
                 "SELECT cycle," +
@@ -579,7 +672,9 @@ class RoseBushDAO(object):
                 ") AS n_job_success," +
                 " sum(" + self.JOB_STATUS_COMBOS["submission-failed,failed"] +
                 ") AS n_job_fail" +
-                " FROM task_jobs GROUP BY cycle")
+                " FROM task_jobs" +
+                where_expr +
+                " GROUP BY cycle")
         else:
             fail_events_stmt = " OR ".join(
                 ["event=='%s'" % (name)
@@ -587,22 +682,18 @@ class RoseBushDAO(object):
             stmt = (
                 "SELECT cycle," +
                 " sum(" + fail_events_stmt + ") AS n_job_fail" +
-                " FROM task_events GROUP BY cycle")
-        for cycle, n_job_active, n_job_success, n_job_fail in self._db_exec(
-                user_name, suite_name, stmt):
-            try:
-                entry_of[cycle]["n_states"]["job_active"] = n_job_active
-                entry_of[cycle]["n_states"]["job_success"] = n_job_success
-                entry_of[cycle]["n_states"]["job_fail"] = n_job_fail
-            except KeyError:
-                pass
-            else:
-                del entry_of[cycle]
-                if not entry_of:
-                    break
-        self._db_close(user_name, suite_name)
-
-        return entries, of_n_entries
+                " FROM task_events" +
+                where_expr +
+                " GROUP BY cycle")
+        for row in self._db_exec(user_name, suite_name, stmt, where_args):
+            if row[0] in cycles:
+                cycles[row[0]][-len(row) + 1:] = row[1:]
+        self.cycles_summaries[key] = {
+            "cycles": cycles,
+            "n_rows": n_rows,
+            "signature": signature,
+            "time_updated": time_updated}
+        return cycles
 
     def get_suite_state_summary(self, user_name, suite_name):
         """Return a the state summary of a user's suite.
@@ -663,34 +754,106 @@ class RoseBushDAO(object):
         return CylcProcessor.parse_job_log_rel_path(f_name)
 
     def _db_close(self, user_name, suite_name):
-        """Close a named database connection."""
-        key = (user_name, suite_name)
-        if self.daos.get(key) is not None:
-            self.daos[key].close()
+        """Release a named database connection.
+
+        The connection is kept open in a pool of up to DB_POOL_SIZE
+        connections, for use by subsequent queries.
+
+        """
+        with self.db_lock:
+            while len(self.daos) > self.DB_POOL_SIZE:
+                key, dao = self.daos.popitem(last=False)
+                dao.close()
+                for dict_ in (
+                        self.db_caches, self.db_signatures,
+                        self.cycles_summaries):
+                    dict_.pop(key, None)
 
     def _db_exec(self, user_name, suite_name, stmt, stmt_args=None):
-        """Execute a query on a named database connection."""
-        daos = self._db_init(user_name, suite_name)
-        return daos.execute(stmt, stmt_args)
+        """Execute a query on a named database connection.
+
+        Return a list of result rows. Results are cached until the database
+        file changes.
+
+        """
+        if stmt_args is None:
+            stmt_args = []
+        cache_key = (stmt, tuple(stmt_args))
+        with self.db_lock:
+            dao = self._db_init(user_name, suite_name)
+            cache = self.db_caches[(user_name, suite_name)]
+            if cache_key not in cache:
+                if len(cache) >= self.DB_CACHE_SIZE:
+                    cache.clear()
+                cache[cache_key] = list(dao.execute(stmt, stmt_args))
+            return cache[cache_key]
 
     def _db_has_table(self, user_name, suite_name, table_name):
         """Return True if table_name exists in the suite database."""
-        cursor = self._db_exec(
+        return bool(self._db_exec(
             user_name, suite_name,
-            "SELECT name FROM sqlite_master WHERE name==?", [table_name])
-        return cursor.fetchone() is not None
+            "SELECT name FROM sqlite_master WHERE name==?", [table_name]))
 
     def _db_init(self, user_name, suite_name):
-        """Initialise a named database connection."""
+        """Initialise a named database connection.
+
+        If the database file has changed since the last call, clear the
+        cached query results. If the database file has been replaced,
+        reconnect.
+
+        """
         key = (user_name, suite_name)
-        if key not in self.daos:
-            prefix = "~"
-            if user_name:
-                prefix += user_name
-            for name in [os.path.join("log", "db"), "cylc-suite.db"]:
-                db_f_name = os.path.expanduser(os.path.join(
-                    prefix, self.get_suite_dir_rel(suite_name, name)))
-                self.daos[key] = CylcSuiteDAO(db_f_name)
-                if os.path.exists(db_f_name):
-                    break
-        return self.daos[key]
+        with self.db_lock:
+            if key not in self.daos:
+                prefix = "~"
+                if user_name:
+                    prefix += user_name
+                for name in [os.path.join("log", "db"), "cylc-suite.db"]:
+                    db_f_name = os.path.expanduser(os.path.join(
+                        prefix, self.get_suite_dir_rel(suite_name, name)))
+                    self.daos[key] = CylcSuiteDAO(db_f_name, read_only=True)
+                    if os.path.exists(db_f_name):
+                        break
+            self.daos.move_to_end(key)
+            dao = self.daos[key]
+            signature = self._db_get_signature(dao.db_f_name)
+            old_signature = self.db_signatures.get(key)
+            if signature != old_signature:
+                if (old_signature is None or signature is None or
+                        old_signature[0][0] != signature[0][0]):
+                    dao.close()
+                self.db_caches[key] = {}
+                self.db_signatures[key] = signature
+            return dao
+
+    @staticmethod
+    def _db_get_signature(db_f_name):
+        """Return a tuple that changes when a database file is modified.
+
+        Use the inode, modified time and size of the database file and its
+        write-ahead log, if any. Return None if the database file does not
+        exist.
+
+        A file modified within the granularity of its modified time may be
+        modified again without changing its size or modified time, e.g. as
+        SQLite reuses the write-ahead log after a checkpoint. If either file
+        was modified within ChecksumCache.MIN_MTIME_AGE seconds, add an item
+        that does not compare equal to anything, so cached results are not
+        used.
+
+        """
+        signature = []
+        recent_mtime_ns = (time() - ChecksumCache.MIN_MTIME_AGE) * 1e9
+        for f_name in [db_f_name, db_f_name + "-wal"]:
+            try:
+                stat = os.stat(f_name)
+            except OSError:
+                if not signature:
+                    return None
+                signature.append(None)
+            else:
+                signature.append(
+                    (stat.st_ino, stat.st_mtime_ns, stat.st_size))
+                if stat.st_mtime_ns > recent_mtime_ns:
+                    signature.append(object())
+        return tuple(signature)
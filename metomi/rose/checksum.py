@@ -20,22 +20,30 @@
 """Calculates the MD5 checksum for a file or files in a directory."""
 
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import errno
 import hashlib
 import inspect
 import os
+import sqlite3
+from threading import Lock
+from time import time
 
 from metomi.rose.resource import ResourceLocator
 
 
 _DEFAULT_DEFAULT_KEY = "md5"
 _DEFAULT_KEY = None
+_DEFAULT_CACHE = None
+_DEFAULT_N_WORKERS = None
 _HASH_LENGTHS = None
+_N_ITEMS_PER_WORKER = 4
 
 MTIME_AND_SIZE = "mtime+size"
 
 
-def get_checksum(name, checksum_func=None):
+def get_checksum(name, checksum_func=None, n_workers=None):
     """
     Calculate "checksum" of content in a file or directory called "name".
 
@@ -44,6 +52,10 @@ def get_checksum(name, checksum_func=None):
 
         checksum_str = checksum_func(source_str)
 
+    If "n_workers" is greater than 1, the files in a directory are hashed in
+    a pool of "n_workers" threads. If "n_workers" is not specified, use the
+    "checksum-workers" setting in the site/user configuration.
+
     Return a list of 3-element tuples. Each tuple represents a path in "name",
     the checksum, and the access mode. If the path is a directory, the checksum
     and the access mode will both be set to None.
@@ -59,32 +71,89 @@ def get_checksum(name, checksum_func=None):
 
     if checksum_func is None:
         checksum_func = get_checksum_func()
+    if n_workers is None:
+        n_workers = get_checksum_n_workers()
     path_and_checksum_list = []
     if os.path.isfile(name):
         checksum = checksum_func(name, "")
         path_and_checksum_list.append(
             ("", checksum, os.stat(os.path.realpath(name)).st_mode))
+    elif n_workers > 1:
+        name = os.path.normpath(name)
+        items = deque()  # [(path, future, entry), ...]
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            for path, entry in _scan_tree(name):
+                if entry is not None:
+                    future = executor.submit(
+                        checksum_func, os.path.join(name, path), name)
+                    items.append((path, future, entry))
+                else:
+                    items.append((path, None, None))
+                # Bound the number of files in flight
+                if len(items) >= n_workers * _N_ITEMS_PER_WORKER:
+                    path_and_checksum_list.append(
+                        _get_checksum_item(*items.popleft()))
+            while items:
+                path_and_checksum_list.append(
+                    _get_checksum_item(*items.popleft()))
     else:  # if os.path.isdir(path):
         name = os.path.normpath(name)
-        path_and_checksum_list = []
-        for dirpath, _, filenames in os.walk(name):
-            path = dirpath[len(name) + 1:]
-            path_and_checksum_list.append((path, None, None))
-            for filename in filenames:
-                filepath = os.path.join(path, filename)
-                source = os.path.join(name, filepath)
-                checksum = checksum_func(source, name)
-                mode = os.stat(os.path.realpath(source)).st_mode
-                path_and_checksum_list.append((filepath, checksum, mode))
+        for path, entry in _scan_tree(name):
+            if entry is None:
+                path_and_checksum_list.append((path, None, None))
+            else:
+                checksum = checksum_func(os.path.join(name, path), name)
+                path_and_checksum_list.append(
+                    (path, checksum, entry.stat().st_mode))
     return path_and_checksum_list
 
 
-def get_checksum_func(algorithm=None):
+def _get_checksum_item(path, future, entry):
+    """Helper for get_checksum, return a (path, checksum, mode) tuple."""
+    if future is None:
+        return (path, None, None)
+    return (path, future.result(), entry.stat().st_mode)
+
+
+def _scan_tree(name):
+    """Walk the directory tree "name" in the same order as "os.walk".
+
+    Yield (path, entry) for each directory and file in the tree, where
+    "path" is relative to "name" and "entry" is the os.DirEntry of a file,
+    or None for a directory.
+
+    """
+    stack = [""]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(os.path.join(name, path)) as scandir_it:
+                entries = list(scandir_it)
+        except OSError:
+            continue
+        yield path, None
+        dir_paths = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                yield os.path.join(path, entry.name), entry
+            elif not entry.is_symlink():
+                dir_paths.append(os.path.join(path, entry.name))
+        stack.extend(reversed(dir_paths))
+
+
+def get_checksum_func(algorithm=None, cache=None):
     """Return a checksum function suitable for get_checksum.
 
     "algorithm" can be "mtime+size" or the name of a hash object from hashlib.
     If "algorithm" is not specified, return function to do MD5 checksum.
 
+    If "cache" is a ChecksumCache, the function will look up and store the
+    checksums of files in it.
+
     Raise ValueError(algorithm) if "algorithm" is not a recognised hash object.
 
     """
@@ -98,9 +167,214 @@ def get_checksum_func(algorithm=None):
         return _mtime_and_size
     algorithm = algorithm.replace("sum", "")
     hashlib.new(algorithm)  # raise ValueError for a bad "algorithm" string
+    if cache is not None:
+        return lambda source, *_: cache.get_hexdigest(algorithm, source)
     return lambda source, *_: _get_hexdigest(algorithm, source)
 
 
+def get_stat_checksum_func(checksum_func, prev_items, stat_map):
+    """Return a checksum function that skips files with unchanged stat.
+
+    "checksum_func" is a checksum function suitable for get_checksum.
+    "prev_items" is a dict {path: (stat_key, checksum), ...} recorded by a
+    previous run, where "path" is as returned by get_checksum and
+    "stat_key" is a (size, mtime_ns, mode) tuple (or None).
+
+    The returned function is suitable for get_checksum. It returns the
+    previous checksum of a path if its stat key is unchanged, and calls
+    "checksum_func" otherwise. It sets stat_map[path] to the current stat
+    key of each path, or to None if the file was modified too recently for
+    its stat key to be trusted.
+
+    """
+    def _stat_checksum_func(source, root):
+        path = ""
+        if root:
+            path = os.path.relpath(source, root)
+        stat = os.stat(source)
+        stat_key = (stat.st_size, stat.st_mtime_ns, stat.st_mode)
+        if time() - stat.st_mtime > ChecksumCache.MIN_MTIME_AGE:
+            stat_map[path] = stat_key
+        else:
+            stat_map[path] = None
+        prev_stat_key, prev_checksum = prev_items.get(path, (None, None))
+        if stat_key == prev_stat_key and prev_checksum is not None:
+            return prev_checksum
+        return checksum_func(source, root)
+
+    return _stat_checksum_func
+
+
+def get_checksum_n_workers():
+    """Return the number of threads get_checksum should use for a directory.
+
+    This is the "checksum-workers" setting in the site/user configuration,
+    or 1 if it is not set.
+
+    """
+    global _DEFAULT_N_WORKERS
+    if _DEFAULT_N_WORKERS is None:
+        _DEFAULT_N_WORKERS = int(
+            ResourceLocator.default().get_conf().get_value(
+                ["checksum-workers"], 1))
+    return _DEFAULT_N_WORKERS
+
+
+def get_checksum_cache():
+    """Return the ChecksumCache configured in the site/user configuration.
+
+    The cache is opt-in. Return None if "checksum-cache" is not set.
+
+    """
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        file_name = ResourceLocator.default().get_conf().get_value(
+            ["checksum-cache"])
+        if not file_name:
+            return None
+        _DEFAULT_CACHE = ChecksumCache(
+            os.path.expanduser(os.path.expandvars(file_name)))
+    return _DEFAULT_CACHE
+
+
+class ChecksumCache(object):
+    """An on-disk cache of the checksums of files.
+
+    Each entry is keyed by the device, inode and hash algorithm of a file,
+    and is only valid while the size and modified time of the file remain
+    the same. Stale entries are replaced when the file is hashed again, and
+    entries that have not been used for MAX_AGE seconds are evicted.
+
+    The cache is a best effort. Failure to read or write the database file
+    only means that the checksums are calculated from the file contents.
+
+    The cache can be shared by the threads of get_checksum.
+
+    """
+
+    MAX_AGE = 30 * 86400.0  # 30 days
+    MIN_MTIME_AGE = 2.0  # don't trust mtime of recently modified files
+    N_PENDING_MAX = 1000
+    SCHEMA = ("dev INTEGER, ino INTEGER, algorithm TEXT, " +
+              "size INTEGER, mtime_ns INTEGER, checksum TEXT, " +
+              "last_used REAL, " +
+              "PRIMARY KEY(dev, ino, algorithm)")
+    TABLE = "checksums"
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.conn = None
+        self.pending = {}  # {(dev, ino, algorithm): row, ...}
+        self.lock = Lock()
+
+    def get_conn(self):
+        """Return a Connection object to the database, or None on error."""
+        if self.conn is None and self.file_name is not None:
+            try:
+                dir_name = os.path.dirname(self.file_name)
+                if dir_name:
+                    os.makedirs(dir_name, exist_ok=True)
+                self.conn = sqlite3.connect(
+                    self.file_name, timeout=10.0, check_same_thread=False)
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS %s(%s)" % (
+                        self.TABLE, self.SCHEMA))
+                self.conn.execute(
+                    "DELETE FROM %s WHERE last_used<?" % self.TABLE,
+                    [time() - self.MAX_AGE])
+                self.conn.commit()
+            except (OSError, sqlite3.Error):
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+                self.file_name = None
+        return self.conn
+
+    def get_hexdigest(self, algorithm, source):
+        """Return the hexdigest of source, using the cache if possible.
+
+        "source" can be a path to a file or a readable file object. File
+        objects are never cached.
+
+        """
+        if hasattr(source, "read"):
+            return _get_hexdigest(algorithm, source)
+        stat = os.stat(source)
+        key = (stat.st_dev, stat.st_ino, algorithm)
+        with self.lock:
+            checksum = self._select(key, stat.st_size, stat.st_mtime_ns)
+        if checksum is not None:
+            return checksum
+        checksum = _get_hexdigest(algorithm, source)
+        # A file modified within the granularity of its modified time
+        # may be modified again without changing its size or mtime.
+        if time() - stat.st_mtime > self.MIN_MTIME_AGE:
+            with self.lock:
+                self.pending[key] = key + (
+                    stat.st_size, stat.st_mtime_ns, checksum, time())
+                if len(self.pending) >= self.N_PENDING_MAX:
+                    self._flush()
+        return checksum
+
+    def _select(self, key, size, mtime_ns):
+        """Return the cached checksum for a file, or None if not cached.
+
+        Must be called with the lock held.
+
+        """
+        if key in self.pending:
+            row = self.pending[key]
+            if row[3:5] == (size, mtime_ns):
+                return row[5]
+            return None
+        if self.get_conn() is None:
+            return None
+        try:
+            row = self.conn.execute(
+                "SELECT size,mtime_ns,checksum FROM %s" % self.TABLE +
+                " WHERE dev=? AND ino=? AND algorithm=?", key).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or row[0:2] != (size, mtime_ns):
+            return None
+        self.pending[key] = key + (size, mtime_ns, row[2], time())
+        return row[2]
+
+    def flush(self):
+        """Write pending entries to the database."""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        """Write pending entries to the database, helper for flush."""
+        if not self.pending:
+            return
+        conn = self.get_conn()
+        if conn is not None:
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO %s VALUES(?,?,?,?,?,?,?)" % (
+                        self.TABLE),
+                    list(self.pending.values()))
+                conn.commit()
+            except sqlite3.Error:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+        self.pending.clear()
+
+    def close(self):
+        """Flush pending entries and close the database connection."""
+        if self.conn is not None:
+            self.flush()
+            try:
+                self.conn.close()
+            except sqlite3.Error:
+                pass
+            self.conn = None
+
+
 def guess_checksum_algorithm(checksum):
     """Guess algorithm of "checksum".
 
@@ -278,23 +278,23 @@ class ConfigNode(object):
         """
         if keys is None:
             keys = []
+        elif not isinstance(keys, list):
+            keys = list(keys)
         start_node = self.get(keys, no_ignore)
+        if start_node is None or (no_ignore and self.state):
+            return
+        # Depth first, last child first, looking up children directly
         stack = [(keys, start_node)]
-        if start_node is None:
-            stack = []
         while stack:
-            node_keys, node = stack.pop(0)
+            node_keys, node = stack.pop()
             if isinstance(node.value, dict):
-                for key in node.value.keys():
-                    child_keys = node_keys + [key]
-                    subnode = self.get(child_keys, no_ignore)
-                    if subnode is not None:
-                        stack.insert(0, (child_keys, subnode))
-            if node_keys == keys:
+                for key, subnode in node.value.items():
+                    if not (no_ignore and subnode.state):
+                        stack.append((node_keys + [key], subnode))
+            if node is start_node:
                 continue
             if len(node_keys) == 1 and not isinstance(node.value, dict):
-                null_node_keys = [""] + node_keys
-                yield (null_node_keys, node)
+                yield ([""] + node_keys, node)
             else:
                 yield (node_keys, node)
 
@@ -336,16 +336,20 @@ class ConfigNode(object):
         """
         if not keys:
             return self
-        keys = list(keys)
-        node = self.get_filter(no_ignore)
-        while node is not None and keys and keys[0] is not None:
-            key = keys.pop(0)
+        if no_ignore and self.state:
+            return None
+        node = self
+        for key in keys:
+            if key is None:
+                break
             if not key:
                 continue
-            if isinstance(node.value, dict) and key in node.value:
-                node = node.value[key].get_filter(no_ignore)
-            else:
-                node = None
+            try:
+                node = node.value[key]
+            except (KeyError, TypeError):
+                return None
+            if no_ignore and node.state:
+                return None
         return node
 
     def get_filter(self, no_ignore):
@@ -464,23 +468,25 @@ class ConfigNode(object):
 
         """
         if keys is None:
-            keys = []
-        else:
+            return self
+        if not isinstance(keys, (list, tuple)):
             keys = list(keys)
         if value is None:
             value = {}
         if not keys:
             return self
         node = self
-        while keys and keys[0] is not None:
-            key = keys.pop(0)
+        for key in keys:
+            if key is None:
+                break
             if not key:
                 continue
             if not isinstance(node.value, dict):
                 node.value = {}
-            if key not in node.value:
-                node.value[key] = ConfigNode()
-            node = node.value[key]
+            subnode = node.value.get(key)
+            if subnode is None:
+                subnode = node.value[key] = ConfigNode()
+            node = subnode
         node.value = value
         if state is not None:
             node.state = state
@@ -644,6 +650,32 @@ class ConfigNode(object):
         diff.set_from_configs(other_config_node, self)
         return diff
 
+    def __deepcopy__(self, memo):
+        """Return a deep copy of this node, for "copy.deepcopy".
+
+        Copy sub-nodes and comments directly, which is much faster than the
+        generic implementation via "__getstate__" and "__setstate__".
+
+        """
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        value = self.value
+        if isinstance(value, dict):
+            value = dict(
+                (key, copy.deepcopy(sub_node, memo))
+                for key, sub_node in value.items())
+        elif not isinstance(value, str):
+            value = copy.deepcopy(value, memo)
+        comments = self.comments
+        if (isinstance(comments, list) and
+                all(isinstance(comment, str) for comment in comments)):
+            comments = list(comments)
+        else:
+            comments = copy.deepcopy(comments, memo)
+        new.__setstate__(
+            {"state": self.state, "value": value, "comments": comments})
+        return new
+
     def __getstate__(self):
         """Avoid pickling the STATE constants within a deepcopy.
 
@@ -1356,38 +1388,59 @@ class ConfigLoader(object):
         if node is None:
             node = ConfigNode()
         handle, file_name = self._get_file_and_name(source)
-        keys = []  # Currently position under root node
-        type_ = None  # Type of current node, section or option?
+        # Read the source in bulk, then dispatch on the first character of
+        # each line to avoid trying regular expressions where possible
+        try:
+            text = handle.read()
+        finally:
+            if isinstance(source, str):
+                handle.close()
+        if isinstance(text, bytes):
+            text = text.decode(errors='ignore')
+        lines = text.split("\n")
+        # Restore the newlines, except after the last line, if any
+        last_line = lines.pop()
+        lines = [line + "\n" for line in lines]
+        if last_line:
+            lines.append(last_line)
+        char_assign = self.char_assign
+        char_comment = self.char_comment
+        re_section_match = self.RE_SECTION.match
+        re_option_match = self.re_option.match
+        section_node = node  # Node of current section
+        option_node = None  # Node of current option, if any
+        value_conts = None  # [value, continuation, ...] of option_node
         comments = None  # Comments associated with next node
-        line_num = 0
-        # Note: "for line in handle:" hangs for sys.stdin
-        while True:
-            line = handle.readline()
-            if isinstance(line, bytes):
-                line = line.decode(errors='ignore')
-            if not line:
-                break
-            line_num += 1
+        for line_num, line in enumerate(lines, 1):
+            head_char = line[0]
             # White space and comments
-            if line.isspace():
+            if head_char == "\n" or (head_char.isspace() and line.isspace()):
                 comments = []
                 continue
-            elif line.lstrip().startswith(self.char_comment):
+            if line.startswith(char_comment) or (
+                    head_char.isspace() and
+                    line.lstrip().startswith(char_comment)):
                 if comments is None:
                     node.comments.append(self._comment_strip(line))
                 else:
                     comments.append(self._comment_strip(line))
                 continue
             # Handle option continuation.
-            if type_ == self.TYPE_OPTION and line[0].isspace():
-                value = node.get(keys[:]).value
+            if option_node is not None and head_char.isspace():
                 value_cont = line.strip()
-                if value_cont.startswith(self.char_assign):
+                if value_cont.startswith(char_assign):
                     value_cont = value_cont[1:]
-                node.set(keys[:], value + "\n" + value_cont)
+                if value_conts is None:
+                    value_conts = [option_node.value]
+                value_conts.append(value_cont)
                 continue
+            if value_conts is not None:
+                option_node.value = "\n".join(value_conts)
+                value_conts = None
             # Match a section header?
-            match = self.RE_SECTION.match(line)
+            match = None
+            if head_char == "[" or head_char.isspace():
+                match = re_section_match(line)
             if match:
                 head, section, state = match.group("head", "section", "state")
                 bad_index = self._check_section_value(section)
@@ -1396,20 +1449,13 @@ class ConfigLoader(object):
                         ConfigSyntaxError.BAD_CHAR,
                         file_name, line_num, len(head) + bad_index, line)
                 # Find position under root node
-                if type_ == self.TYPE_OPTION:
-                    keys.pop()
-                if keys:
-                    keys.pop()
                 section = section.strip()
-                if section:
-                    keys.append(section)
-                    type_ = self.TYPE_SECTION
-                else:
-                    keys = []
-                    type_ = None
-                section_node = node.get(keys[:])
+                keys = [section] if section else []
+                option_node = None
+                section_node = node.get(keys)
                 if section_node is None:
-                    node.set(keys[:], {}, state, comments)
+                    node.set(keys, {}, state, comments)
+                    section_node = node.get(keys)
                 else:
                     section_node.state = state
                     if comments:
@@ -1417,20 +1463,30 @@ class ConfigLoader(object):
                 comments = []
                 continue
             # Match the start of an option setting?
-            match = self.re_option.match(line)
+            match = re_option_match(line)
             if not match:
                 raise ConfigSyntaxError(
                     ConfigSyntaxError.BAD_SYNTAX, file_name, line_num, 0, line)
             option, value, state = match.group("option", "value", "state")
-            if type_ == self.TYPE_OPTION:
-                keys.pop()
-            keys.append(option)
-            type_ = self.TYPE_OPTION
             value = value.strip()
             if comments is not None and default_comments is not None:
                 comments += default_comments
-            node.set(keys[:], value.strip(), state, comments)
+            # Equivalent to "node.set(keys + [option], value, state,
+            # comments)", using the current section node directly
+            if not isinstance(section_node.value, dict):
+                section_node.value = {}
+            option_node = section_node.value.get(option)
+            if option_node is None:
+                option_node = ConfigNode(value, state, comments)
+                section_node.value[option] = option_node
+            else:
+                option_node.value = value
+                option_node.state = state
+                if comments is not None:
+                    option_node.comments = comments
             comments = []
+        if value_conts is not None:
+            option_node.value = "\n".join(value_conts)
         return node
 
     __call__ = load
@@ -20,11 +20,13 @@
 """Process "file:*" sections in node of a metomi.rose.config_tree.ConfigTree.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from fnmatch import fnmatch
 from glob import glob
 import os
 from metomi.rose.checksum import (
-    get_checksum, get_checksum_func, guess_checksum_algorithm)
+    get_checksum, get_checksum_cache, get_checksum_func,
+    get_stat_checksum_func, guess_checksum_algorithm)
 from metomi.rose.config_processor import (ConfigProcessError,
                                           ConfigProcessorBase)
 from metomi.rose.env import env_var_process, UnboundEnvironmentVariableError
@@ -32,6 +34,7 @@ from metomi.rose.fs_util import FileSystemUtil
 from metomi.rose.job_runner import JobManager, JobProxy, JobRunner
 from metomi.rose.popen import RosePopener
 from metomi.rose.reporter import Event
+from metomi.rose.resource import ResourceLocator
 from metomi.rose.scheme_handler import SchemeHandlersManager
 import shlex
 from shutil import rmtree
@@ -97,14 +100,22 @@ class ConfigProcessorForFile(ConfigProcessorBase):
             file_install_root = env_var_process(file_install_root)
             self.manager.fs_util.makedirs(file_install_root)
             self.manager.fs_util.chdir(file_install_root)
+        checksum_cache = get_checksum_cache()
         try:
-            self._process(conf_tree, nodes, loc_dao, **kwargs)
+            self._process(conf_tree, nodes, loc_dao, checksum_cache, **kwargs)
         finally:
+            if checksum_cache is not None:
+                checksum_cache.flush()
             if cwd != os.getcwd():
                 self.manager.fs_util.chdir(cwd)
 
-    def _process(self, conf_tree, nodes, loc_dao, **kwargs):
+    def _process(self, conf_tree, nodes, loc_dao, checksum_cache=None,
+                 **kwargs):
         """Helper for self.process."""
+        checksum_func = get_checksum_func(cache=checksum_cache)
+        # Unless strict, only hash files of existing targets with changed stat
+        is_strict = ResourceLocator.default().get_conf().get_value(
+            ["file-install-strict"], "false") == "true"
         # Ensure that everything is overwritable
         # Ensure that container directories exist
         for key, node in sorted(nodes.items()):
@@ -186,18 +197,26 @@ class ConfigProcessorForFile(ConfigProcessorBase):
                 scheme = scheme.strip()
                 config_schemes.append((pattern, scheme))
 
+        nproc_keys = ["rose.config_processors.fileinstall", "nproc"]
+        nproc_str = conf_tree.node.get_value(nproc_keys)
+        nproc = None
+        if nproc_str is not None:
+            nproc = int(nproc_str)
+
         # Where applicable, determine for each source:
         # * Its real name.
         # * The checksums of its paths.
         # * Whether it can be considered unchanged.
+        for source in sources.values():
+            for pattern, scheme in config_schemes:
+                if fnmatch(source.name, pattern):
+                    source.scheme = scheme
+                    break
+        parse_excs = self.loc_handlers_manager.parse_many(
+            list(sources.values()), conf_tree, nproc)
         for source in list(sources.values()):
-            try:
-                for pattern, scheme in config_schemes:
-                    if fnmatch(source.name, pattern):
-                        source.scheme = scheme
-                        break
-                self.loc_handlers_manager.parse(source, conf_tree)
-            except ValueError as exc:
+            exc = parse_excs.get(source.name)
+            if isinstance(exc, ValueError):
                 if source.is_optional:
                     sources.pop(source.name)
                     for name in source.used_by_names:
@@ -209,6 +228,8 @@ class ConfigProcessorForFile(ConfigProcessorBase):
                     raise ConfigProcessError(
                         ["file:" + source.used_by_names[0], "source"],
                         source.name)
+            elif exc is not None:
+                raise exc
             prev_source = loc_dao.select(source.name)
             source.is_out_of_date = (
                 not prev_source or
@@ -233,19 +254,30 @@ class ConfigProcessorForFile(ConfigProcessorBase):
                     os.path.islink(target.name) or
                     not os.path.isdir(target.name))
             else:
+                prev_target = loc_dao.select(target.name)
                 if (os.path.exists(target.name) and
                         not os.path.islink(target.name)):
+                    target_checksum_func = checksum_func
+                    stat_map = {}
+                    if not is_strict and prev_target is not None:
+                        target_checksum_func = get_stat_checksum_func(
+                            checksum_func,
+                            dict(
+                                (path.name, (path.stat, path.checksum))
+                                for path in prev_target.paths),
+                            stat_map)
                     for path, checksum, access_mode in get_checksum(
-                            target.name):
-                        target.add_path(path, checksum, access_mode)
+                            target.name, target_checksum_func):
+                        target.add_path(
+                            path, checksum, access_mode, stat_map.get(path))
                     target.paths.sort()
-                prev_target = loc_dao.select(target.name)
                 target.is_out_of_date = (
                     os.path.islink(target.name) or
                     not os.path.exists(target.name) or
                     prev_target is None or
                     prev_target.mode != target.mode or
                     len(prev_target.paths) != len(target.paths))
+                is_stat_changed = False
                 if not target.is_out_of_date:
                     prev_target.paths.sort()
                     for prev_path, path in zip(
@@ -253,12 +285,18 @@ class ConfigProcessorForFile(ConfigProcessorBase):
                         if prev_path != path:
                             target.is_out_of_date = True
                             break
+                        if prev_path.stat != path.stat:
+                            is_stat_changed = True
                 # See if any sources out of date
                 if not target.is_out_of_date:
                     for dep_loc in target.dep_locs:
                         if dep_loc.is_out_of_date:
                             target.is_out_of_date = True
                             break
+                if not target.is_out_of_date and is_stat_changed:
+                    # Up to date, but store the new stat of its paths
+                    target.loc_type = prev_target.loc_type
+                    loc_dao.update_locs.append(target)
             if target.is_out_of_date:
                 target.paths = None
                 loc_dao.delete_locs.append(target)
@@ -305,7 +343,8 @@ class ConfigProcessorForFile(ConfigProcessorBase):
             else:
                 self.manager.fs_util.install(target.name)
                 target.loc_type = target.TYPE_BLOB
-                for path, checksum, access_mode in get_checksum(target.name):
+                for path, checksum, access_mode in get_checksum(
+                        target.name, checksum_func):
                     target.add_path(path, checksum, access_mode)
                 loc_dao.update_locs.append(target)
         loc_dao.execute_queued_items()
@@ -314,11 +353,10 @@ class ConfigProcessorForFile(ConfigProcessorBase):
         if jobs:
             work_dir = mkdtemp()
             try:
-                nproc_keys = ["rose.config_processors.fileinstall", "nproc"]
-                nproc_str = conf_tree.node.get_value(nproc_keys)
-                nproc = None
-                if nproc_str is not None:
-                    nproc = int(nproc_str)
+                self.loc_handlers_manager.set_pull_locs(
+                    [job.context for job in jobs.values()
+                     if job.context.action_key == Loc.A_SOURCE],
+                    conf_tree)
                 job_runner = JobRunner(self, nproc)
                 job_runner(JobManager(jobs), conf_tree, loc_dao, work_dir)
             except ValueError as exc:
@@ -331,6 +369,7 @@ class ConfigProcessorForFile(ConfigProcessorBase):
                         raise ConfigProcessError(keys, source.name)
                 raise exc
             finally:
+                self.loc_handlers_manager.set_pull_locs([], conf_tree)
                 loc_dao.execute_queued_items()
                 rmtree(work_dir)
 
@@ -563,10 +602,11 @@ class LocTypeError(Exception):
 class LocSubPath(object):
     """Represent a sub-path in a location."""
 
-    def __init__(self, name, checksum=None, access_mode=None):
+    def __init__(self, name, checksum=None, access_mode=None, stat=None):
         self.name = name
         self.checksum = checksum
         self.access_mode = access_mode
+        self.stat = stat  # (size, mtime_ns, mode) or None
 
     def __lt__(self, other):
         return (
@@ -600,12 +640,19 @@ class LocDAO(object):
                    "PRIMARY KEY(name)")
     SCHEMA_PATHS = "name TEXT, path TEXT,checksum TEXT, UNIQUE(name, path)"
     SCHEMA_DEP_NAMES = "name TEXT, dep_name TEXT, UNIQUE(name, dep_name)"
+    SCHEMA_PATH_STATS = ("name TEXT, " +
+                         "path TEXT, " +
+                         "size INTEGER, " +
+                         "mtime_ns INTEGER, " +
+                         "mode INTEGER, " +
+                         "UNIQUE(name, path)")
 
     def __init__(self):
         self.file_name = os.path.abspath(self.FILE_NAME)
         self.conn = None
         self.delete_locs = []
         self.update_locs = []
+        self.locs = None  # {name: Loc, ...}, see "load"
 
     def get_conn(self):
         """Return a Connection object to the database."""
@@ -623,7 +670,8 @@ class LocDAO(object):
         for name, schema in [
                 ("locs", self.SCHEMA_LOCS),
                 ("paths", self.SCHEMA_PATHS),
-                ("dep_names", self.SCHEMA_DEP_NAMES)]:
+                ("dep_names", self.SCHEMA_DEP_NAMES),
+                ("path_stats", self.SCHEMA_PATH_STATS)]:
             if name not in names:
                 conn.execute("CREATE TABLE " + name + "(" + schema + ")")
         conn.commit()
@@ -636,16 +684,21 @@ class LocDAO(object):
             conn = self.get_conn()
             # Locations to delete
             if self.delete_locs:
-                for table in ["locs", "dep_names", "paths"]:
+                for table in ["locs", "dep_names", "paths", "path_stats"]:
                     conn.executemany(
                         (r"DELETE FROM %s WHERE name=?" % table),
                         [[loc.name] for loc in self.delete_locs])
             # Locations to update
             if self.update_locs:
+                # Stats of paths are only stored for the current paths
+                conn.executemany(
+                    r"DELETE FROM path_stats WHERE name=?",
+                    [[loc.name] for loc in self.update_locs])
                 data = {
                     "locs": {"n_args": 6, "args_list": []},
                     "paths": {"n_args": 3, "args_list": []},
-                    "dep_names": {"n_args": 2, "args_list": []}}
+                    "dep_names": {"n_args": 2, "args_list": []},
+                    "path_stats": {"n_args": 5, "args_list": []}}
                 for loc in self.update_locs:
                     data["locs"]["args_list"].append([
                         loc.name, loc.real_name, loc.scheme, loc.mode,
@@ -659,6 +712,9 @@ class LocDAO(object):
                                 checksum_str = None
                             data["paths"]["args_list"].append(
                                 [loc.name, path.name, checksum_str])
+                            if checksum_str and path.stat:
+                                data["path_stats"]["args_list"].append(
+                                    [loc.name, path.name] + list(path.stat))
                     if loc.dep_locs:
                         for dep_loc in loc.dep_locs:
                             data["dep_names"]["args_list"].append(
@@ -679,44 +735,64 @@ class LocDAO(object):
         else:
             del self.delete_locs[:]
             del self.update_locs[:]
+            self.locs = None
 
-    def select(self, name):
-        """Query database for settings matching name.
+    def load(self):
+        """Load all settings in the database into self.locs.
 
-        Reconstruct setting as a Loc object and return it.
+        Read each table in a single pass. Reconstruct each setting as a Loc
+        object, and index it by name in the self.locs dict.
 
         """
         conn = self.get_conn()
-        row = conn.execute("""SELECT real_name,scheme,mode,loc_type,key""" +
-                           """ FROM locs WHERE name=?""", [name]).fetchone()
-        if row is None:
-            return
-        loc = Loc(name)
-        loc.real_name, loc.scheme, loc.mode, loc.loc_type, loc.key = row
-
+        self.locs = {}
+        for row in conn.execute(
+                """SELECT name,real_name,scheme,mode,loc_type,key"""
+                """ FROM locs"""):
+            loc = Loc(row[0])
+            (loc.real_name, loc.scheme, loc.mode, loc.loc_type,
+             loc.key) = row[1:]
+            self.locs[loc.name] = loc
+
+        stats = {}  # {(name, path): (size, mtime_ns, mode), ...}
         for row in conn.execute(
-                """SELECT path,checksum FROM paths WHERE name=?""",
-                [name]):
-            path, checksum_str = row
+                """SELECT name,path,size,mtime_ns,mode FROM path_stats"""):
+            stats[row[0:2]] = row[2:]
+
+        for name, path, checksum_str in conn.execute(
+                """SELECT name,path,checksum FROM paths"""):
+            loc = self.locs.get(name)
+            if loc is None:
+                continue
             checksum = None
             access_mode = None
             if checksum_str:
                 checksum_items = checksum_str.rsplit(":", 1)
                 checksum = checksum_items.pop(0)
-                access_mode = None
                 if checksum_items:
                     access_mode = int(checksum_items.pop(0))
-            if loc.paths is None:
-                loc.paths = []
-            loc.add_path(path, checksum, access_mode)
+            loc.add_path(
+                path, checksum, access_mode, stats.get((name, path)))
 
-        for row in conn.execute(
-                """SELECT dep_name FROM dep_names WHERE name=?""", [name]):
-            dep_name, = row
+        for name, dep_name in conn.execute(
+                """SELECT name,dep_name FROM dep_names"""):
+            loc = self.locs.get(name)
+            if loc is None:
+                continue
             if loc.dep_locs is None:
                 loc.dep_locs = []
-            loc.dep_locs.append(self.select(dep_name))
-        return loc
+            loc.dep_locs.append(self.locs.get(dep_name))
+
+    def select(self, name):
+        """Return the setting matching name as a Loc object.
+
+        Load all settings on first call, or after the database is modified
+        by "execute_queued_items". Return None if there is no such setting.
+
+        """
+        if self.locs is None:
+            self.load()
+        return self.locs.get(name)
 
 
 class PullableLocHandlersManager(SchemeHandlersManager):
@@ -753,6 +829,66 @@ class PullableLocHandlersManager(SchemeHandlersManager):
         Set loc.real_name, loc.scheme, loc.loc_type, loc.key, loc.paths, etc.
         if relevant.
 
+        """
+        return self._get_parse_handler(loc).parse(loc, conf_tree)
+
+    def parse_many(self, locs, conf_tree, nproc=None):
+        """Parse the names of a list of locations concurrently.
+
+        Use up to nproc (or JobRunner.NPROC) threads. Where a handler has a
+        "parse_many(locs, conf_tree)" method, use it to parse all its
+        locations together. It should return a dict {loc.name: exception}
+        for locations that cannot be parsed. Where a handler also has a
+        "group_locs(locs)" method, call "parse_many" concurrently for each
+        list of locations it returns.
+
+        Return a dict {loc.name: exception, ...} for locations that cannot be
+        parsed.
+
+        """
+        if not nproc:
+            nproc = JobRunner.NPROC
+        excs = {}
+        handler_locs = {}  # {handler: [loc, ...], ...}
+        with ThreadPoolExecutor(nproc) as executor:
+            for loc, future in [
+                    (loc, executor.submit(self._get_parse_handler, loc))
+                    for loc in locs]:
+                try:
+                    handler = future.result()
+                except Exception as exc:
+                    excs[loc.name] = exc
+                else:
+                    handler_locs.setdefault(handler, [])
+                    handler_locs[handler].append(loc)
+            futures = []  # [(loc or None, future), ...]
+            for handler, h_locs in handler_locs.items():
+                if callable(getattr(handler, "parse_many", None)):
+                    groups = [h_locs]
+                    if callable(getattr(handler, "group_locs", None)):
+                        groups = handler.group_locs(h_locs)
+                    for g_locs in groups:
+                        futures.append((None, executor.submit(
+                            handler.parse_many, g_locs, conf_tree)))
+                else:
+                    for loc in h_locs:
+                        futures.append((loc, executor.submit(
+                            handler.parse, loc, conf_tree)))
+            for loc, future in futures:
+                if loc is None:
+                    excs.update(future.result())
+                    continue
+                try:
+                    future.result()
+                except Exception as exc:
+                    excs[loc.name] = exc
+        return excs
+
+    def _get_parse_handler(self, loc):
+        """Return the handler to parse loc.
+
+        Raise ValueError if there is no suitable handler.
+
         """
         if loc.scheme:
             # Scheme specified in the configuration.
@@ -770,7 +906,27 @@ class PullableLocHandlersManager(SchemeHandlersManager):
                     raise ValueError(loc.name)
             else:
                 handler = self.get_handler(self.DEFAULT_SCHEME)
-        return handler.parse(loc, conf_tree)
+        return handler
+
+    def set_pull_locs(self, locs, conf_tree):
+        """Tell the handlers which locations are about to be pulled.
+
+        Where a handler has a "set_pull_locs(locs, conf_tree)" method, call
+        it with the (possibly empty) list of its locations in locs, e.g. so
+        that it can pull them together. Call with an empty list at the end
+        of a run to discard any locations that have not been pulled.
+
+        """
+        handler_locs = {}  # {handler: [loc, ...], ...}
+        for handler in self.handlers.values():
+            if callable(getattr(handler, "set_pull_locs", None)):
+                handler_locs[handler] = []
+        for loc in locs:
+            handler = self.get_handler(loc.scheme)
+            if handler in handler_locs:
+                handler_locs[handler].append(loc)
+        for handler, h_locs in handler_locs.items():
+            handler.set_pull_locs(h_locs, conf_tree)
 
     def pull(self, loc, conf_tree):
         """Pull loc to its cache."""
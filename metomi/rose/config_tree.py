@@ -21,13 +21,17 @@
 """Rose configuration directory inheritance."""
 
 import os
+import pickle
 from metomi.rose.c3 import mro
-from metomi.rose.config import ConfigNode, ConfigLoader
+from metomi.rose.checksum import ChecksumCache
+from metomi.rose.config import ConfigNode, ConfigLoader, OPT_CONFIG_DIR
+from metomi.rose.resource import ResourceLocator
 import shlex
 from metomi.rose.config import ConfigDumper
 from io import StringIO
 from shutil import rmtree
 from tempfile import mkdtemp
+from time import time
 
 
 class BadOptionalConfigurationKeysError(Exception):
@@ -77,12 +81,144 @@ class ConfigTree(object):
             os.path.join(file_loc, key) for file_loc in self.file_locs[key]]
 
 
+class ConfigTreeCache(object):
+
+    """A cache of loaded configuration files and configuration directories.
+
+    Each entry is keyed by the path of a file or directory (and the
+    arguments used to load it). Its value should contain the modified times
+    and sizes of the relevant files and directories, so its user can
+    determine whether it is still valid. Entries are shared by all
+    ConfigTreeLoader objects in the process.
+
+    If "file_name" is specified, entries are also stored in the file, so
+    they can be reused by other processes. This is a best effort. Failure
+    to read or write the file only means that configurations are loaded
+    from their files. Entries not used for MAX_AGE seconds are evicted.
+
+    """
+
+    MAX_AGE = 30 * 86400.0  # 30 days
+    VERSION = 1
+
+    _DEFAULT = None
+
+    @classmethod
+    def default(cls):
+        """Return the default cache.
+
+        It is stored in the "config-tree-cache" file in the site/user
+        configuration, if it is set, or in memory only otherwise.
+
+        """
+        if cls._DEFAULT is None:
+            file_name = ResourceLocator.default().get_conf().get_value(
+                ["config-tree-cache"])
+            if file_name:
+                file_name = os.path.expanduser(os.path.expandvars(file_name))
+            cls._DEFAULT = cls(file_name)
+        return cls._DEFAULT
+
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+        self.entries = None  # {key: [value, last_used], ...}
+        self.is_modified = False
+
+    def get(self, key):
+        """Return the value of key, or None if key is not in the cache."""
+        if self.entries is None:
+            self._load()
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        entry[1] = time()
+        return entry[0]
+
+    def put(self, key, value, stat_items):
+        """Store the value of key.
+
+        "stat_items" should be a list of (path, mtime_ns, size) items, as
+        returned by "get_stat_item", for the paths relevant to the value.
+        Do not store the value if any of these paths was modified too
+        recently for its modified time to be trusted.
+
+        """
+        if self.entries is None:
+            self._load()
+        recent_mtime_ns = (time() - ChecksumCache.MIN_MTIME_AGE) * 1e9
+        for item in stat_items:
+            if item[1] is not None and item[1] > recent_mtime_ns:
+                self.entries.pop(key, None)
+                return
+        self.entries[key] = [value, time()]
+        self.is_modified = True
+
+    def flush(self):
+        """Write entries to the file, if relevant."""
+        if not self.is_modified or not self.file_name:
+            return
+        self.is_modified = False
+        min_last_used = time() - self.MAX_AGE
+        entries = dict(
+            (key, entry) for key, entry in self.entries.items()
+            if entry[1] >= min_last_used)
+        temp_file_name = "%s.%d" % (self.file_name, os.getpid())
+        try:
+            dir_name = os.path.dirname(self.file_name)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
+            with open(temp_file_name, "wb") as handle:
+                pickle.dump((self.VERSION, entries), handle)
+            os.replace(temp_file_name, self.file_name)
+        except (OSError, pickle.PickleError):
+            try:
+                os.unlink(temp_file_name)
+            except OSError:
+                pass
+
+    @staticmethod
+    def get_stat_item(path):
+        """Return a (path, mtime_ns, size) tuple for path.
+
+        mtime_ns and size are None if path does not exist.
+
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return (path, None, None)
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        """Load entries from the file, if relevant."""
+        self.entries = {}
+        if not self.file_name:
+            return
+        try:
+            with open(self.file_name, "rb") as handle:
+                version, entries = pickle.load(handle)
+        except (OSError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError, AttributeError, ImportError):
+            return
+        if version == self.VERSION and isinstance(entries, dict):
+            self.entries = entries
+
+
 class ConfigTreeLoader(object):
 
-    """Load a Rose configuration with inheritance."""
+    """Load a Rose configuration with inheritance.
 
-    def __init__(self, *args, **kwargs):
+    Loaded configuration files and configuration directory listings are
+    cached in "cache", a ConfigTreeCache, or ConfigTreeCache.default() if
+    it is not specified.
+
+    """
+
+    def __init__(self, *args, cache=None, **kwargs):
         self.node_loader = ConfigLoader(*args, **kwargs)
+        if cache is None:
+            cache = ConfigTreeCache.default()
+        self.cache = cache
 
     def load(self, conf_dir, conf_name, conf_dir_paths=None, opt_keys=None,
              conf_node=None, no_ignore=False, defines=None):
@@ -109,9 +245,8 @@ class ConfigTreeLoader(object):
         nodes = {}  # {conf_dir: node, ...}
         conf_file_name = os.path.join(conf_dir, conf_name)
         used_keys = []
-        nodes[conf_dir] = self.node_loader.load_with_opts(
-            conf_file_name, more_keys=opt_keys, used_keys=used_keys,
-            defines=defines)
+        nodes[conf_dir] = self._load_node(
+            conf_file_name, opt_keys, used_keys, defines)
 
         conf_tree = ConfigTree()
         conf_tree.conf_dirs = mro(
@@ -137,23 +272,18 @@ class ConfigTreeLoader(object):
                 if keys == ["", "import"]:
                     continue
                 if conf_tree.node.get(keys) is None:
+                    # Copy, as the node may be cached
+                    sub_node = self._copy_node(sub_node)
                     conf_tree.node.set(keys, sub_node.value, sub_node.state,
                                        sub_node.comments)
-            for dir_path, dir_names, file_names in os.walk(t_conf_dir):
-                names = [dir_ for dir_ in dir_names if dir_.startswith(".")]
-                for name in names:
-                    dir_names.remove(name)
-                for file_name in file_names:
-                    if file_name == conf_name or file_name.startswith("."):
-                        continue
-                    path = os.path.join(dir_path, file_name)
-                    rel_path = os.path.relpath(path, t_conf_dir)
-                    if rel_path not in conf_tree.files:
-                        conf_tree.files[rel_path] = t_conf_dir
-                    if rel_path not in conf_tree.file_locs:
-                        conf_tree.file_locs[rel_path] = []
-                    conf_tree.file_locs[rel_path].append(t_conf_dir)
-
+            for rel_path in self._get_rel_paths(t_conf_dir, conf_name):
+                if rel_path not in conf_tree.files:
+                    conf_tree.files[rel_path] = t_conf_dir
+                if rel_path not in conf_tree.file_locs:
+                    conf_tree.file_locs[rel_path] = []
+                conf_tree.file_locs[rel_path].append(t_conf_dir)
+
+        self.cache.flush()
         return conf_tree
 
     __call__ = load
@@ -168,12 +298,94 @@ class ConfigTreeLoader(object):
                 value, [os.path.dirname(my_conf_dir)] + conf_dir_paths)
             i_conf_file_name = os.path.join(i_conf_dir, conf_name)
             if nodes.get(i_conf_dir) is None:
-                nodes[i_conf_dir] = self.node_loader.load_with_opts(
-                    i_conf_file_name, more_keys=opt_keys,
-                    used_keys=used_keys)
+                nodes[i_conf_dir] = self._load_node(
+                    i_conf_file_name, opt_keys, used_keys)
             i_conf_dirs.append(i_conf_dir)
         return i_conf_dirs
 
+    @classmethod
+    def _copy_node(cls, node):
+        """Return a deep copy of a ConfigNode."""
+        value = node.value
+        if isinstance(value, dict):
+            value = dict(
+                (key, cls._copy_node(sub_node))
+                for key, sub_node in value.items())
+        comments = node.comments
+        if isinstance(comments, list):
+            comments = list(comments)
+        return ConfigNode(value, node.state, comments)
+
+    def _get_rel_paths(self, conf_dir, conf_name):
+        """Return relative paths of files in conf_dir, using the cache.
+
+        Ignore the configuration file and hidden files and directories.
+
+        """
+        key = ("dir", conf_dir, conf_name)
+        entry = self.cache.get(key)
+        if entry is not None:
+            # Entry is only valid if no directory is modified
+            signature, rel_paths = entry
+            if all(
+                    self.cache.get_stat_item(item[0]) == item
+                    for item in signature):
+                return rel_paths
+        signature = []
+        rel_paths = []
+        for dir_path, dir_names, file_names in os.walk(conf_dir):
+            signature.append(self.cache.get_stat_item(dir_path))
+            names = [dir_ for dir_ in dir_names if dir_.startswith(".")]
+            for name in names:
+                dir_names.remove(name)
+            for file_name in file_names:
+                if file_name == conf_name or file_name.startswith("."):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                rel_paths.append(os.path.relpath(path, conf_dir))
+        if signature:
+            self.cache.put(key, (signature, rel_paths), signature)
+        return rel_paths
+
+    def _load_node(self, conf_file_name, opt_keys, used_keys, defines=None):
+        """Load a configuration file with optional configurations.
+
+        Return a ConfigNode, which may be shared with the cache, so it must
+        not be modified. Append keys of the used optional configurations to
+        used_keys.
+
+        """
+        key = (
+            "file", conf_file_name, self.node_loader.char_assign,
+            self.node_loader.char_comment,
+            tuple(opt_keys) if opt_keys else (),
+            tuple(defines) if defines is not None else None)
+        # Signature of the file and all the optional configuration files
+        signature = [self.cache.get_stat_item(conf_file_name)]
+        opt_dir = os.path.join(
+            os.path.dirname(conf_file_name), OPT_CONFIG_DIR)
+        signature.append(self.cache.get_stat_item(opt_dir))
+        try:
+            opt_names = sorted(os.listdir(opt_dir))
+        except OSError:
+            opt_names = []
+        for opt_name in opt_names:
+            signature.append(
+                self.cache.get_stat_item(os.path.join(opt_dir, opt_name)))
+        entry = self.cache.get(key)
+        if entry is None or entry[0] != signature:
+            my_used_keys = []
+            node = self.node_loader.load_with_opts(
+                conf_file_name, more_keys=opt_keys, used_keys=my_used_keys,
+                defines=defines)
+            entry = (signature, node, my_used_keys)
+            self.cache.put(key, entry, signature)
+        node, my_used_keys = entry[1:]
+        for used_key in my_used_keys:
+            if used_key not in used_keys:
+                used_keys.append(used_key)
+        return node
+
     @classmethod
     def _search(cls, conf_dir, conf_dir_paths):
         """Search for named a configuration directory from a list of paths."""
@@ -41,11 +41,11 @@ RE_FLOAT = r"(?:\.\d+)|(?:" + RE_NATURAL + r")(?:\.\d*)?"
 # Matches namelist literals for intrinsic types
 RE_INTEGER = r"[\+\-]?(?:" + RE_NATURAL + r")"
 REC_INTEGER = _rec(r"\A(?:" + RE_INTEGER + r")\Z")
-RE_REAL = r"(?i)[\+\-]?(?:" + RE_FLOAT + r")(?:[de][\+\-]?\d+)?"
+RE_REAL = r"(?i:[\+\-]?(?:" + RE_FLOAT + r")(?:[de][\+\-]?\d+)?)"
 REC_REAL = _rec(r"\A(?:" + RE_REAL + r")\Z")
 RE_COMPLEX = r"\(\s*" + RE_REAL + r"\s*" + RE_SEP + r"\s*" + RE_REAL + r"\s*\)"
 REC_COMPLEX = _rec(r"\A(?:" + RE_COMPLEX + r")\Z")
-RE_LOGICAL = r"(?i)\.(?:true|false)\."
+RE_LOGICAL = r"(?i:\.(?:true|false)\.)"
 REC_LOGICAL = _rec(r"\A(?:" + RE_LOGICAL + r")\Z")
 RE_CHARACTER = r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\""
 REC_CHARACTER = _rec(r"\A(?:" + RE_CHARACTER + r")\Z")
@@ -232,19 +232,6 @@ class NamelistValue(object):
         return value
 
 
-class _ParseContext(object):
-    """Convenient object for storing the parser's state."""
-
-    def __init__(self):
-        self.files = []
-        self.handle = None
-        self.line = None
-        self.line_length = None
-        self.line_number = None
-        self.state = None
-        self.tail = None
-
-
 def parse(in_files):
     """Parse namelist groups in a list of input files "in_files".
     Return a list of NamelistGroup objects.
@@ -254,9 +241,7 @@ def parse(in_files):
                   "value": _handle_value,
                   "value-repeat": _handle_value}
     groups = []
-    ctx = _ParseContext()
-    ctx.files += in_files
-    for tag, filename, data in iter(lambda: _parse_func(ctx), None):
+    for tag, filename, data in _scan(in_files):
         if tag in handler_of:
             handler_of[tag](groups, filename, data)
     return groups
@@ -281,57 +266,76 @@ _PARSERS_FOR = {"": [[RE_GROUP_INIT, "group-init", "group"],
                            [RE_COMMENT, "comment", None]]}
 
 
-def _parse_func(ctx):
-    """The parsers at each "state" - each "state" has a set of parsers.
+def _compile_parsers(parsers_for):
+    """Compile the parsers at each "state" into a single master pattern.
 
-    Each parser contains a regular expression, the item type to return
-    on a match, and the name of the next state (if the match triggers
-    a state change).
+    The parsers of a state are joined as alternatives, in order, so the
+    first parser that matches wins, as if they were tried one by one. Each
+    alternative is wrapped in a capturing group, so the matching parser can
+    be identified from the "lastindex" of the match.
 
-    If the current string does not match, it will move on to the next
-    parser. A syntax error is raised if no more parsers are available
-    for the current state.
+    Return a dict of {state: (rec, {group_index: (tag, next_state, groups)})}
+    where "groups" is the slice of the match groups captured by the parser.
 
     """
-    while ctx.files:
-        if ctx.handle is None:
-            ctx.handle = ctx.files[0]
-            if not isinstance(ctx.handle, io.IOBase):
-                ctx.handle = open(ctx.handle, "r")
+    scanners = {}
+    for state, parsers in parsers_for.items():
+        alternatives = []
+        item_of = {}
+        index = 1
+        for pattern, tag, next_state in parsers:
+            n_groups = _rec(pattern).groups
+            alternatives.append(r"(\s*(?:" + pattern + r")\s*)")
+            item_of[index] = (tag, next_state, slice(index, index + n_groups))
+            index += 1 + n_groups
+        scanners[state] = (_rec(r"|".join(alternatives)), item_of)
+    return scanners
+
+
+_SCANNERS_FOR = _compile_parsers(_PARSERS_FOR)
+
+
+def _scan(in_files):
+    """Scan namelist tokens in a list of input files "in_files".
+
+    Yield each token as [tag, filename, data], where "data" is the list of
+    groups captured by the parser that matched the token. (See
+    "_PARSERS_FOR" for the parsers at each "state".)
+
+    Each line is walked with a position offset against the master pattern
+    of the current state. A syntax error is raised if no parser for the
+    current state matches at the current position.
+
+    """
+    for in_file in in_files:
+        handle = in_file
+        if not isinstance(handle, io.IOBase):
+            handle = open(handle, "r")
+        try:
+            state = ""
             # FIXME: may be incorrect for already opened file
-            ctx.line_number = 0
-            ctx.state = ""
-        while ctx.handle is not None:
-            if ctx.tail:
-                for pattern, tag, next_state in _PARSERS_FOR[ctx.state]:
-                    rec = _rec(r"\A\s*(?:" + pattern + r")\s*(.*)\Z")
-                    match = rec.match(ctx.tail)
-                    if match:
-                        data = list(match.groups())
-                        ctx.tail = data.pop()
-                        if next_state is not None:
-                            ctx.state = next_state
-                        return [tag, ctx.handle.name, data]
-                exc = SyntaxError()
-                exc.filename = ctx.handle.name
-                exc.lineno = ctx.line_number
-                exc.offset = ctx.line_length - len(ctx.tail) + 1
-                exc.text = ctx.line
-                raise exc
-            else:
-                ctx.line = ctx.handle.readline()
-                ctx.line_number += 1
-                if ctx.line:
-                    ctx.line = ctx.line.rstrip()
-                    ctx.line_length = len(ctx.line)
-                    ctx.tail = ctx.line
-                    ctx.tail = ctx.tail.lstrip()
-                else:
-                    if ctx.files[0] != ctx.handle:
-                        ctx.handle.close()
-                    ctx.files.pop(0)
-                    ctx.handle = None
-    return None
+            for line_number, line in enumerate(handle, 1):
+                line = line.rstrip()
+                line_length = len(line)
+                pos = line_length - len(line.lstrip())
+                while pos < line_length:
+                    rec, item_of = _SCANNERS_FOR[state]
+                    match = rec.match(line, pos)
+                    if match is None:
+                        exc = SyntaxError()
+                        exc.filename = handle.name
+                        exc.lineno = line_number
+                        exc.offset = pos + 1
+                        exc.text = line
+                        raise exc
+                    tag, next_state, groups = item_of[match.lastindex]
+                    pos = match.end()
+                    if next_state is not None:
+                        state = next_state
+                    yield [tag, handle.name, list(match.groups()[groups])]
+        finally:
+            if handle is not in_file:
+                handle.close()
 
 
 def _handle_group(groups, file_, data):
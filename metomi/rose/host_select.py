@@ -19,6 +19,8 @@
 # -----------------------------------------------------------------------------
 """Select an available host machine by load or by random."""
 
+import asyncio
+import json
 import os
 from random import choice, random, shuffle
 from metomi.rose.opt_parse import RoseOptionParser
@@ -30,7 +32,8 @@ import signal
 from socket import (
     getaddrinfo, gethostbyname_ex, gethostname, getfqdn, error as SocketError)
 import sys
-from time import sleep, time
+from tempfile import NamedTemporaryFile
+from time import time
 import traceback
 
 
@@ -90,7 +93,10 @@ class HostSelectScoreEvent(Event):
     LEVEL = Event.V
 
     def __str__(self):
-        return "%s: %s" % (self.args[0], str(self.args[1]))
+        ret = "%s: %s" % (self.args[0], str(self.args[1]))
+        if len(self.args) > 2 and self.args[2] is not None:
+            ret += " (dt=%.3fs)" % self.args[2]
+        return ret
 
 
 class RankMethodEvent(Event):
@@ -116,6 +122,120 @@ class TimedOutHostEvent(Event):
         return self.args[0] + ": (timed out)"
 
 
+class HostScoreCache(object):
+
+    """A file based cache of host scores.
+
+    Store the score of each host for each scoring method and argument, so
+    hosts do not need to be contacted again until the scores expire.
+
+    """
+
+    def __init__(self, file_name, ttl):
+        self.file_name = file_name
+        self.ttl = ttl
+        self.entries = {}  # {host_name: {key: [time, score], ...}, ...}
+        self.updates = {}  # {host_name: {key: [time, score], ...}, ...}
+        self.removals = set()
+        self.entries = self._load()
+
+    @staticmethod
+    def get_key(scorer_conf):
+        """Return the cache key of a ScorerConf."""
+        method_arg = scorer_conf.method_arg
+        if method_arg is None:
+            method_arg = scorer_conf.scorer.ARG
+        if method_arg is None:
+            return scorer_conf.method
+        return "%s:%s" % (scorer_conf.method, method_arg)
+
+    def get_scores(self, host_name, scorer_confs):
+        """Return a list of cached scores of host_name for scorer_confs.
+
+        Return None if any of the scores is not in the cache or has expired.
+        Random scores are not cached, but are always generated.
+
+        """
+        scores = []
+        entry = self.entries.get(host_name, {})
+        for scorer_conf in scorer_confs:
+            if scorer_conf.method == HostSelector.RANK_METHOD_RANDOM:
+                scores.append(scorer_conf.command_out_parser(b""))
+                continue
+            try:
+                time0, score = entry[self.get_key(scorer_conf)]
+            except (KeyError, TypeError, ValueError):
+                return None
+            if time() - time0 > self.ttl:
+                return None
+            scores.append(score)
+        return scores
+
+    def put_scores(self, host_name, scorer_confs, scores):
+        """Cache the scores of host_name for scorer_confs."""
+        now = time()
+        for scorer_conf, score in zip(scorer_confs, scores):
+            if (scorer_conf.method != HostSelector.RANK_METHOD_RANDOM and
+                    score is not None):
+                item = [now, score]
+                key = self.get_key(scorer_conf)
+                self.entries.setdefault(host_name, {})[key] = item
+                self.updates.setdefault(host_name, {})[key] = item
+
+    def remove(self, host_name):
+        """Remove all cached scores of host_name."""
+        self.entries.pop(host_name, None)
+        self.updates.pop(host_name, None)
+        self.removals.add(host_name)
+
+    def save(self):
+        """Merge changes into the latest content of the cache file.
+
+        Expired entries are removed. Errors are ignored, as the cache is only
+        an optimisation.
+
+        """
+        if not self.updates and not self.removals:
+            return
+        entries = self._load()
+        for host_name in self.removals:
+            entries.pop(host_name, None)
+        for host_name, entry in self.updates.items():
+            entries.setdefault(host_name, {}).update(entry)
+        now = time()
+        for host_name, entry in list(entries.items()):
+            for key, item in list(entry.items()):
+                if now - item[0] > self.ttl:
+                    entry.pop(key)
+            if not entry:
+                entries.pop(host_name)
+        try:
+            dir_name = os.path.dirname(self.file_name)
+            os.makedirs(dir_name, exist_ok=True)
+            with NamedTemporaryFile(
+                    "w", dir=dir_name, delete=False) as handle:
+                json.dump(entries, handle)
+            os.replace(handle.name, self.file_name)
+        except (OSError, TypeError, ValueError):
+            pass
+        self.updates.clear()
+        self.removals.clear()
+
+    def _load(self):
+        """Return the content of the cache file, or {} if not possible."""
+        try:
+            with open(self.file_name) as handle:
+                entries = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        for host_name, entry in list(entries.items()):
+            if not isinstance(entry, dict):
+                entries.pop(host_name)
+        return entries
+
+
 class HostSelector(object):
 
     """Select an available host machine by load of by random."""
@@ -125,7 +245,9 @@ class HostSelector(object):
     RANK_METHOD_RANDOM = "random"
     RANK_METHOD_MEM = "mem"
     RANK_METHOD_DEFAULT = RANK_METHOD_LOAD
-    SSH_CMD_POLL_DELAY = 0.05
+    SCORE_CACHE_BASE = "rose-host-select-cache.json"
+    SCORE_CACHE_TTL = 60.0
+    SSH_CMD_FAN_OUT = 64
     SSH_CMD_TIMEOUT = 10.0
 
     def __init__(self, event_handler=None, popen=None):
@@ -135,6 +257,7 @@ class HostSelector(object):
         self.popen = popen
         self.scorers = {}
         self.local_host_strs = None
+        self.latencies = {}  # {host_name: seconds, ...} of last select
 
     def get_local_host_strs(self):
         """Return a list of names associated with the current host."""
@@ -253,7 +376,8 @@ class HostSelector(object):
         return host_names, rank_method, thresholds
 
     def select(self, names=None, rank_method=None, thresholds=None,
-               ssh_cmd_timeout=None):
+               ssh_cmd_timeout=None, fan_out=None, n_hosts=None,
+               use_cache=True):
         """Return a list. Element 0 is most desirable.
         Each element of the list is a tuple (host, score).
 
@@ -274,6 +398,17 @@ class HostSelector(object):
 
         ssh_cmd_timeout: timeout of SSH commands to hosts. A float in seconds.
 
+        fan_out: maximum number of hosts to contact at the same time.
+
+        n_hosts: if specified, stop contacting hosts as soon as this number
+                 of hosts have met the thresholds, and rank these hosts only.
+
+        use_cache: if True, use fresh scores from the score cache instead of
+                   contacting the hosts again. The cache is disabled if the
+                   "[rose-host-select]cache-ttl" setting is 0.
+
+        The time taken to contact each host is recorded in self.latencies.
+
         """
 
         host_names, rank_method, thresholds = self.expand(names, rank_method,
@@ -311,10 +446,23 @@ class HostSelector(object):
                                             method_arg, value)
                 threshold_confs.append(threshold_conf)
 
+        conf = ResourceLocator.default().get_conf()
         if ssh_cmd_timeout is None:
-            conf = ResourceLocator.default().get_conf()
             ssh_cmd_timeout = float(conf.get_value(
                 ["rose-host-select", "timeout"], self.SSH_CMD_TIMEOUT))
+        if fan_out is None:
+            fan_out = int(conf.get_value(
+                ["rose-host-select", "fan-out"], self.SSH_CMD_FAN_OUT))
+        cache = None
+        if use_cache:
+            ttl = float(conf.get_value(
+                ["rose-host-select", "cache-ttl"], self.SCORE_CACHE_TTL))
+            if ttl > 0:
+                cache = HostScoreCache(
+                    os.path.join(
+                        ResourceLocator.USER_CONF_PATH,
+                        self.SCORE_CACHE_BASE),
+                    ttl)
 
         host_name_list = list(host_names)
         host_names = []
@@ -325,97 +473,203 @@ class HostSelector(object):
             else:
                 host_names.append(host_name)
 
+        self.latencies.clear()
+        loop = asyncio.get_event_loop()
+
         # Random selection with no thresholds. Return the 1st available host.
         if rank_conf.method == self.RANK_METHOD_RANDOM and not threshold_confs:
             shuffle(host_names)
-            for host_name in host_names:
-                if self.is_local_host(host_name):
+            return loop.run_until_complete(self._select_random(
+                host_names, ssh_cmd_timeout, fan_out))
+
+        try:
+            host_score_list = loop.run_until_complete(self._select_by_score(
+                host_names, rank_conf, threshold_confs, ssh_cmd_timeout,
+                fan_out, n_hosts, cache))
+        finally:
+            if cache is not None:
+                cache.save()
+        if not host_score_list:
+            raise NoHostSelectError()
+        host_score_list.sort(
+            key=lambda a: a[1],
+            reverse=rank_conf.scorer.SIGN < 0)
+        return host_score_list
+
+    async def _select_random(self, host_names, ssh_cmd_timeout, fan_out):
+        """Helper for select. Return the 1st available host in host_names.
+
+        The hosts are contacted concurrently, but a host is only returned if
+        all the hosts before it in host_names are unavailable.
+
+        """
+        semaphore = asyncio.Semaphore(fan_out)
+        tasks = []
+        for host_name in host_names:
+            if self.is_local_host(host_name):
+                tasks.append(None)
+                break
+            command = self.popen.get_cmd("ssh", host_name, "true")
+            tasks.append(asyncio.ensure_future(self._run_host_cmd(
+                semaphore, host_name, command, None, ssh_cmd_timeout)))
+        try:
+            for host_name, task in zip(host_names, tasks):
+                if task is None:
                     return [("localhost", 1)]
-                command = self.popen.get_cmd("ssh", host_name, "true")
-                proc = self.popen.run_bg(*command, preexec_fn=os.setpgrp)
-                time0 = time()
-                while (proc.poll() is None and
-                       time() - time0 <= ssh_cmd_timeout):
-                    sleep(self.SSH_CMD_POLL_DELAY)
-                if proc.poll() is None:
-                    os.killpg(proc.pid, signal.SIGTERM)
-                    proc.wait()
+                ret_code = (await task)[0]
+                if ret_code is None:
                     self.handle_event(TimedOutHostEvent(host_name))
-                elif proc.wait():
+                elif ret_code:
                     self.handle_event(DeadHostEvent(host_name))
                 else:
                     return [(host_name, 1)]
-            else:
-                raise NoHostSelectError()
+            raise NoHostSelectError()
+        finally:
+            await self._cancel_tasks(tasks)
+
+    async def _select_by_score(self, host_names, rank_conf, threshold_confs,
+                               ssh_cmd_timeout, fan_out, n_hosts, cache):
+        """Helper for select. Return a list of (host, score) tuples."""
+        scorer_confs = threshold_confs + [rank_conf]
+        stdin = rank_conf.get_command()
+        for threshold_conf in threshold_confs:
+            stdin += threshold_conf.get_command()
+        stdin += "exit\n"
+
+        # Use cached scores where possible.
+        host_score_list = []
+        if cache is not None:
+            for host_name in sorted(host_names):
+                if n_hosts and len(host_score_list) >= n_hosts:
+                    return host_score_list
+                scores = cache.get_scores(host_name, scorer_confs)
+                if scores is not None:
+                    host_names.remove(host_name)
+                    self._score_host(
+                        host_score_list, host_name, scores, None,
+                        rank_conf, threshold_confs)
+            if n_hosts and len(host_score_list) >= n_hosts:
+                return host_score_list
 
         # ssh to each host to return its score(s).
-        host_proc_dict = {}
+        semaphore = asyncio.Semaphore(fan_out)
+        host_name_of = {}  # {task: host_name, ...}
         for host_name in sorted(host_names):
             command = []
             if not self.is_local_host(host_name):
-                command_args = []
-                command_args.append(host_name)
-                command = self.popen.get_cmd("ssh", *command_args)
+                command = self.popen.get_cmd("ssh", host_name)
             command.append("bash")
-            stdin = rank_conf.get_command()
-            for threshold_conf in threshold_confs:
-                stdin += threshold_conf.get_command()
-            stdin += "exit\n"
-            proc = self.popen.run_bg(*command, stdin=stdin,
-                                     preexec_fn=os.setpgrp)
-            proc.stdin.write(stdin.encode('UTF-8'))
-            proc.stdin.flush()
-            host_proc_dict[host_name] = proc
-
-        # Retrieve score for each host name
-        host_score_list = []
-        time0 = time()
-        while host_proc_dict:
-            sleep(self.SSH_CMD_POLL_DELAY)
-            for host_name, proc in list(host_proc_dict.items()):
-                if proc.poll() is None:
-                    score = None
-                elif proc.wait():
-                    self.handle_event(DeadHostEvent(host_name))
-                    host_proc_dict.pop(host_name)
-                else:
-                    out = proc.communicate()[0]
-                    host_proc_dict.pop(host_name)
-                    for threshold_conf in threshold_confs:
-                        try:
-                            is_bad = threshold_conf.check_threshold(out)
-                            score = threshold_conf.command_out_parser(out)
-                        except ValueError:
-                            is_bad = True
-                            score = None
-                        if is_bad:
-                            self.handle_event(HostThresholdNotMetEvent(
-                                host_name, threshold_conf, score))
-                            break
+            task = asyncio.ensure_future(self._run_host_cmd(
+                semaphore, host_name, command, stdin, ssh_cmd_timeout))
+            host_name_of[task] = host_name
+
+        # Retrieve score for each host name, as they arrive
+        timed_out_host_names = []
+        pending = set(host_name_of)
+        try:
+            while pending:
+                if n_hosts and len(host_score_list) >= n_hosts:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=host_name_of.get):
+                    host_name = host_name_of[task]
+                    ret_code, out, latency = task.result()
+                    if ret_code != 0 and cache is not None:
+                        cache.remove(host_name)
+                    if ret_code is None:
+                        timed_out_host_names.append(host_name)
+                    elif ret_code:
+                        self.handle_event(DeadHostEvent(host_name))
                     else:
-                        try:
-                            score = rank_conf.command_out_parser(out)
-                            host_score_list.append((host_name, score))
-                        except ValueError:
-                            score = None
-                        self.handle_event(
-                            HostSelectScoreEvent(host_name, score))
-            if time() - time0 > ssh_cmd_timeout:
-                break
+                        scores = self._get_scores(out, scorer_confs)
+                        if cache is not None:
+                            cache.put_scores(host_name, scorer_confs, scores)
+                        self._score_host(
+                            host_score_list, host_name, scores, latency,
+                            rank_conf, threshold_confs)
+        finally:
+            await self._cancel_tasks(pending)
 
         # Report timed out hosts
-        for host_name, proc in sorted(host_proc_dict.items()):
+        for host_name in sorted(timed_out_host_names):
             self.handle_event(TimedOutHostEvent(host_name))
-            os.killpg(proc.pid, signal.SIGTERM)
-            proc.wait()
-
-        if not host_score_list:
-            raise NoHostSelectError()
-        host_score_list.sort(
-            key=lambda a: a[1],
-            reverse=rank_conf.scorer.SIGN < 0)
         return host_score_list
 
+    @staticmethod
+    def _get_scores(out, scorer_confs):
+        """Helper for _select_by_score. Parse command output.
+
+        Return a list of scores for scorer_confs. A score is None if it cannot
+        be parsed from the output.
+
+        """
+        scores = []
+        for scorer_conf in scorer_confs:
+            try:
+                scores.append(scorer_conf.command_out_parser(out))
+            except ValueError:
+                scores.append(None)
+        return scores
+
+    def _score_host(self, host_score_list, host_name, scores, latency,
+                    rank_conf, threshold_confs):
+        """Helper for _select_by_score. Score a host from its scores.
+
+        scores is a list of scores for threshold_confs + [rank_conf].
+        Append (host_name, score) to host_score_list if the host meets all
+        the thresholds.
+
+        """
+        for threshold_conf, score in zip(threshold_confs, scores):
+            if score is None or threshold_conf.check_score(score):
+                self.handle_event(HostThresholdNotMetEvent(
+                    host_name, threshold_conf, score))
+                return
+        score = scores[-1]
+        if score is not None:
+            host_score_list.append((host_name, score))
+        self.handle_event(HostSelectScoreEvent(host_name, score, latency))
+
+    async def _run_host_cmd(self, semaphore, host_name, command, stdin,
+                            ssh_cmd_timeout):
+        """Run a command to contact a host, within a slot of semaphore.
+
+        Return (ret_code, out, latency). ret_code is None if the command is
+        timed out, in which case the command is killed.
+
+        """
+        async with semaphore:
+            time0 = time()
+            proc = await self.popen.run_bg_async(
+                *command, stdin=stdin, preexec_fn=os.setpgrp)
+            if stdin is not None:
+                stdin = stdin.encode("UTF-8")
+            try:
+                out = (await asyncio.wait_for(
+                    proc.communicate(stdin), ssh_cmd_timeout))[0]
+            except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+                try:
+                    os.killpg(proc.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+                await proc.wait()
+                if isinstance(exc, asyncio.CancelledError):
+                    raise
+                out = None
+            self.latencies[host_name] = time() - time0
+            if out is None:
+                return None, None, self.latencies[host_name]
+            return proc.returncode, out, self.latencies[host_name]
+
+    @staticmethod
+    async def _cancel_tasks(tasks):
+        """Cancel tasks that are not done and wait for them to finish."""
+        tasks = [task for task in tasks if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
     __call__ = select
 
 
@@ -435,7 +689,10 @@ class ScorerConf(object):
 
     def check_threshold(self, out):
         """Parse command output. Return True if threshold not met."""
-        score = self.command_out_parser(out)
+        return self.check_score(self.command_out_parser(out))
+
+    def check_score(self, score):
+        """Return True if score does not meet threshold."""
         return (float(score) * self.scorer.SIGN >
                 float(self.value) * self.scorer.SIGN)
 
@@ -542,7 +799,8 @@ class FileSystemScorer(RandomScorer):
 def main():
     """Implement the "rose host-select" command."""
     opt_parser = RoseOptionParser()
-    opt_parser.add_my_options("choice", "rank_method", "thresholds", "timeout")
+    opt_parser.add_my_options(
+        "choice", "no_cache", "rank_method", "thresholds", "timeout")
     opts, args = opt_parser.parse_args()
     report = Reporter(opts.verbosity - opts.quietness)
     popen = RosePopener(event_handler=report)
@@ -552,7 +810,8 @@ def main():
             names=args,
             rank_method=opts.rank_method,
             thresholds=opts.thresholds,
-            ssh_cmd_timeout=opts.timeout)
+            ssh_cmd_timeout=opts.timeout,
+            use_cache=not opts.no_cache)
     except (NoHostError, NoHostSelectError) as exc:
         report(exc)
         if opts.debug_mode:
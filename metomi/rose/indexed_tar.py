@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+"""Write and read gzip compressed TAR files with a member index.
+
+An indexed TAR file is a normal gzip compressed TAR file, except that each
+member is compressed as a separate gzip stream. (A gzip file can be a
+concatenation of gzip streams.) A sidecar index file, at the path of the TAR
+file plus INDEX_EXT, lists the name, size, modified time, offset and length
+of the gzip stream of each regular file member in JSON.
+
+A listing can then be obtained without reading the TAR file, and a member
+can be extracted by decompressing its own gzip stream only.
+
+"""
+
+from io import BytesIO
+import json
+import os
+import tarfile
+import zlib
+
+
+INDEX_EXT = ".index"
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class _MemberGzipWriter(object):
+
+    """File-like object to compress each TAR member as a gzip stream."""
+
+    def __init__(self, handle, compress_level):
+        self.handle = handle
+        self.compress_level = compress_level
+        self.compressor = None
+        self.offset = 0  # compressed
+        self.pos = 0  # uncompressed
+        self.index = []  # [[name, size, mtime, offset, length], ...]
+
+    def start_member(self, tarinfo=None):
+        """Start a new gzip stream for tarinfo. Return tarinfo.
+
+        Used as the "filter" of TarFile.add, which is called before each
+        member is written. Call with no argument to start the gzip stream of
+        the end of archive blocks.
+
+        """
+        self.flush()
+        self.compressor = zlib.compressobj(
+            self.compress_level, zlib.DEFLATED, GZIP_WBITS)
+        if tarinfo is not None and tarinfo.isfile():
+            self.index.append(
+                [tarinfo.name, tarinfo.size, int(tarinfo.mtime), self.offset,
+                 None])
+        return tarinfo
+
+    def flush(self):
+        """End the current gzip stream, if any."""
+        if self.compressor is None:
+            return
+        self._write(self.compressor.flush())
+        self.compressor = None
+        if self.index and self.index[-1][4] is None:
+            self.index[-1][4] = self.offset - self.index[-1][3]
+
+    def tell(self):
+        """Return the uncompressed position."""
+        return self.pos
+
+    def write(self, data):
+        """Compress data into the current gzip stream."""
+        if self.compressor is None:
+            self.start_member()
+        self.pos += len(data)
+        self._write(self.compressor.compress(data))
+
+    def _write(self, data):
+        """Write compressed data."""
+        self.handle.write(data)
+        self.offset += len(data)
+
+
+def write_tar_gz(handle, names, compress_level):
+    """Write an indexed gzip compressed TAR file to handle.
+
+    handle -- A binary file object open for writing.
+    names -- A list of (name, arcname) of the paths to add.
+    compress_level -- The gzip compression level.
+
+    Return the index, a list of [name, size, mtime, offset, length] of the
+    regular file members.
+
+    """
+    writer = _MemberGzipWriter(handle, compress_level)
+    tar = tarfile.open(fileobj=writer, mode="w")
+    for name, arcname in names:
+        tar.add(name, arcname, filter=writer.start_member)
+    writer.start_member()
+    tar.close()
+    writer.flush()
+    return writer.index
+
+
+def dump_index(handle, index, size):
+    """Write index of a TAR file of size bytes to a text file handle."""
+    json.dump({"size": size, "members": index}, handle)
+
+
+def load_index(path):
+    """Load the index of the TAR file at path.
+
+    Return a list of [name, size, mtime, offset, length] of the regular file
+    members. Return None if the TAR file has no index, or if the index does
+    not appear to belong to the TAR file.
+
+    """
+    try:
+        with open(path + INDEX_EXT) as handle:
+            index = json.load(handle)
+        if index["size"] != os.stat(path).st_size:
+            return None
+        return index["members"]
+    except (KeyError, OSError, TypeError, ValueError):
+        return None
+
+
+def extract(path, name, index=None):
+    """Return the content of the member name of the TAR file at path.
+
+    If the TAR file has an index (or if index is specified), decompress the
+    gzip stream of the member only. Otherwise, read the TAR file from the
+    beginning until the member is found.
+
+    Raise KeyError if the member is not found.
+
+    """
+    if index is None:
+        index = load_index(path)
+    if index is None:
+        with tarfile.open(path, "r:gz") as tar:
+            return tar.extractfile(name).read()
+    for member_name, _, _, offset, length in index:
+        if member_name == name:
+            with open(path, "rb") as handle:
+                handle.seek(offset)
+                data = zlib.decompress(handle.read(length), GZIP_WBITS)
+            with tarfile.open(fileobj=BytesIO(data), mode="r:") as tar:
+                return tar.extractfile(tar.next()).read()
+    raise KeyError(name)
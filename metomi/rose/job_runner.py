@@ -20,6 +20,9 @@
 """A multiprocessing runner of jobs with dependencies."""
 
 import asyncio
+from heapq import heappop, heappush
+from itertools import count
+from time import time
 
 from metomi.rose.reporter import Event
 
@@ -35,6 +38,19 @@ class JobEvent(Event):
         return str(self.args[0])
 
 
+class JobTimingEvent(Event):
+    """Event raised to report the queue and run times of a completed job."""
+
+    LEVEL = Event.VV
+
+    def __str__(self):
+        job = self.args[0]
+        return "%s: dt(queue)=%.3fs, dt(run)=%.3fs" % (
+            job.name,
+            job.time_started - job.time_ready,
+            job.time_done - job.time_started)
+
+
 class JobManager(object):
     """Manage a set of JobProxy objects and their states."""
 
@@ -45,20 +61,67 @@ class JobManager(object):
         names: A list of keys in jobs to process.
                If not set or empty, process all jobs.
 
+        Ready jobs are handed out in order of their dependency depth, i.e.
+        the length of the longest chain of jobs waiting for them, so jobs
+        on the critical path are started first.
+
         """
         self.jobs = jobs
-        self.ready_jobs = []
+        self.depths = self._get_depths(jobs)
+        self.ready_jobs = []  # heap of [(-depth, index, job), ...]
+        self.ready_index = count()
         if not names:
             names = jobs.keys()
         for name in names:
-            self.ready_jobs.append(self.jobs[name])
+            self._put_ready_job(self.jobs[name])
         self.working_jobs = {}
         self.dead_jobs = []
 
+    @staticmethod
+    def _get_depths(jobs):
+        """Return a dict of {name: depth, ...} for jobs.
+
+        The depth of a job is 0 if no job is pending for it, or 1 + the
+        maximum depth of the jobs pending for it.
+
+        """
+        needed_by = {}  # {name: [name, ...], ...}
+        for job in jobs.values():
+            for dep_name in job.pending_for:
+                needed_by.setdefault(dep_name, []).append(job.name)
+        depths = {}
+        for root_name in jobs:
+            if root_name in depths:
+                continue
+            # Depth first, post-order. A provisional depth of 0 guards
+            # against cycles.
+            depths[root_name] = 0
+            stack = [(root_name, iter(needed_by.get(root_name, [])))]
+            while stack:
+                name, up_names_iter = stack[-1]
+                for up_name in up_names_iter:
+                    if up_name not in depths:
+                        depths[up_name] = 0
+                        stack.append(
+                            (up_name, iter(needed_by.get(up_name, []))))
+                        break
+                else:
+                    stack.pop()
+                    depths[name] = max(
+                        [depths[up_name] + 1
+                         for up_name in needed_by.get(name, [])] + [0])
+        return depths
+
+    def _put_ready_job(self, job):
+        """Add job to the ready jobs."""
+        job.time_ready = time()
+        heappush(self.ready_jobs, (
+            -self.depths.get(job.name, 0), next(self.ready_index), job))
+
     def get_job(self):
         """Return the next job that requires processing."""
         while self.ready_jobs:
-            job = self.ready_jobs.pop()
+            job = heappop(self.ready_jobs)[-1]
             for dep_key, dep_job in list(job.pending_for.items()):
                 if dep_job.state == dep_job.ST_DONE:
                     job.pending_for.pop(dep_key)
@@ -68,7 +131,7 @@ class JobManager(object):
                     dep_job.needed_by[job.name] = job
                     if dep_job.state is None:
                         dep_job.state = dep_job.ST_READY
-                        self.ready_jobs.append(dep_job)
+                        self._put_ready_job(dep_job)
             if job.pending_for:
                 job.state = job.ST_PENDING
             else:
@@ -103,7 +166,7 @@ class JobManager(object):
                 job.needed_by.pop(up_key)
                 up_job.pending_for.pop(job.name)
                 if not up_job.pending_for:
-                    self.ready_jobs.append(up_job)
+                    self._put_ready_job(up_job)
                     up_job.state = up_job.ST_READY
         else:
             self.dead_jobs.append(job)
@@ -139,6 +202,9 @@ class JobProxy(object):
         self.needed_by = {}
         self.state = self.ST_READY
         self.exc = None
+        self.time_ready = None
+        self.time_started = None
+        self.time_done = None
 
     def __str__(self):
         return str(self.context)
@@ -151,6 +217,8 @@ class JobProxy(object):
 class JobRunner(object):
     """Runs JobProxy objects with pool of workers."""
 
+    NPROC = 6
+
     def __init__(self, job_processor, nproc=None):
         """
         Initialise a job runner.
@@ -163,6 +231,10 @@ class JobRunner(object):
 
         """
         self.job_processor = job_processor
+        if not nproc:
+            nproc = self.NPROC
+        self.nproc = nproc
+        self.timings = {}  # {name: (dt_queue, dt_run), ...}
 
     def run(self, job_manager, *args):
         """
@@ -178,73 +250,77 @@ class JobRunner(object):
             |    |  has_jobs ?      |   No
             |    +------------------+
             |        |Yes
-            |    +---v--------------+
-            |    |Post-process any  |
-            |    |finished jobs     |
-            |    +---+--------------+
-            |        |
             |    +---v--------------------------------+
             |    |   Check for ready jobs             |
-            |    |   Add ready jobs to "awaiting"     |
-            |    +---+-------------------------^------+
-            |        |                         |
-            |    +---v---------------+         |
-            +----+ Are there any jobs|         |
-            No   | in "awaiting"?    |         |
-                 +-------------------+         |
-                     |Yes                      |
-                 +-------------------+         |
-                 | Add jobs to event |         |
-                 | loop - wait until |         |
-                 | asyncio returns   |         |
-                 | first result.     +---------+
-                 +-------------------+
+            |    |   Add ready jobs to "awaiting",    |
+            |    |   while fewer than nproc working   |
+            |    +---+--------------------------------+
+            |        |
+            |    +---v---------------+
+            |    | Add jobs to event |
+            |    | loop - wait until |
+            |    | asyncio returns   |
+            |    | first result.     |
+            |    +---+---------------+
+            |        |
+            |    +---v--------------+
+            +----+Post-process any  |
+                 |finished jobs     |
+                 +------------------+
+
+        The number of jobs running at any one time is limited by
+        self.nproc. The queue and run times of each job are recorded in
+        self.timings.
 
         """
         loop = asyncio.get_event_loop()
         loop.set_exception_handler(self.job_processor.handle_event)
-        results = {}
+        awaiting = set()
 
         while job_manager.has_jobs():
-            # Post-process all finished jobs and handle exceptions.
-            for job_proxy, result in list(results.items()):
-                results.pop(job_proxy)
-                job_proxy.exc = result.exception()
+            # Get jobs with satisfied dependencies, while there is capacity.
+            while (len(awaiting) < self.nproc and
+                    job_manager.has_ready_jobs()):
+                job = job_manager.get_job()
+                if job is None:
+                    break
+                task = loop.create_task(self._process_job(job, *args))
+                task.job = job
+                awaiting.add(task)
+            if not awaiting:
+                break
+
+            # Wait until one of the jobs completes, at which point
+            # post-process it so any jobs waiting for it become ready.
+            just_completed, awaiting = loop.run_until_complete(
+                asyncio.wait(awaiting, return_when=asyncio.FIRST_COMPLETED)
+            )
+            for task in just_completed:
+                job_proxy = task.job
+                job_proxy.exc = task.exception()
                 job_manager.put_job(job_proxy)
+                self.timings[job_proxy.name] = (
+                    job_proxy.time_started - job_proxy.time_ready,
+                    job_proxy.time_done - job_proxy.time_started)
                 if not job_proxy.exc:
                     self.job_processor.post_process_job(job_proxy, *args)
                     self.job_processor.handle_event(JobEvent(job_proxy))
                 else:
                     self.job_processor.handle_event(job_proxy.exc)
-
-            awaiting = set()
-
-            def get_ready_jobs():
-                """Get list of jobs with satisfied dependencies"""
-                while job_manager.has_ready_jobs():
-                    job = job_manager.get_job()
-                    if job is None:
-                        break
-                    task = loop.create_task(
-                        self.job_processor.process_job(job, *args))
-                    task.job = job
-                    awaiting.add(task)
-
-            get_ready_jobs()
-            while awaiting:
-                # Submit all tasks in awaiting to event loop, then wait until
-                # one of them completes, at which point check whether any more
-                # jobs have become ready and submit those.
-                just_completed, awaiting = loop.run_until_complete(
-                    asyncio.wait(awaiting, return_when=asyncio.FIRST_COMPLETED)
-                )
-                results.update({task.job: task for task in just_completed})
-                get_ready_jobs()
+                self.job_processor.handle_event(JobTimingEvent(job_proxy))
 
         dead_jobs = job_manager.get_dead_jobs()
         if dead_jobs:
             raise JobRunnerNotCompletedError(dead_jobs)
 
+    async def _process_job(self, job, *args):
+        """Process a job, recording its start and end times."""
+        job.time_started = time()
+        try:
+            return await self.job_processor.process_job(job, *args)
+        finally:
+            job.time_done = time()
+
     __call__ = run
 
 
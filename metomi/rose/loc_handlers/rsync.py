@@ -19,6 +19,8 @@
 # -----------------------------------------------------------------------------
 """A handler of locations on remote hosts."""
 
+import asyncio
+import os
 from tempfile import TemporaryFile
 from time import sleep, time
 from metomi.rose.popen import RosePopenError
@@ -33,6 +35,7 @@ class RsyncLocHandler(object):
     def __init__(self, manager):
         self.manager = manager
         self.rsync = self.manager.popen.which("rsync")
+        self.pull_batches = {}  # {loc.name: batch, ...}
 
     def can_pull(self, loc):
         """Return true if loc.name looks like a path on a remote host."""
@@ -55,67 +58,185 @@ class RsyncLocHandler(object):
         else:
             return proc.wait() == 0
 
-    def parse(self, loc, _):
+    def parse(self, loc, conf_tree):
         """Set loc.scheme, loc.loc_type, loc.paths."""
-        loc.scheme = "rsync"
-        # Attempt to obtain the checksum(s) via "ssh"
-        host, path = loc.name.split(":", 1)
-        cmd = self.manager.popen.get_cmd(
-            "ssh", host, "python3", "-", path, loc.TYPE_BLOB, loc.TYPE_TREE)
-        temp_file = TemporaryFile()
-        temp_file.write(br"""
+        exc = self.parse_many([loc], conf_tree).get(loc.name)
+        if exc is not None:
+            raise exc
+
+    @staticmethod
+    def group_locs(locs):
+        """Return a list of lists of locs, one list for each host.
+
+        Each list can be parsed by a separate call to "parse_many".
+
+        """
+        host_locs = {}  # {host: [loc, ...], ...}
+        for loc in locs:
+            host = loc.name.split(":", 1)[0]
+            host_locs.setdefault(host, [])
+            host_locs[host].append(loc)
+        return [h_locs for _, h_locs in sorted(host_locs.items())]
+
+    def parse_many(self, locs, _):
+        """Set loc.scheme, loc.loc_type, loc.paths of each loc in locs.
+
+        Obtain the checksums of the locations on each host with a single
+        "ssh" command.
+
+        Return a dict {loc.name: exception, ...} for locs that cannot be
+        parsed.
+
+        """
+        excs = {}
+        for loc in locs:
+            loc.scheme = "rsync"
+        for h_locs in self.group_locs(locs):
+            host = h_locs[0].name.split(":", 1)[0]
+            # Attempt to obtain the checksum(s) via "ssh"
+            cmd = self.manager.popen.get_cmd(
+                "ssh", host, "python3", "-", h_locs[0].TYPE_BLOB,
+                h_locs[0].TYPE_TREE,
+                *[loc.name.split(":", 1)[1] for loc in h_locs])
+            temp_file = TemporaryFile()
+            temp_file.write(br"""
 import os
 import sys
-path, str_blob, str_tree = sys.argv[1:]
-if os.path.isdir(path):
-    print(str_tree)
-    os.chdir(path)
-    for dirpath, dirnames, filenames in os.walk(path):
-        good_dirnames = []
-        for dirname in dirnames:
-            if not dirname.startswith("."):
-                good_dirnames.append(dirname)
-                name = os.path.join(dirpath, dirname)
-                print("-", "-", "-", name)
-        dirnames[:] = good_dirnames
-        for filename in filenames:
-            if filename.startswith("."):
-                continue
-            name = os.path.join(dirpath, filename)
-            stat = os.stat(name)
-            print(oct(stat.st_mode), stat.st_mtime, stat.st_size, name)
-elif os.path.isfile(path):
-    print(str_blob)
-    stat = os.stat(path)
-    print(oct(stat.st_mode), stat.st_mtime, stat.st_size, path)
+str_blob, str_tree = sys.argv[1:3]
+for i, path in enumerate(sys.argv[3:]):
+    if os.path.isdir(path):
+        print(i, str_tree)
+        for dirpath, dirnames, filenames in os.walk(path):
+            good_dirnames = []
+            for dirname in dirnames:
+                if not dirname.startswith("."):
+                    good_dirnames.append(dirname)
+                    name = os.path.join(dirpath, dirname)
+                    print("-", "-", "-", name)
+            dirnames[:] = good_dirnames
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                name = os.path.join(dirpath, filename)
+                stat = os.stat(name)
+                print(oct(stat.st_mode), stat.st_mtime, stat.st_size, name)
+    elif os.path.isfile(path):
+        print(i, str_blob)
+        stat = os.stat(path)
+        print(oct(stat.st_mode), stat.st_mtime, stat.st_size, path)
 """)
-        temp_file.seek(0)
-        out = self.manager.popen(*cmd, stdin=temp_file)[0]
-        lines = out.splitlines()
+            temp_file.seek(0)
+            try:
+                out = self.manager.popen(*cmd, stdin=temp_file)[0]
+            except RosePopenError as exc:
+                for loc in h_locs:
+                    excs[loc.name] = exc
+                continue
+            # Lines of each location, after a line with "INDEX TYPE".
+            loc_lines = {}
+            lines = None
+            for line in out.decode().splitlines():
+                items = line.split(None, 3)
+                if len(items) == 2:
+                    lines = loc_lines.setdefault(int(items[0]), [items[1]])
+                elif lines is not None:
+                    lines.append(items)
+            for i, loc in enumerate(h_locs):
+                try:
+                    self._parse_lines(loc, loc_lines.get(i))
+                except ValueError as exc:
+                    excs[loc.name] = exc
+        return excs
+
+    @staticmethod
+    def _parse_lines(loc, lines):
+        """Set loc.loc_type, loc.paths from output lines of a location."""
         if not lines or lines[0] not in [loc.TYPE_BLOB, loc.TYPE_TREE]:
             raise ValueError(loc.name)
         loc.loc_type = lines.pop(0)
         if loc.loc_type == loc.TYPE_BLOB:
-            line = lines.pop(0)
-            access_mode, mtime, size, name = line.split(None, 3)
+            access_mode, mtime, size, name = lines.pop(0)
             fake_sum = "source=%s:mtime=%s:size=%s" % (
                 name, mtime, size)
-            loc.add_path(loc.BLOB, fake_sum, int(access_mode))
+            loc.add_path(loc.BLOB, fake_sum, int(access_mode, 8))
         else:  # if loc.loc_type == loc.TYPE_TREE:
-            for line in lines:
-                access_mode, mtime, size, name = line.split(None, 3)
+            for access_mode, mtime, size, name in lines:
                 if mtime == "-" or size == "-":
                     fake_sum = None
                 else:
-                    access_mode = int(access_mode)
+                    access_mode = int(access_mode, 8)
                     fake_sum = "source=%s:mtime=%s:size=%s" % (
                         name, mtime, size)
                 loc.add_path(name, fake_sum, access_mode)
 
+    def set_pull_locs(self, locs, _):
+        """Set the locations about to be pulled.
+
+        Locations on the same host are pulled together with a single
+        "rsync --files-from=-", into a cache shared by them. Batches of
+        previous calls that have not been pulled are discarded, so call with
+        an empty list at the end of a run.
+
+        """
+        self.pull_batches = {}
+        for h_locs in self.group_locs(locs):
+            pull_locs = [
+                loc for loc in h_locs
+                if not loc.name.split(":", 1)[1].startswith("~")]
+            if len(pull_locs) > 1:
+                batch = {"locs": pull_locs, "future": None, "cache": None}
+                for loc in pull_locs:
+                    self.pull_batches[loc.name] = batch
+
     async def pull(self, loc, _):
         """Run "rsync" to pull files or directories of loc to its cache."""
+        batch = self.pull_batches.pop(loc.name, None)
+        if batch is not None:
+            if batch["future"] is None:
+                batch["cache"] = loc.cache
+                batch["future"] = asyncio.ensure_future(
+                    self._pull_batch(batch["locs"], batch["cache"]))
+            await batch["future"]
+            loc.cache = self._get_batch_cache(batch["cache"], loc)
+            return
         name = loc.name
         if loc.loc_type == loc.TYPE_TREE:
             name = loc.name + "/"
         cmd = self.manager.popen.get_cmd("rsync", name, loc.cache)
         await self.manager.popen.run_ok_async(*cmd)
+
+    @staticmethod
+    def _get_batch_cache(cache, loc):
+        """Return the location of loc in the shared cache of its batch.
+
+        Absolute paths are pulled under "cache/root/", and paths relative to
+        the home directory are pulled under "cache/home/".
+
+        """
+        path = loc.name.split(":", 1)[1]
+        if path.startswith("/"):
+            return os.path.join(cache, "root", path.lstrip("/"))
+        return os.path.join(cache, "home", path)
+
+    async def _pull_batch(self, locs, cache):
+        """Run a single "rsync" to pull locs on the same host to cache.
+
+        Paths of locs are relative to the root directory if they are
+        absolute, or to the home directory otherwise.
+
+        """
+        host = locs[0].name.split(":", 1)[0]
+        for is_abs, root, dest in [
+                (True, host + ":/", os.path.join(cache, "root")),
+                (False, host + ":", os.path.join(cache, "home"))]:
+            paths = []
+            for loc in locs:
+                path = loc.name.split(":", 1)[1]
+                if path.startswith("/") == is_abs:
+                    paths.append(path.lstrip("/") + "\n")
+            if not paths:
+                continue
+            os.makedirs(dest, exist_ok=True)
+            cmd = self.manager.popen.get_cmd(
+                "rsync", "--recursive", "--files-from=-", root, dest)
+            await self.manager.popen.run_ok_async(*cmd, stdin="".join(paths))
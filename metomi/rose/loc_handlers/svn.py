@@ -29,6 +29,7 @@ class SvnLocHandler(object):
 
     FCM = "fcm"
     SVN = "svn"
+    INFO_MAX_ARGS = 100
     SCHEMES = [SVN, "svn+ssh", FCM]
     WEB_SCHEMES = ["http", "https", "file"]
 
@@ -57,7 +58,44 @@ class SvnLocHandler(object):
             self.svn, "info", "--xml", loc.name)[0:2]
         if ret_code:
             raise ValueError(loc.name)
-        info_entry = SvnInfoXMLParser()(xml_str)
+        self._set_info(loc, SvnInfoXMLParser()(xml_str))
+
+    def parse_many(self, locs, conf_tree):
+        """Parse locs, with up to INFO_MAX_ARGS in each "svn info" command.
+
+        Return a dict {loc.name: exception, ...} for locs that cannot be
+        parsed.
+
+        """
+        excs = {}
+        for i in range(0, len(locs), self.INFO_MAX_ARGS):
+            batch_locs = locs[i:i + self.INFO_MAX_ARGS]
+            for loc in batch_locs:
+                loc.scheme = self.SCHEMES[0]
+            ret_code, xml_str = self.manager.popen.run(
+                self.svn, "info", "--xml",
+                *[loc.name for loc in batch_locs])[0:2]
+            info_entries = []
+            if not ret_code:
+                try:
+                    info_entries = SvnInfoXMLParser().parse_entries(xml_str)
+                except xml.parsers.expat.ExpatError:
+                    pass
+            if len(info_entries) == len(batch_locs):
+                for loc, info_entry in zip(batch_locs, info_entries):
+                    self._set_info(loc, info_entry)
+                continue
+            # Some locations are bad, parse one by one to find out.
+            for loc in batch_locs:
+                try:
+                    self.parse(loc, conf_tree)
+                except ValueError as exc:
+                    excs[loc.name] = exc
+        return excs
+
+    @staticmethod
+    def _set_info(loc, info_entry):
+        """Set loc.loc_type, loc.real_name, loc.key from an info entry."""
         if info_entry["kind"] == "dir":
             loc.loc_type = loc.TYPE_TREE
         else:  # if info_entry ["kind"] == "file":
@@ -74,7 +112,7 @@ class SvnLocHandler(object):
 
 
 class SvnInfoXMLParser(object):
-    """An XML parser tailored for a single entry of "svn info --xml"."""
+    """An XML parser tailored for the entries of "svn info --xml"."""
 
     def __init__(self):
         self.parser = xml.parsers.expat.ParserCreate()
@@ -87,17 +125,31 @@ class SvnInfoXMLParser(object):
 
         Return a dict, where the keys represent full hierarchy of the values in
         the form "elements:..." or "elements:...:attr" and the values are the
-        text value of the element or the attribute.
+        text value of the element or the attribute, for the first entry.
 
         """
-        self.state = {"entry": {}, "index": None, "stack": []}
-        self.parser.Parse(text)
-        return self.state["entry"]
+        entries = self.parse_entries(text)
+        if entries:
+            return entries[0]
+        return {}
 
     __call__ = parse
 
+    def parse_entries(self, text):
+        """Parse text containing a valid XML document.
+
+        Return a list of dicts, one for each entry, as in "parse".
+
+        """
+        self.state = {"entries": [], "entry": {}, "index": None, "stack": []}
+        self.parser.Parse(text)
+        return self.state["entries"]
+
     def _handle_tag0(self, name, attr_map):
         self.state["stack"].append(name)
+        if len(self.state["stack"]) == 2:
+            self.state["entry"] = {}
+            self.state["entries"].append(self.state["entry"])
         self.state["index"] = ":".join(self.state["stack"][2:])
         if self.state["entry"]:
             self.state["entry"][self.state["index"]] = ""
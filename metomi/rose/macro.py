@@ -43,12 +43,16 @@ import ast
 import copy
 import glob
 import inspect
+import multiprocessing
 import os
 import re
 import sys
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from functools import cmp_to_key
 from importlib.machinery import SourceFileLoader
+from types import MappingProxyType
 
 import metomi.rose.config
 import metomi.rose.config_tree
@@ -104,6 +108,11 @@ VALIDATE_METHOD = "validate"
 REPORT_METHOD = "report"
 VERBOSE_LIST = "{0} - ({1}) - {2}"
 
+# Metadata indexes in use, see metadata_index.
+_METADATA_INDEX_MAP = {}
+# Validator macro jobs for worker processes, see validate_config_map.
+_VALIDATOR_JOBS = []
+
 
 class MacroFinishNothingEvent(metomi.rose.reporter.Event):
 
@@ -868,13 +877,93 @@ def report_config(app_config, meta_config, run_macro_list, modules,
                   validate_mode=True):
     """Run report/validator custom macros on the config and return problems
     (in the case of validator macros)."""
-    if optional_values is None:
-        optional_values = {}
     macro_problem_map = {}
     if validate_mode:
         macro_method = VALIDATE_METHOD
     else:
         macro_method = REPORT_METHOD
+    for macro_name, macro_meth, res in _get_macro_calls(
+            run_macro_list, modules, macro_info_tuples, macro_method,
+            opt_non_interactive, optional_config_name, optional_values):
+        if validate_mode:
+            problem_list = _call_validator(
+                macro_name, macro_meth, app_config, meta_config, res)
+            if problem_list:
+                macro_problem_map.update({macro_name: problem_list})
+        else:
+            macro_meth(app_config, meta_config, **res)
+    if validate_mode:
+        return macro_problem_map
+
+
+def validate_config_map(config_map, meta_config, run_macro_list, modules,
+                        macro_info_tuples, opt_non_interactive=False,
+                        n_jobs=None):
+    """Run validator macros on each configuration in config_map.
+
+    Return a list of (conf_key, macro_problem_map) for the configurations
+    in config_map, in order, where each macro_problem_map is as returned by
+    report_config.
+
+    If n_jobs is greater than 1, run the validator macro calls for all the
+    (configuration, macro) pairs in a pool of n_jobs processes. The calls
+    and any user prompts for optional macro arguments are set up in this
+    process, in the same order as for a serial run, and the results are
+    collected in that order, so the return value is the same either way.
+    (Changes made by a validator macro to a configuration are not seen by
+    later macros in this mode, but validator macros should not make any.)
+
+    """
+    if (n_jobs is None or n_jobs <= 1 or
+            "fork" not in multiprocessing.get_all_start_methods()):
+        optional_values = {}
+        return [
+            (conf_key, report_config(
+                config, meta_config, run_macro_list, modules,
+                macro_info_tuples, opt_non_interactive,
+                optional_config_name=conf_key,
+                optional_values=optional_values, validate_mode=True))
+            for conf_key, config in config_map.items()]
+    optional_values = {}
+    jobs = []
+    for conf_key, config in config_map.items():
+        for macro_name, macro_meth, res in _get_macro_calls(
+                run_macro_list, modules, macro_info_tuples, VALIDATE_METHOD,
+                opt_non_interactive, conf_key, optional_values):
+            jobs.append(
+                (conf_key, macro_name, macro_meth, config, meta_config, res))
+    # Worker processes are forked, so they inherit the jobs, including any
+    # custom macro modules, without pickling them.
+    _VALIDATOR_JOBS[:] = jobs
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        with ProcessPoolExecutor(
+                max_workers=min(n_jobs, len(jobs) or 1),
+                mp_context=multiprocessing.get_context("fork")) as executor:
+            problem_lists = list(
+                executor.map(_run_validator_job, range(len(jobs))))
+    finally:
+        del _VALIDATOR_JOBS[:]
+    macro_problem_maps = dict((conf_key, {}) for conf_key in config_map)
+    for job, problem_list in zip(jobs, problem_lists):
+        if problem_list:
+            conf_key, macro_name = job[0:2]
+            macro_problem_maps[conf_key].update({macro_name: problem_list})
+    return list(macro_problem_maps.items())
+
+
+def _get_macro_calls(run_macro_list, modules, macro_info_tuples,
+                     macro_method, opt_non_interactive=False,
+                     optional_config_name=None, optional_values=None):
+    """Generate (macro_name, macro_meth, res) for macros in run_macro_list.
+
+    macro_meth is the macro_method method of a new instance of the macro,
+    and res the dict of optional arguments to call it with.
+
+    """
+    if optional_values is None:
+        optional_values = {}
     for module_name, class_name, method, _ in macro_info_tuples:
         macro_name = ".".join([module_name, class_name])
         if macro_name in run_macro_list and method == macro_method:
@@ -898,16 +987,20 @@ def report_config(app_config, meta_config, run_macro_list, modules,
                 if optionals:
                     update_optional_values(res, optionals, optional_values,
                                            optional_config_name)
-            if validate_mode:
-                problem_list = macro_meth(app_config, meta_config, **res)
-                if not isinstance(problem_list, list):
-                    raise ValueError(ERROR_RETURN_VALUE.format(macro_name))
-                if problem_list:
-                    macro_problem_map.update({macro_name: problem_list})
-            else:
-                macro_meth(app_config, meta_config, **res)
-    if validate_mode:
-        return macro_problem_map
+            yield macro_name, macro_meth, res
+
+
+def _call_validator(macro_name, macro_meth, config, meta_config, res):
+    """Call a validator macro method and return its list of problems."""
+    problem_list = macro_meth(config, meta_config, **res)
+    if not isinstance(problem_list, list):
+        raise ValueError(ERROR_RETURN_VALUE.format(macro_name))
+    return problem_list
+
+
+def _run_validator_job(index):
+    """Run a validator macro job in a worker process of a process pool."""
+    return _call_validator(*_VALIDATOR_JOBS[index][1:])
 
 
 def update_optional_values(res, optionals, optional_values,
@@ -1048,6 +1141,32 @@ def get_metadata_for_config_id(setting_id, meta_config):
 
             test_cleanup(['rose-app.conf', 'meta/rose-meta.conf', 'meta'])
 
+    """
+    index = _METADATA_INDEX_MAP.get(id(meta_config))
+    if index is not None:
+        return index.get(setting_id)
+    return _get_metadata_for_config_id(
+        setting_id, lambda search_id: _get_meta_props(meta_config, search_id))
+
+
+def _get_meta_props(meta_config, search_id):
+    """Return the non-ignored properties of a metadata section, or None."""
+    node = meta_config.get([search_id], no_ignore=True)
+    if node is None:
+        return None
+    props = {}
+    for opt, opt_node in node.value.items():
+        if not opt_node.is_ignored():
+            props[opt] = opt_node.value
+    return props
+
+
+def _get_metadata_for_config_id(setting_id, get_props):
+    """Implement get_metadata_for_config_id.
+
+    get_props should return the metadata properties for a normalised id
+    (duplicate indices stripped) as a dict, or None if there are none.
+
     """
     metadata = {}
     if metomi.rose.CONFIG_DELIMITER in setting_id:
@@ -1060,12 +1179,10 @@ def get_metadata_for_config_id(setting_id, meta_config):
     no_modifier_id = REC_MODIFIER.sub("", search_id)
     if no_modifier_id != search_id:
         # There is a modifier e.g. namelist:foo{bar}.
-        node = meta_config.get([no_modifier_id], no_ignore=True)
+        props = get_props(no_modifier_id)
         # Get metadata for namelist:foo
-        if node is not None:
-            for opt, opt_node in node.value.items():
-                if not opt_node.is_ignored():
-                    metadata.update({opt: opt_node.value})
+        if props is not None:
+            metadata.update(props)
             if option is None and metomi.rose.META_PROP_TITLE in metadata:
                 # Handle section modifier titles
                 modifier = search_id.replace(no_modifier_id, "")
@@ -1074,12 +1191,10 @@ def get_metadata_for_config_id(setting_id, meta_config):
                     metomi.rose.META_PROP_DUPLICATE in metadata):
                 # foo{bar}(1) cannot inherit duplicate from foo.
                 metadata.pop(metomi.rose.META_PROP_DUPLICATE)
-    node = meta_config.get([search_id], no_ignore=True)
+    props = get_props(search_id)
     # If modifier, get metadata for namelist:foo{bar}
-    if node is not None:
-        for opt, opt_node in node.value.items():
-            if not opt_node.is_ignored():
-                metadata.update({opt: opt_node.value})
+    if props is not None:
+        metadata.update(props)
     if metomi.rose.META_PROP_TITLE in metadata:
         # Handle duplicate (indexed) settings sharing a title
         if option is None:
@@ -1099,12 +1214,75 @@ def get_metadata_for_config_id(setting_id, meta_config):
     return metadata
 
 
+class MetadataIndex(object):
+
+    """Index of the metadata properties in a metadata configuration.
+
+    The non-ignored properties of each metadata section are extracted once,
+    into read-only maps keyed by section id. The metadata for each setting
+    id is then worked out from these on first request, and memoised.
+
+    The index is a snapshot: it does not see later changes to meta_config.
+
+    """
+
+    def __init__(self, meta_config):
+        self.meta_config = meta_config
+        self.props_map = {}
+        if not meta_config.is_ignored():
+            for key, node in meta_config.value.items():
+                if isinstance(node.value, dict) and not node.is_ignored():
+                    self.props_map[key] = MappingProxyType(dict(
+                        (opt, opt_node.value)
+                        for opt, opt_node in node.value.items()
+                        if not opt_node.is_ignored()))
+        self.metadata_map = {}
+
+    def get(self, setting_id):
+        """Return a new dict of metadata properties for a setting id.
+
+        See get_metadata_for_config_id.
+
+        """
+        try:
+            metadata = self.metadata_map[setting_id]
+        except KeyError:
+            metadata = MappingProxyType(_get_metadata_for_config_id(
+                setting_id, self.props_map.get))
+            self.metadata_map[setting_id] = metadata
+        return dict(metadata)
+
+
+@contextmanager
+def metadata_index(meta_config):
+    """Context manager to look up metadata in meta_config via an index.
+
+    Within the context, get_metadata_for_config_id for meta_config uses a
+    MetadataIndex, so metadata is only worked out once for each setting id.
+    meta_config should not be modified within the context.
+
+    """
+    if meta_config is None or id(meta_config) in _METADATA_INDEX_MAP:
+        yield
+        return
+    _METADATA_INDEX_MAP[id(meta_config)] = MetadataIndex(meta_config)
+    try:
+        yield
+    finally:
+        del _METADATA_INDEX_MAP[id(meta_config)]
+
+
 def run_macros(config_map, meta_config, config_name, macro_names,
                opt_conf_dir=None, opt_fix=False,
                opt_non_interactive=False, opt_output_dir=None,
                opt_validate_all=False, opt_transform_all=False, verbosity=None,
-               no_warn=False, default_only=False):
-    """Run standard or custom macros for a configuration."""
+               no_warn=False, default_only=False, n_jobs=None):
+    """Run standard or custom macros for a configuration.
+
+    If n_jobs is greater than 1, run validator macros in a pool of n_jobs
+    processes. See validate_config_map.
+
+    """
 
     reporter = metomi.rose.reporter.Reporter(verbosity)
 
@@ -1177,59 +1355,59 @@ def run_macros(config_map, meta_config, config_name, macro_names,
 
     ret_code = 0
 
-    # Run any validator macros.
-    if VALIDATE_METHOD in macros_by_type:
-        new_combined_config_map = combine_opt_config_map(config_map)
-        macro_config_problems_map = {}
-        optional_values = {}
-        for conf_key, config in new_combined_config_map.items():
-            config_problems_map = report_config(
-                config, meta_config, macros_by_type[VALIDATE_METHOD], modules,
-                macro_tuples, opt_non_interactive,
-                optional_config_name=conf_key, optional_values=optional_values,
-                validate_mode=True
-            )
-            if config_problems_map:
-                ret_code = 1
-            for macro, problem_list in config_problems_map.items():
-                macro_config_problems_map.setdefault(macro, {})
-                problem_list.sort(key=cmp_to_key(report_sort))
-                macro_config_problems_map[macro][conf_key] = problem_list
-        problem_macros = list(macro_config_problems_map)
-        problem_macros.sort()
-        for macro_name in problem_macros:
-            config_problems_map = macro_config_problems_map[macro_name]
-            method_id = VALIDATE_METHOD.upper()[0]
-            macro_id = MACRO_OUTPUT_ID.format(method_id, macro_name)
-            reporter(
-                get_reports_as_text(
-                    config_problems_map, macro_id, is_from_transform=False),
-                level=reporter.V, kind=reporter.KIND_ERR, prefix=""
-            )
+    # Share one metadata index between all macros.
+    with metadata_index(meta_config):
+        # Run any validator macros.
+        if VALIDATE_METHOD in macros_by_type:
+            new_combined_config_map = combine_opt_config_map(config_map)
+            macro_config_problems_map = {}
+            for conf_key, config_problems_map in validate_config_map(
+                    new_combined_config_map, meta_config,
+                    macros_by_type[VALIDATE_METHOD], modules, macro_tuples,
+                    opt_non_interactive, n_jobs=n_jobs):
+                if config_problems_map:
+                    ret_code = 1
+                for macro, problem_list in config_problems_map.items():
+                    macro_config_problems_map.setdefault(macro, {})
+                    problem_list.sort(key=cmp_to_key(report_sort))
+                    macro_config_problems_map[macro][conf_key] = problem_list
+            problem_macros = list(macro_config_problems_map)
+            problem_macros.sort()
+            for macro_name in problem_macros:
+                config_problems_map = macro_config_problems_map[macro_name]
+                method_id = VALIDATE_METHOD.upper()[0]
+                macro_id = MACRO_OUTPUT_ID.format(method_id, macro_name)
+                reporter(
+                    get_reports_as_text(
+                        config_problems_map, macro_id,
+                        is_from_transform=False),
+                    level=reporter.V, kind=reporter.KIND_ERR, prefix=""
+                )
 
-    # Run any report macros.
-    if REPORT_METHOD in macros_by_type:
-        new_combined_config_map = combine_opt_config_map(config_map)
-        optional_values = {}
-        for conf_key, config in new_combined_config_map.items():
-            report_config(
-                config, meta_config, macros_by_type[REPORT_METHOD], modules,
-                macro_tuples, opt_non_interactive,
-                optional_config_name=conf_key, optional_values=optional_values,
-                validate_mode=False
-            )
+        # Run any report macros.
+        if REPORT_METHOD in macros_by_type:
+            new_combined_config_map = combine_opt_config_map(config_map)
+            optional_values = {}
+            for conf_key, config in new_combined_config_map.items():
+                report_config(
+                    config, meta_config, macros_by_type[REPORT_METHOD],
+                    modules, macro_tuples, opt_non_interactive,
+                    optional_config_name=conf_key,
+                    optional_values=optional_values,
+                    validate_mode=False
+                )
 
-    # Run any transform macros.
-    no_changes = True
-    if TRANSFORM_METHOD in macros_by_type:
-        no_changes = no_changes and _run_transform_macros(
-            macros_by_type[TRANSFORM_METHOD],
-            config_name, config_map, meta_config, modules,
-            macro_tuples,
-            opt_non_interactive=opt_non_interactive,
-            opt_conf_dir=opt_conf_dir,
-            opt_output_dir=opt_output_dir,
-            reporter=reporter)
+        # Run any transform macros.
+        no_changes = True
+        if TRANSFORM_METHOD in macros_by_type:
+            no_changes = no_changes and _run_transform_macros(
+                macros_by_type[TRANSFORM_METHOD],
+                config_name, config_map, meta_config, modules,
+                macro_tuples,
+                opt_non_interactive=opt_non_interactive,
+                opt_conf_dir=opt_conf_dir,
+                opt_output_dir=opt_output_dir,
+                reporter=reporter)
 
     if not ret_code and no_changes:
         reporter(MacroFinishNothingEvent())
@@ -1334,16 +1512,28 @@ def handle_transform(config_map, new_config_map, change_map, macro_id,
 
 
 def combine_opt_config_map(config_map):
-    """Combine optional configurations with a main configuration."""
+    """Combine optional configurations with a main configuration.
+
+    The main configuration is deep copied, so config_map is never modified
+    via the combined configurations. Each other combined configuration is
+    a copy-on-write overlay of an optional configuration on that copy: only
+    the nodes modified by the optional configuration (and their ancestors)
+    are copied, the rest are shared with the copy of the main
+    configuration.
+
+    """
     new_combined_config_map = {}
-    main_config = config_map[None]
+    main_config = copy.deepcopy(config_map[None])
     for conf_key, config in config_map.items():
         if conf_key is None:
-            new_combined_config_map[None] = copy.deepcopy(config)
+            new_combined_config_map[None] = main_config
             continue
-        new_config = copy.deepcopy(main_config)
+        new_config = metomi.rose.config.ConfigNode(
+            dict(main_config.value), main_config.state,
+            list(main_config.comments))
         for keylist, subnode in config.walk():
-            old_subnode = new_config.get(keylist)
+            old_subnode = _get_own_config_node(
+                new_config, main_config, keylist)
             if (isinstance(subnode.value, dict) and
                     old_subnode is not None and
                     isinstance(old_subnode.value, dict)):
@@ -1358,6 +1548,39 @@ def combine_opt_config_map(config_map):
     return new_combined_config_map
 
 
+def _get_own_config_node(config, main_config, keylist):
+    """Return the node of config at keylist, copied from main_config.
+
+    Helper for combine_opt_config_map. Where config shares a node at (or
+    above) keylist with main_config, replace it in config with a shallow
+    copy, so it can be modified without modifying main_config.
+
+    Return None if there is no node at keylist.
+
+    """
+    node = config
+    main_node = main_config
+    for key in keylist:
+        if not key:
+            continue
+        if not isinstance(node.value, dict) or key not in node.value:
+            return None
+        sub_node = node.value[key]
+        main_sub_node = None
+        if main_node is not None and isinstance(main_node.value, dict):
+            main_sub_node = main_node.value.get(key)
+        if sub_node is main_sub_node:
+            value = sub_node.value
+            if isinstance(value, dict):
+                value = dict(value)
+            sub_node = metomi.rose.config.ConfigNode(
+                value, sub_node.state, list(sub_node.comments))
+            node.value[key] = sub_node
+        node = sub_node
+        main_node = main_sub_node
+    return node
+
+
 def _run_transform_macros(macros, config_name, config_map, meta_config,
                           modules, macro_tuples, opt_non_interactive=False,
                           opt_conf_dir=None, opt_output_dir=None,
@@ -1533,7 +1756,8 @@ def parse_macro_args(argv=None):
     """Parse options/arguments for rose macro and upgrade."""
     opt_parser = RoseOptionParser()
     options = ["conf_dir", "meta_path", "non_interactive", "output_dir",
-               "fix", "validate_all", "no_warn", "suite_only", "transform_all"]
+               "fix", "validate_all", "no_warn", "suite_only", "transform_all",
+               "jobs"]
     opt_parser.add_my_options(*options)
     if argv is None:
         opts, args = opt_parser.parse_args()
@@ -1668,7 +1892,8 @@ def main():
             opts.fix, opts.non_interactive, opts.output_dir,
             opts.validate_all, opts.transform_all, verbosity,
             no_warn=opts.no_warn,
-            default_only=cur_conf_type == metomi.rose.INFO_CONFIG_NAME
+            default_only=cur_conf_type == metomi.rose.INFO_CONFIG_NAME,
+            n_jobs=opts.jobs
         ))
 
     # Fail if any macro failed.
@@ -186,15 +186,98 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
                              (this\(\d+\))   (?# 'this' element)
                              (?:\W|$)        (?# Break or end)""", re.X)
     REC_VALUE = re.compile(r'("[^"]*")')
+    TRACE_CONST = "const"
+    TRACE_ID = "id"
+    TRACE_LEN = "len"
+    TRACE_THIS = "this"
+    TRACE_VALUE = "value"
+    MAX_CACHE_SIZE = 100000
+
+    # Compiled rules, shared by all instances.
+    # {(rule, setting_id): (template, trace), ...}
+    _compiled_rules = {}
+    # {rule_template_str: jinja2.Template, ...}
+    _templates = {}
 
     def evaluate_rule(self, rule, setting_id, config, meta_config):
-        """Evaluate the logic in the provided rule based on config values."""
-        rule_template_str, rule_id_values = self._process_rule(
-            rule, setting_id, config, meta_config)
-        template = jinja2.Template(rule_template_str)
+        """Evaluate the logic in the provided rule based on config values.
+
+        The pre-processing of a rule into a Jinja2 template is recorded as a
+        trace of config lookups and substitutions, and the compiled template
+        is cached, for each (rule, setting_id). Subsequent evaluations only
+        redo the config lookups, provided that the values lead to the same
+        substitutions, e.g. arrays of the same lengths in "any", "all" and
+        "len". Otherwise, the rule is pre-processed again.
+
+        """
+        key = (rule, setting_id)
+        rule_id_values = None
+        try:
+            template, trace = self._compiled_rules[key]
+        except KeyError:
+            pass
+        else:
+            rule_id_values = self._replay_rule(
+                trace, setting_id, config, meta_config)
+        if rule_id_values is None:
+            trace = []
+            rule_template_str, rule_id_values = self._process_rule(
+                rule, setting_id, config, meta_config, trace=trace)
+            template = self._get_template(rule_template_str)
+            if len(self._compiled_rules) >= self.MAX_CACHE_SIZE:
+                self._compiled_rules.clear()
+            self._compiled_rules[key] = (template, trace)
         return_string = template.render(rule_id_values)
         return ast.literal_eval(return_string)
 
+    def _get_template(self, rule_template_str):
+        """Return a (cached) jinja2.Template for rule_template_str."""
+        try:
+            return self._templates[rule_template_str]
+        except KeyError:
+            if len(self._templates) >= self.MAX_CACHE_SIZE:
+                self._templates.clear()
+            template = jinja2.Template(rule_template_str)
+            self._templates[rule_template_str] = template
+            return template
+
+    def _replay_rule(self, trace, setting_id, config, meta_config):
+        """Redo the config lookups of a trace recorded by _process_rule.
+
+        Return the map of variables for the template of the trace. Return
+        None if the values lead to different substitutions.
+
+        """
+        local_map = {}
+        for item_type, item, key, is_new in trace:
+            if item_type == self.TRACE_CONST:
+                local_map[key] = item
+                continue
+            if item_type == self.TRACE_VALUE:
+                value_string = item
+            else:
+                value_string = self._get_value_from_id(
+                    item, config, meta_config, setting_id)
+            if item_type == self.TRACE_LEN:
+                array_value = metomi.rose.variable.array_split(
+                    str(value_string))
+                if len(array_value) != key:
+                    return None
+                continue
+            if item_type == self.TRACE_THIS:
+                local_map[key] = value_string
+                continue
+            for old_key, value in local_map.items():
+                if value == value_string:
+                    if is_new or old_key != key:
+                        return None
+                    break
+            else:
+                if not is_new:
+                    return None
+                local_map[key] = value_string
+        return local_map
+
     def evaluate_rule_id_usage(self, rule, setting_id, meta_config):
         """Return a set of setting ids referenced in the provided rule."""
         log_ids = set([])
@@ -203,8 +286,15 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
         return log_ids
 
     def _process_rule(self, rule, setting_id, config, meta_config,
-                      log_ids=None):
-        """Pre-process the provided rule into valid jinja2."""
+                      log_ids=None, trace=None):
+        """Pre-process the provided rule into valid jinja2.
+
+        If trace is a list, append to it a (type, item, key, is_new) tuple
+        for each config lookup and substitution, for _replay_rule.
+
+        """
+        if trace is None:
+            trace = []
         if log_ids is None:
             get_value_from_id = self._get_value_from_id
         else:
@@ -218,6 +308,7 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
         # Start processing out our additional syntax.
         local_map = {"this": get_value_from_id(
             setting_id, config, meta_config, setting_id)}
+        trace.append((self.TRACE_THIS, setting_id, "this", True))
         value_id_count = -1
         sci_num_count = -1
 
@@ -231,6 +322,8 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
                     var_id, config, meta_config, setting_id)
                 array_value = metomi.rose.variable.array_split(
                     str(setting_value))
+                trace.append(
+                    (self.TRACE_LEN, var_id, len(array_value), False))
                 new_string = start + "("
                 for elem_num in range(1, len(array_value) + 1):
                     new_string += self.ARRAY_EXPR.format(var_id, elem_num,
@@ -250,6 +343,7 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
             setting_value = get_value_from_id(
                 var_id, config, meta_config, setting_id)
             array_value = metomi.rose.variable.array_split(str(setting_value))
+            trace.append((self.TRACE_LEN, var_id, len(array_value), False))
             new_string = start + str(len(array_value)) + end
             rule = self.REC_LEN_FUNC.sub(new_string, rule, count=1)
 
@@ -258,18 +352,22 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
             sci_num_count += 1
             key = self.INTERNAL_ID_SCI_NUM.format(sci_num_count)
             local_map[key] = self._evaluate(search_result)
+            trace.append((self.TRACE_CONST, local_map[key], key, True))
             rule = rule.replace(search_result, key, 1)
 
         # Strings into proper string variables.
         for search_result in self.REC_VALUE.findall(rule):
             value_string = search_result.strip('"')
+            is_new = False
             for key, value in local_map.items():
                 if value == value_string:
                     break
             else:
+                is_new = True
                 value_id_count += 1
                 key = self.INTERNAL_ID_VALUE.format(value_id_count)
                 local_map[key] = value_string
+            trace.append((self.TRACE_VALUE, value_string, key, is_new))
             rule = rule.replace(search_result, key, 1)
 
         # Replace 'this' id with the cast value.
@@ -277,13 +375,16 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
             proper_id = search_result.replace("this", setting_id)
             value_string = get_value_from_id(
                 proper_id, config, meta_config, setting_id)
+            is_new = False
             for key, value in local_map.items():
                 if value == value_string:
                     break
             else:
+                is_new = True
                 x_id_num_str = search_result.replace("this", "").strip('()')
                 key = self.INTERNAL_ID_THIS_SETTING.format(x_id_num_str)
                 local_map[key] = value_string
+            trace.append((self.TRACE_ID, proper_id, key, is_new))
             rule = rule.replace(search_result, key, 1)
 
         # Replace ids (namelist:foo=bar) with their cast values.
@@ -291,13 +392,16 @@ class RuleEvaluator(metomi.rose.macro.MacroBase):
         for search_result in self.REC_CONFIG_ID.findall(rule):
             value_string = get_value_from_id(
                 search_result, config, meta_config, setting_id)
+            is_new = False
             for key, value in local_map.items():
                 if value == value_string:
                     break
             else:
+                is_new = True
                 config_id_count += 1
                 key = self.INTERNAL_ID_SETTING.format(config_id_count)
                 local_map[key] = value_string
+            trace.append((self.TRACE_ID, search_result, key, is_new))
             rule = rule.replace(search_result, key, 1)
 
         # Return the now valid Jinja2 template with a map of variables.
@@ -18,6 +18,7 @@
 # along with Rose. If not, see <http://www.gnu.org/licenses/>.
 # -----------------------------------------------------------------------------
 
+from collections import deque
 import copy
 
 import metomi.rose.config
@@ -48,6 +49,12 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
     MAX_STORED_RULE_CHECKS = 10000
 
     def _setup_triggers(self, meta_config):
+        """Build the trigger dependency graph from meta_config.
+
+        This should be called again if meta_config is modified in place.
+
+        """
+        self._setup_meta_config = meta_config
         self.trigger_family_lookup = {}
         self._id_is_duplicate = {}  # Speedup dictionary.
         self.enabled_dict = {}
@@ -68,20 +75,91 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                         id_value_dict.update({trig_id: [None]})
                 self.trigger_family_lookup.update({setting_id: id_value_dict})
         self._trigger_involved_ids = self.get_all_ids()
+        self._triggered_ids = set()
+        for id_value_dict in self.trigger_family_lookup.values():
+            self._triggered_ids.update(id_value_dict)
+        self._ranked_trigger_ids = None
+        self._trigger_components = None
+
+    def _setup_triggers_once(self, meta_config):
+        """Build the trigger dependency graph, unless already built."""
+        if getattr(self, "_setup_meta_config", None) is not meta_config:
+            self._setup_triggers(meta_config)
 
     def transform(self, config, meta_config=None):
         """Apply metadata trigger expressions to variables."""
         self.reports = []
         meta_config = self._load_meta_config(config, meta_config)
-        self._setup_triggers(meta_config)
+        self._setup_triggers_once(meta_config)
         self.enabled_dict = {}
         self.ignored_dict = {}
-        enabled = metomi.rose.config.ConfigNode.STATE_NORMAL
+        id_list, prev_ignoreds = self._get_config_ids_and_states(config)
+
+        for _, var_id in self._get_ranked_trigger_ids():
+            self.update(var_id, config, meta_config)
+
+        self._apply_states(config, id_list, prev_ignoreds)
+        return config, self.reports
+
+    def transform_changed(self, config, meta_config, changed_ids):
+        """Apply trigger expressions, after changes to changed_ids.
+
+        This is an incremental version of "transform", for a config that has
+        already been transformed by this instance with the same meta_config,
+        and then modified at the settings in changed_ids. (Setting ids may be
+        section ids.)
+
+        Only the triggers connected to changed_ids are re-evaluated. The
+        results are the same as "transform" would return, except that
+        state changes are only reported for the settings connected to
+        changed_ids, and for changed_ids themselves.
+
+        """
+        if (getattr(self, "_setup_meta_config", None) is not meta_config or
+                getattr(self, "ignored_dict", None) is None):
+            return self.transform(config, meta_config)
+        self.reports = []
+        components = self._get_trigger_components()
+        changed_components = set()
+        for var_id in changed_ids:
+            for key in self._get_component_keys(var_id):
+                if key in components:
+                    changed_components.add(components[key])
+        changed_ids = set(changed_ids)
+
+        def is_changed(var_id):
+            """Return True if var_id is in the changed components."""
+            if var_id in changed_ids:
+                return True
+            for key in self._get_component_keys(var_id):
+                if components.get(key) in changed_components:
+                    return True
+            return False
+
+        # Re-evaluate the triggers of the changed components from scratch.
+        for dict_ in [self.enabled_dict, self.ignored_dict]:
+            for var_id in list(dict_):
+                if is_changed(var_id):
+                    dict_.pop(var_id)
+        for _, var_id in self._get_ranked_trigger_ids():
+            if is_changed(var_id):
+                self.update(var_id, config, meta_config)
+
+        id_list, prev_ignoreds = self._get_config_ids_and_states(
+            config, is_changed)
+        self._apply_states(config, id_list, prev_ignoreds)
+        return config, self.reports
+
+    def _get_config_ids_and_states(self, config, id_filter=None):
+        """Return (id_list, prev_ignoreds) for settings in config.
+
+        id_list is a list of setting ids in config, (filtered by the
+        id_filter function, if specified).
+        prev_ignoreds is a dict of ignored state: list of setting ids.
+
+        """
         trig_ignored = metomi.rose.config.ConfigNode.STATE_SYST_IGNORED
         user_ignored = metomi.rose.config.ConfigNode.STATE_USER_IGNORED
-        state_map = {enabled: 'enabled     ',
-                     trig_ignored: 'trig-ignored',
-                     user_ignored: 'user-ignored'}
         id_list = []
         prev_ignoreds = {trig_ignored: [], user_ignored: []}
         for keylist, node in config.walk():
@@ -89,14 +167,21 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                 n_id = keylist[0]
             else:
                 n_id = self._get_id_from_section_option(*keylist)
+            if id_filter is not None and not id_filter(n_id):
+                continue
             id_list.append(n_id)
             if node.state in prev_ignoreds:
                 prev_ignoreds[node.state].append(n_id)
+        return id_list, prev_ignoreds
 
-        ranked_ids = self._get_ranked_trigger_ids()
-        for _, var_id in sorted(ranked_ids):
-            self.update(var_id, config, meta_config)
-
+    def _apply_states(self, config, id_list, prev_ignoreds):
+        """Set states of id_list in config, report any changes."""
+        enabled = metomi.rose.config.ConfigNode.STATE_NORMAL
+        trig_ignored = metomi.rose.config.ConfigNode.STATE_SYST_IGNORED
+        user_ignored = metomi.rose.config.ConfigNode.STATE_USER_IGNORED
+        state_map = {enabled: 'enabled     ',
+                     trig_ignored: 'trig-ignored',
+                     user_ignored: 'user-ignored'}
         # Report any discrepancies in ignored status.
         for var_id in id_list:
             section, option = self._get_section_option_from_id(var_id)
@@ -120,7 +205,6 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                 else:
                     value = node.value
                 self.add_report(section, option, value, info)
-        return config, self.reports
 
     def update(self, var_id, config_data, meta_config):
         """Update enabled and ignored ids starting with var_id.
@@ -161,8 +245,7 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                     start_id not in self.ignored_dict):
                 # Definitely enabled.
                 is_ignored = False
-            if not sum([var_id in v for v in
-                        self.trigger_family_lookup.values()]):
+            if var_id not in self._triggered_ids:
                 # Not triggered by anything, so must be enabled.
                 is_ignored = False
             section, option = self._get_section_option_from_id(start_id)
@@ -173,9 +256,12 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
             # If the id is missing, anything it triggers should be ignored.
             is_ignored = is_ignored or not is_node_present
             id_stack.append((start_id, is_ignored))
+        # Items are pushed to the front of the stack, so the last pushed item
+        # is the next to be examined.
+        id_stack = deque(id_stack)
         update_id_list = []
         while id_stack:
-            this_id, has_ignored_parent = id_stack[0]
+            this_id, has_ignored_parent = id_stack.popleft()
             # For each id, examine its duplicates (if any) and all children.
             alt_ids = self._get_id_duplicates(
                 this_id, config_data, meta_config,
@@ -184,7 +270,7 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
             if alt_ids:
                 this_id = alt_ids.pop(0)
             for alt_id in alt_ids:
-                id_stack.insert(1, (alt_id, has_ignored_parent))
+                id_stack.appendleft((alt_id, has_ignored_parent))
             self._check_is_id_dupl(this_id, meta_config)
             # Triggered sections need their options to trigger sub children.
             if this_id in config_sections:
@@ -193,10 +279,9 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                     skip_id = self._get_id_from_section_option(
                         this_id, option)
                     if skip_id in self.trigger_family_lookup:
-                        id_stack.insert(1, (skip_id, has_ignored_parent))
+                        id_stack.appendleft((skip_id, has_ignored_parent))
             update_id_list.append(this_id)
             if not self.check_is_id_trigger(this_id, meta_config):
-                id_stack.pop(0)
                 continue
             if not has_ignored_parent:
                 section, option = self._get_section_option_from_id(this_id)
@@ -220,7 +305,7 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                             child_list.remove(this_id)
                         if not child_list:
                             self.enabled_dict.pop(child_id)
-                    id_stack.insert(1, (child_id, True))
+                    id_stack.appendleft((child_id, True))
                 else:  # Enabled parent
                     if vals == [None]:
                         # Enabled parent with a value, don't care what it is.
@@ -232,7 +317,7 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                         if (child_id in self.ignored_dict and
                                 self.ignored_dict[child_id] == {}):
                             self.ignored_dict.pop(child_id)
-                        id_stack.insert(1, (child_id, False))
+                        id_stack.appendleft((child_id, False))
                     elif not self._check_values_ok(value, this_id, vals):
                         # Enabled parent, with the wrong values.
                         repr_value = self.PARENT_VALUE.format(value)
@@ -251,7 +336,7 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                                 child_list.remove(this_id)
                             if not child_list:
                                 self.enabled_dict.pop(child_id)
-                        id_stack.insert(1, (child_id, True))
+                        id_stack.appendleft((child_id, True))
                     else:
                         # Enabled parent, value is ok.
                         self.enabled_dict.setdefault(child_id, [])
@@ -262,8 +347,7 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
                         if (child_id in self.ignored_dict and
                                 self.ignored_dict[child_id] == {}):
                             self.ignored_dict.pop(child_id)
-                        id_stack.insert(1, (child_id, False))
-            id_stack.pop(0)
+                        id_stack.appendleft((child_id, False))
         return update_id_list
 
     def _get_ranked_trigger_ids(self):
@@ -272,30 +356,88 @@ class TriggerMacro(metomi.rose.macro.MacroBaseRoseEdit):
         We need these to update in breadth-first order to get the ignored
         parent statuses correct and trickled down.
 
+        Return a sorted list of (rank, id). The rank of an id is the length
+        of the longest trigger chain leading to it. It is calculated in
+        topological order, visiting each id and trigger once.
+
         """
-        # Starting stack has each starting point id with a default depth of 0.
-        # The depth will be overwritten with whatever is the maximum depth
-        # eventually found for that id.
-        stack = [(id_, 0) for id_ in self.trigger_family_lookup]
-
-        # Create a dictionary to store the maximum depth (rank) for each id.
-        id_ranks = dict(stack)
-
-        # Loop over the stack, going down all possible trigger chains.
-        while stack:
-            parent_id, depth = stack.pop(0)
-            child_ids = self.trigger_family_lookup.get(parent_id, [])
+        if self._ranked_trigger_ids is not None:
+            return self._ranked_trigger_ids
+        # Count the number of parents of each id.
+        n_parents_of = {}
+        for parent_id, child_ids in self.trigger_family_lookup.items():
+            n_parents_of.setdefault(parent_id, 0)
             for child_id in child_ids:
-                id_ranks.setdefault(child_id, depth + 1)
-                if depth + 1 > id_ranks[child_id]:
-                    id_ranks[child_id] = depth + 1
-                stack.append((child_id, depth + 1))
+                n_parents_of[child_id] = n_parents_of.get(child_id, 0) + 1
+        id_ranks = dict((id_, 0) for id_ in n_parents_of)
+        # Visit an id when all its parents have been visited.
+        queue = deque(
+            id_ for id_, n_parents in n_parents_of.items() if not n_parents)
+        while queue:
+            parent_id = queue.popleft()
+            depth = id_ranks[parent_id] + 1
+            for child_id in self.trigger_family_lookup.get(parent_id, []):
+                if depth > id_ranks[child_id]:
+                    id_ranks[child_id] = depth
+                n_parents_of[child_id] -= 1
+                if not n_parents_of[child_id]:
+                    queue.append(child_id)
         ranked_ids = []
         for id_, rank in id_ranks.items():
             ranked_ids.append((rank, id_))
         ranked_ids.sort()
+        self._ranked_trigger_ids = ranked_ids
         return ranked_ids
 
+    def _get_component_keys(self, setting_id):
+        """Return the trigger component keys of a setting id.
+
+        These are the setting id and its section, stripped of any duplicate
+        index and modifier.
+
+        """
+        section, option = self._get_section_option_from_id(setting_id)
+        section = metomi.rose.macro.REC_ID_STRIP.sub("", section)
+        if option is None:
+            return [section]
+        return [self._get_id_from_section_option(section, option), section]
+
+    def _get_trigger_components(self):
+        """Return a dict of connected components of the trigger graph.
+
+        Map the component key of each id involved in triggers (and of its
+        section) to a component number. Updating the triggers of one
+        component does not affect the states of ids of other components.
+
+        """
+        if self._trigger_components is not None:
+            return self._trigger_components
+        parent_of = {}
+
+        def find(key):
+            """Return the root key of key."""
+            parent_of.setdefault(key, key)
+            root = key
+            while parent_of[root] != root:
+                root = parent_of[root]
+            while parent_of[key] != root:
+                parent_of[key], key = root, parent_of[key]
+            return root
+
+        for setting_id in self._trigger_involved_ids:
+            root = find(self._get_component_keys(setting_id)[0])
+            for key in self._get_component_keys(setting_id)[1:]:
+                parent_of[find(key)] = root
+            for child_id in self.trigger_family_lookup.get(setting_id, []):
+                parent_of[find(self._get_component_keys(child_id)[0])] = (
+                    find(root))
+        roots = {}
+        self._trigger_components = {}
+        for key in list(parent_of):
+            self._trigger_components[key] = roots.setdefault(
+                find(key), len(roots))
+        return self._trigger_components
+
     def validate(self, config, meta_config=None):
         self.reports = []
         if meta_config is None:
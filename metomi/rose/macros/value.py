@@ -18,7 +18,6 @@
 # along with Rose. If not, see <http://www.gnu.org/licenses/>.
 # -----------------------------------------------------------------------------
 
-import copy
 import re
 
 import metomi.rose.env
@@ -94,12 +93,10 @@ class ValueChecker(metomi.rose.macro.MacroBase):
         metadata = metomi.rose.macro.get_metadata_for_config_id(
             var_id, meta_config)
         sect, key = self._get_section_option_from_id(var_id)
-        saved_metadata = copy.deepcopy(metadata)
-        saved_metadata.pop('id')
-        for meta_key in list(saved_metadata):
-            if meta_key not in self.META_PROPS:
-                saved_metadata.pop(meta_key)
-        goodness_id = (value, tuple(sorted(saved_metadata.items())))
+        goodness_id = (value, tuple(sorted(
+            (meta_key, meta_value)
+            for meta_key, meta_value in metadata.items()
+            if meta_key in self.META_PROPS)))
         if goodness_id in self.good_value_meta_map:
             return
         if goodness_id in self.bad_value_meta_map:
@@ -298,8 +295,6 @@ class TypeFixer(metomi.rose.macro.MacroBase):
             var_id = self._get_id_from_section_option(sect, opt)
             metadata = metomi.rose.macro.get_metadata_for_config_id(
                 var_id, meta_config)
-            saved_metadata = copy.deepcopy(metadata)
-            saved_metadata.pop('id')
             node = config.get([sect, opt])
             value = node.value
             ignored_state = node.state
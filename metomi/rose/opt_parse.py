@@ -220,6 +220,14 @@ class RoseOptionParser(OptionParser):
             {"action": "store_true",
              "dest": "install_only_mode",
              "help": "Install only. Don't run."}],
+        "jobs": [
+            ["--jobs", "-j"],
+            {"action": "store",
+             "dest": "jobs",
+             "default": None,
+             "type": "int",
+             "metavar": "N",
+             "help": "Run validator macros in N parallel processes."}],
         "keys": [
             ["--keys", "-k"],
             {"action": "store_true",
@@ -322,6 +330,12 @@ class RoseOptionParser(OptionParser):
             {"action": "store_true",
              "dest": "new_mode",
              "help": "Fresh start."}],
+        "no_cache": [
+            ["--no-cache"],
+            {"action": "store_true",
+             "dest": "no_cache",
+             "default": False,
+             "help": "Ignore cached scores and contact all hosts."}],
         "no_headers": [
             ["--no-headers", "-H"],
             {"action": "store_true",
@@ -280,7 +280,9 @@ class RosePopener(object):
     async def run_bg_async(self, *args, **kwargs):
         """Provide a Rose-friendly interface to subprocess.Popen.
 
-        Return a subprocess.Popen object.
+        Return an asyncio.subprocess.Process object.
+
+        If kwargs["shell"] is True, args[0] is the shell command string.
 
         If kwargs["stdin"] is a str, turn it into subprocess.PIPE.
         However, it cannot communicate stdin to the Popen object,
@@ -298,11 +300,10 @@ class RosePopener(object):
         self.handle_event(RosePopenEvent(args, stdin))
         sys.stdout.flush()
         try:
-            if kwargs.get("shell"):
-                proc = Popen(args[0], **kwargs)
+            if kwargs.pop("shell", False):
+                proc = await asyncio.create_subprocess_shell(args[0], **kwargs)
             else:
-                command = ' '.join(map(shlex.quote, args))
-                proc = await asyncio.create_subprocess_shell(command, **kwargs)
+                proc = await asyncio.create_subprocess_exec(*args, **kwargs)
         except OSError as exc:
             if exc.filename is None and args:
                 exc.filename = args[0]
@@ -320,7 +321,7 @@ class RosePopener(object):
         proc = await self.run_bg_async(*args, **kwargs)
         stdin = None
         if isinstance(kwargs.get("stdin"), str):
-            stdin = kwargs.get("stdin")
+            stdin = kwargs.get("stdin").encode("UTF-8")
         stdout, stderr = await proc.communicate(stdin)
         await proc.wait()
         return proc.returncode, stdout, stderr
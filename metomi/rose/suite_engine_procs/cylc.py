@@ -19,6 +19,8 @@
 # -----------------------------------------------------------------------------
 """Logic specific to the Cylc suite engine."""
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import filecmp
 from glob import glob
 import os
@@ -27,14 +29,16 @@ import re
 from random import shuffle
 import socket
 import sqlite3
-import tarfile
 from tempfile import mkstemp
 from time import sleep
+from urllib.parse import quote
 from uuid import uuid4
 
 from metomi.rose.fs_util import FileSystemEvent
+from metomi.rose.indexed_tar import INDEX_EXT, dump_index, write_tar_gz
 from metomi.rose.popen import RosePopenError
 from metomi.rose.reporter import Event, Reporter
+from metomi.rose.resource import ResourceLocator
 from metomi.rose.suite_engine_proc import (
     SuiteEngineProcessor, SuiteEngineGlobalConfCompatError,
     SuiteNotRunningError, SuiteStillRunningError, TaskProps)
@@ -59,6 +63,9 @@ class CylcProcessor(SuiteEngineProcessor):
     SUITE_DIR_REL_ROOT = "cylc-run"
     TASK_ID_DELIM = "."
 
+    JOB_LOGS_ARCHIVE_COMPRESS_LEVEL = 6
+    JOBS_AUTHS_QUERY_SIZE = 200
+    MAX_PROCS = 16
     TIMEOUT = 60  # seconds
 
     def __init__(self, *args, **kwargs):
@@ -204,6 +211,68 @@ class CylcProcessor(SuiteEngineProcessor):
         self._db_close(suite_name)
         return auths
 
+    def get_suite_jobs_auths_map(self, suite_name, cycle_name_tuples):
+        """Return remote ["[user@]host", ...] for each (cycle, name).
+
+        Return a dict {(cycle, name): ["[user@]host", ...], ...} for the
+        submitted jobs matching each item of cycle_name_tuples, where cycle
+        or name or both can be None to match all. Query the database once
+        for every JOBS_AUTHS_QUERY_SIZE items, to keep each statement well
+        within SQLite's limits on expression depth and bound parameters.
+
+        """
+        auths_map = {}
+        if not cycle_name_tuples:
+            return auths_map
+        items = list(dict.fromkeys(cycle_name_tuples))
+        if (None, None) in items:
+            # Matches all, so a single unfiltered query will do
+            item_chunks = [items]
+        else:
+            item_chunks = [
+                items[i:i + self.JOBS_AUTHS_QUERY_SIZE]
+                for i in range(0, len(items), self.JOBS_AUTHS_QUERY_SIZE)]
+        parsed_auths = {}
+        for item_chunk in item_chunks:
+            stmt = "SELECT DISTINCT cycle, name, user_at_host FROM task_jobs"
+            stmt_where_list = []
+            stmt_args = []
+            for cycle, name in item_chunk:
+                stmt_fragments = []
+                if cycle is not None:
+                    stmt_fragments.append("cycle==?")
+                    stmt_args.append(cycle)
+                if name is not None:
+                    stmt_fragments.append("name==?")
+                    stmt_args.append(name)
+                if not stmt_fragments:
+                    stmt_where_list = []
+                    stmt_args = []
+                    break
+                stmt_where_list.append(" AND ".join(stmt_fragments))
+            if stmt_where_list:
+                stmt += " WHERE (" + ") OR (".join(stmt_where_list) + ")"
+            item_set = set(item_chunk)
+            for row_cycle, row_name, user_at_host in self._db_exec(
+                    suite_name, stmt, stmt_args):
+                if not user_at_host:
+                    continue
+                if user_at_host not in parsed_auths:
+                    parsed_auths[user_at_host] = self._parse_user_host(
+                        auth=user_at_host)
+                auth = parsed_auths[user_at_host]
+                if not auth:
+                    continue
+                for item in [
+                        (row_cycle, row_name), (row_cycle, None),
+                        (None, row_name), (None, None)]:
+                    if item in item_set:
+                        auths = auths_map.setdefault(item, [])
+                        if auth not in auths:
+                            auths.append(auth)
+        self._db_close(suite_name)
+        return auths_map
+
     def get_task_auth(self, suite_name, task_name):
         """
         Return [user@]host for a remote task in a suite.
@@ -305,6 +374,8 @@ class CylcProcessor(SuiteEngineProcessor):
         suite_name -- The name of a suite.
         items -- A list of relevant items.
 
+        The cycles are archived concurrently, up to MAX_PROCS at a time.
+
         """
         cycles = []
         if "*" in items:
@@ -318,38 +389,83 @@ class CylcProcessor(SuiteEngineProcessor):
                 if cycle:
                     cycles.append(cycle)
         self.job_logs_pull_remote(suite_name, cycles, prune_remote_mode=True)
+        compress_level = int(ResourceLocator.default().get_conf().get_value(
+            ["rose-suite-log", "job-logs-archive-compress-level"],
+            self.JOB_LOGS_ARCHIVE_COMPRESS_LEVEL))
         cwd = os.getcwd()
         self.fs_util.chdir(self.get_suite_dir(suite_name))
         try:
+            archives = []  # [(cycle, archive_file_name, names), ...]
             for cycle in cycles:
-                archive_file_name0 = os.path.join("log",
-                                                  "job-" + cycle + ".tar")
-                archive_file_name = archive_file_name0 + ".gz"
+                archive_file_name = os.path.join(
+                    "log", "job-" + cycle + ".tar.gz")
                 if os.path.exists(archive_file_name):
                     continue
                 glob_ = os.path.join(cycle, "*", "*", "*")
                 names = glob(os.path.join("log", "job", glob_))
                 if not names:
                     continue
-                f_bsize = os.statvfs(".").f_bsize
-                tar = tarfile.open(archive_file_name0, "w", bufsize=f_bsize)
-                for name in names:
-                    cycle, _, s_n, ext = self.parse_job_log_rel_path(name)
+                archive_names = []
+                for name in sorted(names):
+                    _, _, s_n, ext = self.parse_job_log_rel_path(name)
                     if s_n == "NN" or ext == "job.status":
                         continue
-                    tar.add(name, name.replace("log/", "", 1))
-                tar.close()
-                # N.B. Python's gzip is slow
-                self.popen.run_simple("gzip", "-f", archive_file_name0)
-                self.handle_event(FileSystemEvent(FileSystemEvent.CREATE,
-                                                  archive_file_name))
-                self.fs_util.delete(os.path.join("log", "job", cycle))
+                    archive_names.append(name)
+                archives.append((cycle, archive_file_name, archive_names))
+            with ThreadPoolExecutor(self.MAX_PROCS) as executor:
+                futures = {}
+                for cycle, archive_file_name, names in archives:
+                    futures[executor.submit(
+                        self._job_logs_archive_cycle,
+                        archive_file_name, names, compress_level)] = (
+                            cycle, archive_file_name)
+                for future in as_completed(futures):
+                    cycle, archive_file_name = futures[future]
+                    future.result()
+                    self.handle_event(FileSystemEvent(
+                        FileSystemEvent.CREATE, archive_file_name))
+                    self.fs_util.delete(os.path.join("log", "job", cycle))
         finally:
             try:
                 self.fs_util.chdir(cwd)
             except OSError:
                 pass
 
+    @staticmethod
+    def _job_logs_archive_cycle(archive_file_name, names, compress_level):
+        """Archive the job log files of a cycle.
+
+        Stream names into an indexed gzip compressed tar file in a single
+        pass. See "metomi.rose.indexed_tar". Write to temporary files, and
+        rename them to archive_file_name and its index on success.
+
+        """
+        tmp_file_names = []
+        for file_name in [archive_file_name + INDEX_EXT, archive_file_name]:
+            tmp_file_names.append((
+                os.path.join(
+                    os.path.dirname(file_name),
+                    ".%s.%s" % (os.path.basename(file_name), uuid4())),
+                file_name))
+        try:
+            with open(tmp_file_names[1][0], "xb") as handle:
+                index = write_tar_gz(
+                    handle,
+                    [(name, name.replace("log/", "", 1)) for name in names],
+                    compress_level)
+                size = handle.tell()
+            with open(tmp_file_names[0][0], "x") as handle:
+                dump_index(handle, index, size)
+            for tmp_file_name, file_name in tmp_file_names:
+                os.replace(tmp_file_name, file_name)
+        except BaseException:
+            for tmp_file_name, _ in tmp_file_names:
+                try:
+                    os.unlink(tmp_file_name)
+                except OSError:
+                    pass
+            raise
+
     def job_logs_pull_remote(self, suite_name, items,
                              prune_remote_mode=False, force_mode=False):
         """Pull and housekeep the job logs on remote task hosts.
@@ -359,6 +475,9 @@ class CylcProcessor(SuiteEngineProcessor):
         prune_remote_mode -- Remove remote job logs after pulling them.
         force_mode -- Pull even if "job.out" already exists.
 
+        The filters of all items are merged for each remote host, and the
+        remote hosts are housekept concurrently, up to MAX_PROCS at a time.
+
         """
         # Pull from remote.
         # Create a file with a uuid name, so system knows to do nothing on
@@ -369,15 +488,12 @@ class CylcProcessor(SuiteEngineProcessor):
         uuid_file_name = os.path.join(log_dir, uuid)
         self.fs_util.touch(uuid_file_name)
         try:
-            auths_filters = []  # [(auths, includes, excludes), ...]
+            auth_cycle_names = {}  # {auth: [(cycle, name), ...], ...}
             if "*" in items:
-                auths = self.get_suite_jobs_auths(suite_name)
-                if auths:
-                    # A shuffle here should allow the load for doing "rm -rf"
-                    # to be shared between job hosts who share a file system.
-                    shuffle(auths)
-                    auths_filters.append((auths, [], []))
+                for auth in self.get_suite_jobs_auths(suite_name):
+                    auth_cycle_names[auth] = [(None, None)]
             else:
+                cycle_names = []
                 for item in items:
                     cycle, name = self._parse_task_cycle_id(item)
                     if cycle is not None:
@@ -391,74 +507,141 @@ class CylcProcessor(SuiteEngineProcessor):
                             os.path.exists(os.path.join(
                                 log_dir, str(cycle), name, "NN", "job.out"))):
                         continue
-                    auths = self.get_suite_jobs_auths(
-                        suite_name, [(cycle, name)])
-                    if auths:
-                        # A shuffle here should allow the load for doing "rm
-                        # -rf" to be shared between job hosts who share a file
-                        # system.
-                        shuffle(auths)
-                        includes = []
-                        excludes = []
-                        if cycle is None and name is None:
-                            includes = []
-                            excludes = []
-                        elif name is None:
-                            includes = ["/" + cycle]
-                            excludes = ["/*"]
-                        elif cycle is None:
-                            includes = ["/*/" + name]
-                            excludes = ["/*/*"]
-                        else:
-                            includes = ["/" + cycle, "/" + cycle + "/" + name]
-                            excludes = ["/*", "/*/*"]
-                        auths_filters.append((auths, includes, excludes))
-
-            for auths, includes, excludes in auths_filters:
-                for auth in auths:
-                    data = {"auth": auth,
-                            "log_dir_rel": log_dir_rel,
-                            "uuid": uuid,
-                            "glob_": "*"}
-                    if includes:
-                        data["glob_"] = includes[-1][1:]  # Remove leading /
-                    cmd = self.popen.get_cmd(
-                        "ssh", auth,
-                        ("cd %(log_dir_rel)s && " +
-                         "(! test -f %(uuid)s && ls -d %(glob_)s)") % data)
-                    ret_code, ssh_ls_out, _ = self.popen.run(*cmd)
-                    if ret_code:
-                        continue
-                    cmd_list = ["rsync"]
-                    for include in includes:
-                        cmd_list.append("--include=" + include)
-                    for exclude in excludes:
-                        cmd_list.append("--exclude=" + exclude)
-                    cmd_list.append("%(auth)s:%(log_dir_rel)s/" % data)
-                    cmd_list.append(log_dir)
-                    try:
-                        cmd = self.popen.get_cmd(*cmd_list)
-                        self.popen(*cmd)
-                    except RosePopenError as exc:
-                        self.handle_event(exc, level=Reporter.WARN)
-                    if not prune_remote_mode:
-                        continue
-                    try:
-                        cmd = self.popen.get_cmd(
-                            "ssh", auth,
-                            "cd %(log_dir_rel)s && rm -fr %(glob_)s" % data)
-                        self.popen(*cmd)
-                    except RosePopenError as exc:
-                        self.handle_event(exc, level=Reporter.WARN)
-                    else:
-                        for line in sorted(ssh_ls_out.splitlines()):
-                            event = FileSystemEvent(
-                                FileSystemEvent.DELETE,
-                                "%s:log/job/%s/" % (auth, line))
-                            self.handle_event(event)
+                    if (cycle, name) not in cycle_names:
+                        cycle_names.append((cycle, name))
+                auths_map = self.get_suite_jobs_auths_map(
+                    suite_name, cycle_names)
+                for cycle_name in cycle_names:
+                    for auth in auths_map.get(cycle_name, []):
+                        auth_cycle_names.setdefault(auth, [])
+                        auth_cycle_names[auth].append(cycle_name)
+            if not auth_cycle_names:
+                return
+            # A shuffle here should allow the load for doing "rm -rf" to be
+            # shared between job hosts who share a file system.
+            auths = list(auth_cycle_names)
+            shuffle(auths)
+            auth_filters = []  # [(auth, globs, filters), ...]
+            for auth in auths:
+                auth_filters.append(
+                    (auth,) + self._get_job_logs_filters(
+                        auth_cycle_names[auth]))
+            asyncio.get_event_loop().run_until_complete(
+                self._job_logs_pull_remote_pool(
+                    auth_filters, log_dir_rel, log_dir, uuid,
+                    prune_remote_mode))
         finally:
             self.fs_util.delete(uuid_file_name)
 
+    @staticmethod
+    def _get_job_logs_filters(cycle_names):
+        """Return (globs, filters) to select job logs of cycle_names.
+
+        cycle_names -- A list of (cycle, name), where cycle or name or both
+        can be None to match all.
+
+        Return globs, a list of glob patterns to match the relevant job log
+        directories, and filters, a list of rsync filter rules to match the
+        relevant job log directories in the same order.
+
+        """
+        if (None, None) in cycle_names:
+            return ["*"], []
+        globs = []
+        includes = []
+        exclude_depth_1 = True
+        exclude_depth_2 = False
+        for cycle, name in cycle_names:
+            if name is None:
+                globs.append(cycle)
+                includes += ["/" + cycle, "/" + cycle + "/*"]
+            elif cycle is None:
+                globs.append("*/" + name)
+                includes.append("/*/" + name)
+                exclude_depth_1 = False
+                exclude_depth_2 = True
+            else:
+                globs.append(cycle + "/" + name)
+                includes += ["/" + cycle, "/" + cycle + "/" + name]
+                exclude_depth_2 = True
+        filters = []
+        for include in includes:
+            if "--include=" + include not in filters:
+                filters.append("--include=" + include)
+        if exclude_depth_1:
+            filters.append("--exclude=/*")
+        if exclude_depth_2:
+            filters.append("--exclude=/*/*")
+        return globs, filters
+
+    async def _job_logs_pull_remote_pool(
+            self, auth_filters, log_dir_rel, log_dir, uuid, prune_remote_mode):
+        """Pull and housekeep job logs on each remote host concurrently.
+
+        auth_filters -- A list of (auth, globs, filters) for each host.
+
+        Report the events of each host as its commands complete.
+
+        """
+        semaphore = asyncio.Semaphore(self.MAX_PROCS)
+        tasks = []
+        for auth, globs, filters in auth_filters:
+            tasks.append(asyncio.ensure_future(self._job_logs_pull_remote_auth(
+                semaphore, auth, globs, filters, log_dir_rel, log_dir, uuid,
+                prune_remote_mode)))
+        for future in asyncio.as_completed(tasks):
+            for event, kwargs in await future:
+                self.handle_event(event, **kwargs)
+
+    async def _job_logs_pull_remote_auth(
+            self, semaphore, auth, globs, filters, log_dir_rel, log_dir, uuid,
+            prune_remote_mode):
+        """Pull and housekeep job logs on a remote host.
+
+        Run the commands within a slot of semaphore.
+
+        Return a list of (event, handle_event_kwargs) to report.
+
+        """
+        events = []
+        globs_str = " ".join(globs)
+        async with semaphore:
+            cmd = self.popen.get_cmd(
+                "ssh", auth,
+                ("cd %(log_dir_rel)s && " +
+                 "(! test -f %(uuid)s && (ls -d %(globs)s 2>/dev/null || :))"
+                 ) % {"log_dir_rel": log_dir_rel,
+                      "uuid": uuid,
+                      "globs": globs_str})
+            try:
+                ret_code, ssh_ls_out, _ = await self.popen.run_async(*cmd)
+            except RosePopenError as exc:
+                events.append((exc, {"level": Reporter.WARN}))
+                return events
+            if ret_code or not ssh_ls_out.strip():
+                return events
+            cmd = self.popen.get_cmd(
+                "rsync", *filters, auth + ":" + log_dir_rel + "/", log_dir)
+            try:
+                await self.popen.run_ok_async(*cmd)
+            except RosePopenError as exc:
+                events.append((exc, {"level": Reporter.WARN}))
+            if not prune_remote_mode:
+                return events
+            cmd = self.popen.get_cmd(
+                "ssh", auth,
+                "cd %s && rm -fr %s" % (log_dir_rel, globs_str))
+            try:
+                await self.popen.run_ok_async(*cmd)
+            except RosePopenError as exc:
+                events.append((exc, {"level": Reporter.WARN}))
+            else:
+                for line in sorted(ssh_ls_out.splitlines()):
+                    events.append((FileSystemEvent(
+                        FileSystemEvent.DELETE,
+                        "%s:log/job/%s/" % (auth, line.decode())), {}))
+        return events
+
     def job_logs_remove_on_server(self, suite_name, items):
         """Remove cycle job logs.
 
@@ -485,8 +668,10 @@ class CylcProcessor(SuiteEngineProcessor):
                 # tar.gz files
                 archive_file_name = os.path.join("log",
                                                  "job-" + cycle + ".tar.gz")
-                if os.path.exists(archive_file_name):
-                    self.fs_util.delete(archive_file_name)
+                for file_name in [
+                        archive_file_name, archive_file_name + INDEX_EXT]:
+                    if os.path.exists(file_name):
+                        self.fs_util.delete(file_name)
                 # cycle directories
                 dir_name_prefix = os.path.join("log", "job")
                 dir_name = os.path.join(dir_name_prefix, cycle)
@@ -628,8 +813,9 @@ class CylcSuiteDAO(object):
     CONNECT_RETRY_DELAY = 0.1
     N_CONNECT_TRIES = 10
 
-    def __init__(self, db_f_name):
+    def __init__(self, db_f_name, read_only=False):
         self.db_f_name = db_f_name
+        self.read_only = read_only
         self.conn = None
         self.cursor = None
 
@@ -651,8 +837,15 @@ class CylcSuiteDAO(object):
             return None
         for _ in range(self.N_CONNECT_TRIES):
             try:
-                self.conn = sqlite3.connect(
-                    self.db_f_name, self.CONNECT_RETRY_DELAY)
+                if self.read_only:
+                    # Read only connection, can be shared between threads.
+                    self.conn = sqlite3.connect(
+                        "file:%s?mode=ro" % quote(self.db_f_name),
+                        self.CONNECT_RETRY_DELAY, check_same_thread=False,
+                        uri=True)
+                else:
+                    self.conn = sqlite3.connect(
+                        self.db_f_name, self.CONNECT_RETRY_DELAY)
                 self.cursor = self.conn.cursor()
             except sqlite3.OperationalError:
                 sleep(self.CONNECT_RETRY_DELAY)
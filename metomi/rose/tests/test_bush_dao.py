@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+import sqlite3
+from tempfile import TemporaryDirectory
+import unittest
+
+from metomi.rose.bush_dao import RoseBushDAO
+
+
+class _TestRoseBushDAOCache(unittest.TestCase):
+    """Test cached access to a suite database."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.home = os.environ.get("HOME")
+        os.environ["HOME"] = self.temp_dir.name
+        log_dir = os.path.join(self.temp_dir.name, "cylc-run", "suite", "log")
+        os.makedirs(log_dir)
+        self.db_f_name = os.path.join(log_dir, "db")
+        self.n_updates = 0
+        self.conn = sqlite3.connect(self.db_f_name)
+        self.conn.execute(
+            "CREATE TABLE task_states"
+            " (name, cycle, time_updated, submit_num, status)")
+        self.conn.execute(
+            "CREATE TABLE task_jobs"
+            " (cycle, name, submit_num, submit_status, time_run, run_status)")
+        self._update([
+            ("foo", "1", "2001", 1, "succeeded"),
+            ("bar", "1", "2001", 1, "failed"),
+            ("foo", "2", "2002", 1, "running"),
+            ("bar", "2", "2002", 0, "waiting")])
+        self.dao = RoseBushDAO()
+
+    def tearDown(self):
+        self.conn.close()
+        if self.home is None:
+            os.environ.pop("HOME")
+        else:
+            os.environ["HOME"] = self.home
+        self.temp_dir.cleanup()
+
+    def _update(self, task_states):
+        """Insert or replace task_states rows and their jobs."""
+        for name, cycle, time_updated, submit_num, status in task_states:
+            self.conn.execute(
+                "DELETE FROM task_states WHERE name==? AND cycle==?",
+                [name, cycle])
+            self.conn.execute(
+                "INSERT INTO task_states VALUES (?, ?, ?, ?, ?)",
+                [name, cycle, time_updated, submit_num, status])
+            self.conn.execute(
+                "DELETE FROM task_jobs WHERE name==? AND cycle==?",
+                [name, cycle])
+            if submit_num:
+                run_status = {"succeeded": 0, "failed": 1}.get(status)
+                self.conn.execute(
+                    "INSERT INTO task_jobs VALUES (?, ?, ?, 0, ?, ?)",
+                    [cycle, name, submit_num, time_updated, run_status])
+        self.conn.commit()
+        # Ensure that the modified time of the file changes, and is old
+        # enough for query results to be cached.
+        self.n_updates += 1
+        os.utime(self.db_f_name, ns=(0, 10 ** 18 + self.n_updates * 1000))
+
+    def _get_n_states(self):
+        """Return {cycle: n_states, ...} of the suite cycles summary."""
+        entries, of_n_entries = self.dao.get_suite_cycles_summary(
+            None, "suite", "time_desc", None, 0)
+        self.assertEqual(of_n_entries, len(entries))
+        return dict((entry["cycle"], entry["n_states"]) for entry in entries)
+
+    def test_db_exec_cache(self):
+        """Query results should be cached until the database changes."""
+        stmt = "SELECT COUNT(*) FROM task_states"
+        self.assertEqual([(4,)], self.dao._db_exec(None, "suite", stmt))
+        cache = self.dao.db_caches[(None, "suite")]
+        cache[(stmt, ())] = [(-1,)]
+        self.assertEqual([(-1,)], self.dao._db_exec(None, "suite", stmt))
+        self.conn.execute("DELETE FROM task_states WHERE cycle=='2'")
+        self._update([])
+        self.assertEqual([(2,)], self.dao._db_exec(None, "suite", stmt))
+
+    def test_db_exec_recent_mtime(self):
+        """Query results should not be cached if the database is new."""
+        stmt = "SELECT COUNT(*) FROM task_states"
+        os.utime(self.db_f_name)
+        self.assertEqual([(4,)], self.dao._db_exec(None, "suite", stmt))
+        cache = self.dao.db_caches[(None, "suite")]
+        cache[(stmt, ())] = [(-1,)]
+        self.assertEqual([(4,)], self.dao._db_exec(None, "suite", stmt))
+        # A recently modified write-ahead log also disables the cache
+        self._update([])
+        wal_f_name = self.db_f_name + "-wal"
+        open(wal_f_name, "w").close()
+        self.assertEqual([(4,)], self.dao._db_exec(None, "suite", stmt))
+        cache = self.dao.db_caches[(None, "suite")]
+        cache[(stmt, ())] = [(-1,)]
+        self.assertEqual([(4,)], self.dao._db_exec(None, "suite", stmt))
+        os.utime(wal_f_name, ns=(0, 10 ** 18))
+        self.assertEqual([(4,)], self.dao._db_exec(None, "suite", stmt))
+        cache = self.dao.db_caches[(None, "suite")]
+        cache[(stmt, ())] = [(-1,)]
+        self.assertEqual([(-1,)], self.dao._db_exec(None, "suite", stmt))
+
+    def test_cycles_summary(self):
+        """Cycles summary should be updated incrementally."""
+        # N.B. "sum" of NULL, e.g. "run_status == 0" of running jobs, is NULL.
+        self.assertEqual(
+            {"1": {"active": 0, "success": 1, "fail": 1,
+                   "job_active": 0, "job_success": 1, "job_fail": 1},
+             "2": {"active": 1, "success": 0, "fail": 0,
+                   "job_active": 1, "job_success": None, "job_fail": None}},
+            self._get_n_states())
+        self._update([
+            ("foo", "2", "2003", 1, "succeeded"),
+            ("baz", "3", "2003", 1, "running")])
+        self.assertEqual(
+            {"1": {"active": 0, "success": 1, "fail": 1,
+                   "job_active": 0, "job_success": 1, "job_fail": 1},
+             "2": {"active": 0, "success": 1, "fail": 0,
+                   "job_active": 0, "job_success": 1, "job_fail": 0},
+             "3": {"active": 1, "success": 0, "fail": 0,
+                   "job_active": 1, "job_success": None, "job_fail": None}},
+            self._get_n_states())
+        # Rows removed, summarise all cycles again.
+        self.conn.execute("DELETE FROM task_states WHERE cycle=='1'")
+        self._update([])
+        self.assertEqual(["2", "3"], sorted(self._get_n_states()))
+
+
+if __name__ == "__main__":
+    unittest.main()
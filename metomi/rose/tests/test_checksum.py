@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from metomi.rose.checksum import (
+    ChecksumCache, get_checksum, get_checksum_func, get_stat_checksum_func)
+
+
+class TestGetChecksum(unittest.TestCase):
+    """Test metomi.rose.checksum.get_checksum."""
+
+    def test_n_workers(self):
+        """Test parallel checksum of a directory matches serial checksum."""
+        with TemporaryDirectory() as tmp_dir:
+            for i in range(20):
+                path = os.path.join(tmp_dir, str(i % 3), str(i % 2))
+                os.makedirs(path, exist_ok=True)
+                with open(os.path.join(path, str(i)), "w") as handle:
+                    handle.write(str(i))
+            os.symlink("0", os.path.join(tmp_dir, "link"))
+            expected = []
+            for dirpath, _, filenames in os.walk(tmp_dir):
+                expected.append((dirpath[len(tmp_dir) + 1:], None, None))
+                expected.extend(
+                    os.path.join(dirpath[len(tmp_dir) + 1:], filename)
+                    for filename in filenames)
+            for n_workers in (1, 4):
+                result = get_checksum(tmp_dir, n_workers=n_workers)
+                self.assertEqual(
+                    expected,
+                    [(path, None, None) if checksum is None else path
+                     for path, checksum, _ in result])
+            self.assertEqual(
+                get_checksum(tmp_dir, n_workers=1),
+                get_checksum(tmp_dir, n_workers=4))
+
+
+class TestChecksumCache(unittest.TestCase):
+    """Test metomi.rose.checksum.ChecksumCache."""
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache_file = os.path.join(self.tmp_dir.name, "cache.db")
+        self.data_dir = os.path.join(self.tmp_dir.name, "data")
+        os.mkdir(self.data_dir)
+        for name, content in [("a", "hello"), ("b", "world")]:
+            path = os.path.join(self.data_dir, name)
+            with open(path, "w") as handle:
+                handle.write(content)
+            os.utime(path, (1e9, 1e9))
+
+    def test_cache(self):
+        """Test cached checksums match, and file contents not re-read."""
+        expected = get_checksum(self.data_dir, get_checksum_func("md5"))
+        cache = ChecksumCache(self.cache_file)
+        checksum_func = get_checksum_func("md5", cache=cache)
+        self.assertEqual(expected, get_checksum(self.data_dir, checksum_func))
+        cache.close()
+
+        cache = ChecksumCache(self.cache_file)
+        checksum_func = get_checksum_func("md5", cache=cache)
+        with patch("metomi.rose.checksum._get_hexdigest") as mock_hexdigest:
+            self.assertEqual(
+                expected, get_checksum(self.data_dir, checksum_func))
+            mock_hexdigest.assert_not_called()
+
+        # Modified file is hashed again
+        path = os.path.join(self.data_dir, "a")
+        with open(path, "w") as handle:
+            handle.write("hello again")
+        os.utime(path, (2e9, 1e9))
+        self.assertEqual(
+            get_checksum(self.data_dir, get_checksum_func("md5")),
+            get_checksum(self.data_dir, checksum_func))
+        cache.close()
+
+    def test_bad_cache_file(self):
+        """Test checksums are still calculated if the cache is unusable."""
+        expected = get_checksum(self.data_dir, get_checksum_func("md5"))
+        cache = ChecksumCache(os.path.join(self.data_dir, "a", "cache.db"))
+        checksum_func = get_checksum_func("md5", cache=cache)
+        self.assertEqual(expected, get_checksum(self.data_dir, checksum_func))
+        cache.close()
+
+
+class TestGetStatChecksumFunc(unittest.TestCase):
+    """Test metomi.rose.checksum.get_stat_checksum_func."""
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.data_dir = self.tmp_dir.name
+        for name, content in [("a", "hello"), ("b", "world")]:
+            path = os.path.join(self.data_dir, name)
+            with open(path, "w") as handle:
+                handle.write(content)
+            os.utime(path, (1e9, 1e9))
+
+    def test_stat_checksum_func(self):
+        """Test only files with changed stat are hashed again."""
+        md5_func = get_checksum_func("md5")
+        expected = get_checksum(self.data_dir, md5_func)
+        stat_map = {}
+        checksum_func = get_stat_checksum_func(md5_func, {}, stat_map)
+        self.assertEqual(expected, get_checksum(self.data_dir, checksum_func))
+        expected = dict(
+            (path, checksum) for path, checksum, _ in expected)
+        self.assertEqual(["a", "b"], sorted(stat_map))
+        self.assertEqual(5, stat_map["a"][0])
+        self.assertEqual(10 ** 18, stat_map["a"][1])
+
+        # Unchanged stat: previous (bogus) checksums are returned
+        prev_items = dict(
+            (path, (stat_key, "bogus-" + path))
+            for path, stat_key in stat_map.items())
+        checksum_func = get_stat_checksum_func(md5_func, prev_items, {})
+        result = dict(
+            (path, checksum) for path, checksum, _ in get_checksum(
+                self.data_dir, checksum_func))
+        self.assertEqual(
+            {"": None, "a": "bogus-a", "b": "bogus-b"}, result)
+
+        # Changed stat: files are hashed again
+        os.utime(os.path.join(self.data_dir, "a"), (1e9, 1.5e9))
+        stat_map = {}
+        checksum_func = get_stat_checksum_func(
+            md5_func, prev_items, stat_map)
+        result = dict(
+            (path, checksum) for path, checksum, _ in get_checksum(
+                self.data_dir, checksum_func))
+        self.assertEqual(
+            {"": None, "a": expected["a"], "b": "bogus-b"},
+            result)
+        self.assertEqual(int(1.5e18), stat_map["a"][1])
+
+    def test_recently_modified(self):
+        """Test stat of a recently modified file is not recorded."""
+        os.utime(os.path.join(self.data_dir, "a"))
+        stat_map = {}
+        checksum_func = get_stat_checksum_func(
+            get_checksum_func("md5"), {}, stat_map)
+        get_checksum(self.data_dir, checksum_func)
+        self.assertIsNone(stat_map["a"])
+        self.assertIsNotNone(stat_map["b"])
+
+    def test_blob(self):
+        """Test the path of a single file is the empty string."""
+        stat_map = {}
+        checksum_func = get_stat_checksum_func(
+            get_checksum_func("md5"), {}, stat_map)
+        get_checksum(os.path.join(self.data_dir, "a"), checksum_func)
+        self.assertEqual([""], list(stat_map))
+
+
+if __name__ == '__main__':
+    unittest.main()
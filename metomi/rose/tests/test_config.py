@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Rose. If not, see <http://www.gnu.org/licenses/>.
 # -----------------------------------------------------------------------------
+import copy
 import os.path
 import metomi.rose.config
 from io import StringIO
@@ -88,6 +89,52 @@ class TestConfigData(unittest.TestCase):
         end_node = conf.get(["", "food"])
         self.assertEqual(list(iter(end_node)), [])
 
+    def test_walk(self):
+        """Test walk order, null keys and ignored nodes."""
+        conf = metomi.rose.config.ConfigNode()
+        conf.set(["", "food"], "glorious")
+        conf.set(["dinner", "starter"], "soup")
+        conf.set(["dinner", "main"], "pie", "!")
+        conf.set(["dinner", "dessert"], "custard")
+        conf.set(["tea"], {}, "!!")
+        conf.set(["tea", "cake"], "scone")
+        self.assertEqual(
+            [
+                ["tea"],
+                ["tea", "cake"],
+                ["dinner"],
+                ["dinner", "dessert"],
+                ["dinner", "main"],
+                ["dinner", "starter"],
+                ["", "food"],
+            ],
+            [keys for keys, _ in conf.walk()])
+        self.assertEqual(
+            [["dinner"], ["dinner", "dessert"], ["dinner", "starter"],
+             ["", "food"]],
+            [keys for keys, _ in conf.walk(no_ignore=True)])
+        self.assertEqual(
+            [["dinner", "dessert"], ["dinner", "starter"]],
+            [keys for keys, _ in conf.walk(["dinner"], no_ignore=True)])
+        self.assertEqual([], list(conf.walk(["tea"], no_ignore=True)))
+        self.assertEqual([], list(conf.walk(["rubbish"])))
+        conf.state = "!"
+        self.assertEqual([], list(conf.walk(no_ignore=True)))
+
+    def test_deepcopy(self):
+        """Test deep copy of a ConfigNode."""
+        conf = metomi.rose.config.ConfigNode()
+        conf.set(["", "food"], "glorious", comments=["yum"])
+        conf.set(["dinner", "starter"], "soup", "!")
+        conf.set(["dinner", "dessert"], True)
+        new_conf = copy.deepcopy(conf)
+        self.assertEqual(str(conf), str(new_conf))
+        for keys, node in conf.walk():
+            new_node = new_conf.get(keys)
+            self.assertIsNot(node, new_node)
+            self.assertIsNot(node.comments, new_node.comments)
+        self.assertIsNot(conf.value, new_conf.value)
+
 
 class TestConfigDump(unittest.TestCase):
     """Test usage of the metomi.rose.config.Dump object."""
@@ -222,6 +269,38 @@ bar=BAR BAR BAR
         self.assertEqual(node.value, "hi")
         self.assertEqual(node.state, "!!")
 
+    def test_load_continuation(self):
+        """Test continuation lines across comments and blank lines."""
+        source = StringIO("""[foo]
+bar=a
+    # comment
+    =b
+
+  c
+baz=d""")
+        conf = metomi.rose.config.ConfigLoader().load(source)
+        self.assertEqual(conf.get_value(["foo", "bar"]), "a\nb\nc")
+        self.assertEqual(conf.get_value(["foo", "baz"]), "d")
+        self.assertEqual(conf.get(["foo", "baz"]).comments, [])
+
+    def test_load_syntax_error(self):
+        """Test line and column of syntax errors."""
+        loader = metomi.rose.config.ConfigLoader()
+        for text, code, line_num, col_num, line in [
+                ("[foo]\nbar=1\n  =2\nbad line\n",
+                 metomi.rose.config.ConfigSyntaxError.BAD_SYNTAX,
+                 4, 0, "bad line\n"),
+                ("# comment\n\n[!ns:x)(]",
+                 metomi.rose.config.ConfigSyntaxError.BAD_CHAR,
+                 3, 6, "[!ns:x)(]")]:
+            with self.assertRaises(
+                    metomi.rose.config.ConfigSyntaxError) as context:
+                loader.load(StringIO(text))
+            exc = context.exception
+            self.assertEqual(
+                (exc.code, exc.line_num, exc.col_num, exc.line),
+                (code, line_num, col_num, line))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from metomi.rose.config_tree import ConfigTreeCache, ConfigTreeLoader
+
+
+class _TestConfigTreeCache(unittest.TestCase):
+    """Test caching of loaded configurations."""
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.conf_dir = os.path.join(self.tmp_dir.name, "app")
+        self.write("rose-app.conf", "import=base\n\n[env]\nFOO=foo\n")
+        self.write("opt/rose-app-bar.conf", "[env]\nFOO=bar\n")
+        self.write("bin/hello", "echo hello\n")
+        self.write("../base/rose-app.conf", "[env]\nBAZ=baz\n")
+        self.write("../base/etc/greeting", "hello\n")
+
+    def write(self, name, content):
+        """Write content to a file in the configuration directory.
+
+        Set the modified times of all files and directories to the past, so
+        they can be cached.
+
+        """
+        path = os.path.normpath(os.path.join(self.conf_dir, name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as handle:
+            handle.write(content)
+        mtime = os.stat(path).st_mtime - 10.0
+        for dir_path, _, file_names in os.walk(self.tmp_dir.name):
+            for path in [dir_path] + [
+                    os.path.join(dir_path, name) for name in file_names]:
+                os.utime(path, (mtime, mtime))
+
+    def load(self, cache, **kwargs):
+        """Load the configuration directory using cache."""
+        return ConfigTreeLoader(cache=cache).load(
+            self.conf_dir, "rose-app.conf", **kwargs)
+
+    def test_cache(self):
+        """Test cached configurations are not loaded from files again."""
+        cache = ConfigTreeCache()
+        conf_tree = self.load(cache, opt_keys=["bar"])
+        self.assertEqual("bar", conf_tree.node.get_value(["env", "FOO"]))
+        self.assertEqual("baz", conf_tree.node.get_value(["env", "BAZ"]))
+        self.assertEqual(
+            ["bin/hello", "etc/greeting", "opt/rose-app-bar.conf"],
+            sorted(conf_tree.files))
+
+        # Changes to a returned node should not change the cache
+        conf_tree.node.set(["env", "QUX"], "qux")
+        with patch("os.walk") as mock_walk, patch(
+                "metomi.rose.config.ConfigLoader.load") as mock_load:
+            new_conf_tree = self.load(cache, opt_keys=["bar"])
+            mock_walk.assert_not_called()
+            mock_load.assert_not_called()
+        self.assertIsNone(new_conf_tree.node.get(["env", "QUX"]))
+        self.assertEqual(conf_tree.files, new_conf_tree.files)
+        self.assertEqual(conf_tree.file_locs, new_conf_tree.file_locs)
+
+    def test_cache_modified(self):
+        """Test modified files and directories are loaded again."""
+        cache = ConfigTreeCache()
+        self.load(cache)
+        self.write("opt/rose-app-bar.conf", "[env]\nFOO=barbar\n")
+        self.write("../base/etc/farewell", "bye\n")
+        conf_tree = self.load(cache, opt_keys=["bar"])
+        self.assertEqual("barbar", conf_tree.node.get_value(["env", "FOO"]))
+        self.assertEqual(
+            [
+                "bin/hello", "etc/farewell", "etc/greeting",
+                "opt/rose-app-bar.conf",
+            ],
+            sorted(conf_tree.files))
+        self.write("rose-app.conf", "[env]\nFOO=foo2\n")
+        conf_tree = self.load(cache)
+        self.assertEqual("foo2", conf_tree.node.get_value(["env", "FOO"]))
+        self.assertIsNone(conf_tree.node.get(["env", "BAZ"]))
+
+    def test_recently_modified(self):
+        """Test recently modified files are not cached."""
+        cache = ConfigTreeCache()
+        with open(os.path.join(self.conf_dir, "rose-app.conf"), "a") as handle:
+            handle.write("QUX=qux\n")
+        self.load(cache)
+        self.assertNotIn(
+            ("file", os.path.join(self.conf_dir, "rose-app.conf")),
+            [key[0:2] for key in cache.entries])
+        self.assertIn(
+            ("file", os.path.join(self.tmp_dir.name, "base", "rose-app.conf")),
+            [key[0:2] for key in cache.entries])
+
+    def test_persistent_cache(self):
+        """Test the cache can be stored in a file."""
+        file_name = os.path.join(self.tmp_dir.name, "cache", "cache.pickle")
+        cache = ConfigTreeCache(file_name)
+        conf_tree = self.load(cache, opt_keys=["bar"])
+        self.assertTrue(os.path.isfile(file_name))
+
+        cache = ConfigTreeCache(file_name)
+        with patch("metomi.rose.config.ConfigLoader.load") as mock_load:
+            new_conf_tree = self.load(cache, opt_keys=["bar"])
+            mock_load.assert_not_called()
+        self.assertEqual(conf_tree.node, new_conf_tree.node)
+        self.assertEqual(conf_tree.files, new_conf_tree.files)
+
+    def test_bad_cache_file(self):
+        """Test configurations are still loaded if the file is unusable."""
+        file_name = os.path.join(self.tmp_dir.name, "cache.pickle")
+        with open(file_name, "w") as handle:
+            handle.write("rubbish\n")
+        cache = ConfigTreeCache(file_name)
+        conf_tree = self.load(cache)
+        self.assertEqual("foo", conf_tree.node.get_value(["env", "FOO"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
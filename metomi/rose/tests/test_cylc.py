@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+import sqlite3
+import tarfile
+from tempfile import TemporaryDirectory
+import unittest
+
+from metomi.rose.suite_engine_procs.cylc import CylcProcessor, CylcSuiteDAO
+
+
+class _TestJobLogsFilters(unittest.TestCase):
+    """Test merging of job log filters of several items."""
+
+    def test_all(self):
+        """An item matching everything should select everything."""
+        self.assertEqual(
+            (["*"], []),
+            CylcProcessor._get_job_logs_filters([("1", None), (None, None)]))
+
+    def test_cycles(self):
+        """Cycle items should select whole cycle directories."""
+        self.assertEqual(
+            (["1", "2"],
+             ["--include=/1", "--include=/1/*", "--include=/2",
+              "--include=/2/*", "--exclude=/*"]),
+            CylcProcessor._get_job_logs_filters([("1", None), ("2", None)]))
+
+    def test_mixed(self):
+        """Mixed items should select the union of their directories."""
+        self.assertEqual(
+            (["1", "*/foo", "2/bar"],
+             ["--include=/1", "--include=/1/*", "--include=/*/foo",
+              "--include=/2", "--include=/2/bar", "--exclude=/*/*"]),
+            CylcProcessor._get_job_logs_filters(
+                [("1", None), (None, "foo"), ("2", "bar")]))
+        self.assertEqual(
+            (["1/foo", "1/bar"],
+             ["--include=/1", "--include=/1/foo", "--include=/1/bar",
+              "--exclude=/*", "--exclude=/*/*"]),
+            CylcProcessor._get_job_logs_filters([("1", "foo"), ("1", "bar")]))
+
+
+class _TestSuiteJobsAuthsMap(unittest.TestCase):
+    """Test lookup of job hosts of several items in one query."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.db_f_name = db_f_name = os.path.join(self.temp_dir.name, "db")
+        conn = sqlite3.connect(db_f_name)
+        conn.execute(
+            "CREATE TABLE task_jobs (cycle, name, user_at_host)")
+        conn.executemany("INSERT INTO task_jobs VALUES (?, ?, ?)", [
+            ("1", "foo", "h1.invalid"),
+            ("1", "bar", "h2.invalid"),
+            ("2", "foo", "h2.invalid"),
+            ("2", "bar", None)])
+        conn.commit()
+        conn.close()
+        self.proc = CylcProcessor()
+        self.proc.daos["suite"] = CylcSuiteDAO(db_f_name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_suite_jobs_auths_map(self):
+        """Each item should map to the hosts of its jobs."""
+        auths_map = self.proc.get_suite_jobs_auths_map(
+            "suite", [("1", None), (None, "foo"), ("2", "foo"), ("2", "bar")])
+        for auths in auths_map.values():
+            auths.sort()
+        self.assertEqual(
+            {("1", None): ["h1.invalid", "h2.invalid"],
+             (None, "foo"): ["h1.invalid", "h2.invalid"],
+             ("2", "foo"): ["h2.invalid"]},
+            auths_map)
+
+    def test_get_suite_jobs_auths_map_all(self):
+        """An item matching everything should map to all hosts."""
+        auths_map = self.proc.get_suite_jobs_auths_map(
+            "suite", [("1", "foo"), (None, None)])
+        self.assertEqual(["h1.invalid"], auths_map[("1", "foo")])
+        self.assertEqual(
+            ["h1.invalid", "h2.invalid"], sorted(auths_map[(None, None)]))
+
+    def test_get_suite_jobs_auths_map_many(self):
+        """Many items should be looked up in several queries."""
+        conn = sqlite3.connect(self.db_f_name)
+        conn.executemany("INSERT INTO task_jobs VALUES (?, ?, ?)", [
+            (str(i), "baz", "h%d.invalid" % (i % 3)) for i in range(1100)])
+        conn.commit()
+        conn.close()
+        items = [(str(i), "baz") for i in range(1100)] + [("1", None)]
+        auths_map = self.proc.get_suite_jobs_auths_map("suite", items)
+        self.assertEqual(1101, len(auths_map))
+        self.assertEqual(["h0.invalid"], auths_map[("999", "baz")])
+        self.assertEqual(
+            ["h1.invalid", "h2.invalid"], sorted(auths_map[("1", None)]))
+
+
+class _TestJobLogsArchiveCycle(unittest.TestCase):
+    """Test archiving of the job logs of a cycle."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        self.names = []
+        for name in ["foo", "bar"]:
+            path = os.path.join("log", "job", "1", name, "01", "job.out")
+            os.makedirs(os.path.dirname(path))
+            with open(path, "w") as handle:
+                handle.write(name * 1000)
+            self.names.append(path)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.temp_dir.cleanup()
+
+    def test_archive(self):
+        """The archive should contain the job logs."""
+        archive_file_name = os.path.join("log", "job-1.tar.gz")
+        CylcProcessor._job_logs_archive_cycle(
+            archive_file_name, self.names, 1)
+        self.assertEqual(
+            ["job", "job-1.tar.gz", "job-1.tar.gz.index"],
+            sorted(os.listdir("log")))
+        with tarfile.open(archive_file_name, "r:gz") as tar:
+            self.assertEqual(
+                ["job/1/foo/01/job.out", "job/1/bar/01/job.out"],
+                tar.getnames())
+            self.assertEqual(
+                b"bar" * 1000,
+                tar.extractfile("job/1/bar/01/job.out").read())
+
+    def test_archive_error(self):
+        """A failed archive should not leave any files behind."""
+        archive_file_name = os.path.join("log", "job-1.tar.gz")
+        with self.assertRaises(OSError):
+            CylcProcessor._job_logs_archive_cycle(
+                archive_file_name, self.names + ["log/job/1/baz"], 1)
+        self.assertEqual(["job"], os.listdir("log"))
+
+
+if __name__ == "__main__":
+    unittest.main()
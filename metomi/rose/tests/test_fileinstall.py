@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+from tempfile import TemporaryDirectory
+import unittest
+
+from metomi.rose.config_processors.fileinstall import Loc, LocDAO
+
+
+class _TestLocDAO(unittest.TestCase):
+    """Test the database of incremental file install settings."""
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, LocDAO.FILE_NAME)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_dao(self):
+        """Return a new LocDAO for a database in the temporary directory."""
+        loc_dao = LocDAO()
+        loc_dao.file_name = self.file_name
+        loc_dao.create()
+        return loc_dao
+
+    def test_select(self):
+        """Select should reconstruct stored locations."""
+        source = Loc("src/hello.txt", scheme="fs")
+        source.loc_type = Loc.TYPE_BLOB
+        source.add_path(Loc.BLOB, "abc123", 0o100644)
+        target = Loc("hello.txt", dep_locs=[source])
+        target.mode = Loc.MODE_AUTO
+        target.loc_type = Loc.TYPE_TREE
+        target.add_path("a", "def456", 0o100755)
+        target.add_path("b", None, None)
+        loc_dao = self.get_dao()
+        loc_dao.update_locs.extend([source, target])
+        loc_dao.execute_queued_items()
+
+        loc_dao = self.get_dao()
+        self.assertIsNone(loc_dao.select("no-such-loc"))
+        prev_target = loc_dao.select("hello.txt")
+        self.assertEqual(Loc.MODE_AUTO, prev_target.mode)
+        self.assertEqual(Loc.TYPE_TREE, prev_target.loc_type)
+        self.assertEqual(target.paths, prev_target.paths)
+        self.assertEqual(
+            ["src/hello.txt"], [loc.name for loc in prev_target.dep_locs])
+        prev_source = prev_target.dep_locs[0]
+        self.assertIs(prev_source, loc_dao.select("src/hello.txt"))
+        self.assertEqual("fs", prev_source.scheme)
+        self.assertEqual(source.paths, prev_source.paths)
+        self.assertIsNone(prev_source.dep_locs)
+
+    def test_select_after_update(self):
+        """Select should see changes made by the same DAO."""
+        loc_dao = self.get_dao()
+        self.assertIsNone(loc_dao.select("hello.txt"))
+        target = Loc("hello.txt")
+        target.mode = Loc.MODE_MKDIR
+        loc_dao.update_locs.append(target)
+        loc_dao.execute_queued_items()
+        self.assertEqual(Loc.MODE_MKDIR, loc_dao.select("hello.txt").mode)
+        loc_dao.delete_locs.append(target)
+        loc_dao.execute_queued_items()
+        self.assertIsNone(loc_dao.select("hello.txt"))
+
+    def test_select_path_stats(self):
+        """Select should reconstruct the stat of paths with checksums."""
+        target = Loc("data")
+        target.mode = Loc.MODE_AUTO
+        target.loc_type = Loc.TYPE_TREE
+        target.add_path("", None, None, None)
+        target.add_path("a", "def456", 0o100644, (3, 10 ** 18, 0o100644))
+        target.add_path("b", "abc123", 0o100644, None)
+        loc_dao = self.get_dao()
+        loc_dao.update_locs.append(target)
+        loc_dao.execute_queued_items()
+        self.assertEqual(
+            [None, (3, 10 ** 18, 0o100644), None],
+            [path.stat for path in loc_dao.select("data").paths])
+
+        # Stat of paths are replaced on update
+        target.paths[1].stat = None
+        target.paths[2].stat = (4, 10 ** 18, 0o100644)
+        loc_dao.update_locs.append(target)
+        loc_dao.execute_queued_items()
+        self.assertEqual(
+            [None, None, (4, 10 ** 18, 0o100644)],
+            [path.stat for path in loc_dao.select("data").paths])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+from tempfile import TemporaryDirectory
+from time import time
+import unittest
+
+from metomi.rose.host_select import (
+    HostScoreCache, HostSelectScoreEvent, HostSelector, LoadScorer,
+    MemoryScorer, RandomScorer, ScorerConf)
+
+
+class _TestHostSelect(unittest.TestCase):
+    """Test host selection on the local host."""
+
+    def test_select_local_host(self):
+        """Score the local host, and record the time taken to do so."""
+        host_selector = HostSelector()
+        host_score_list = host_selector.select(
+            ["localhost"], fan_out=1, use_cache=False)
+        self.assertEqual(1, len(host_score_list))
+        host_name = host_score_list[0][0]
+        self.assertTrue(host_selector.is_local_host(host_name))
+        self.assertEqual([host_name], list(host_selector.latencies))
+
+    def test_select_n_hosts(self):
+        """Early exit should still return a host that meets the thresholds."""
+        host_selector = HostSelector()
+        host_score_list = host_selector.select(
+            ["localhost"], thresholds=["load:1000"], n_hosts=1,
+            use_cache=False)
+        self.assertEqual(1, len(host_score_list))
+
+    def test_score_event(self):
+        """The latency is appended to the score, if known."""
+        self.assertEqual("foo: 0.5", str(HostSelectScoreEvent("foo", 0.5)))
+        self.assertEqual(
+            "foo: 0.5 (dt=1.250s)",
+            str(HostSelectScoreEvent("foo", 0.5, 1.25)))
+
+
+class _TestHostScoreCache(unittest.TestCase):
+    """Test the host score cache."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, "cache.json")
+        self.load_conf = ScorerConf(LoadScorer(), None)
+        self.mem_conf = ScorerConf(MemoryScorer(), None, "100")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_put_get(self):
+        """Scores are shared via the file, and keyed by method."""
+        cache = HostScoreCache(self.file_name, 60.0)
+        self.assertIsNone(cache.get_scores("foo", [self.load_conf]))
+        cache.put_scores("foo", [self.mem_conf, self.load_conf], [500, 0.5])
+        cache.save()
+        cache = HostScoreCache(self.file_name, 60.0)
+        self.assertEqual(
+            [0.5, 500],
+            cache.get_scores("foo", [self.load_conf, self.mem_conf]))
+        load5_conf = ScorerConf(LoadScorer(), "5")
+        self.assertIsNone(cache.get_scores("foo", [load5_conf]))
+        self.assertIsNone(cache.get_scores("bar", [self.load_conf]))
+        # Random scores are never cached.
+        scores = cache.get_scores(
+            "foo", [self.mem_conf, ScorerConf(RandomScorer(), None)])
+        self.assertEqual(500, scores[0])
+
+    def test_expire_remove(self):
+        """Expired and removed scores are not returned."""
+        cache = HostScoreCache(self.file_name, 60.0)
+        cache.put_scores("foo", [self.load_conf], [0.5])
+        cache.put_scores("bar", [self.load_conf], [0.7])
+        cache.entries["bar"]["load:15"][0] = time() - 61.0
+        cache.remove("foo")
+        self.assertIsNone(cache.get_scores("foo", [self.load_conf]))
+        self.assertIsNone(cache.get_scores("bar", [self.load_conf]))
+        cache.save()
+        self.assertEqual({}, HostScoreCache(self.file_name, 60.0).entries)
+
+    def test_bad_file(self):
+        """A corrupted cache file is ignored."""
+        with open(self.file_name, "w") as handle:
+            handle.write("[not json")
+        cache = HostScoreCache(self.file_name, 60.0)
+        self.assertEqual({}, cache.entries)
+        cache.put_scores("foo", [self.load_conf], [0.5])
+        cache.save()
+        cache = HostScoreCache(self.file_name, 60.0)
+        self.assertEqual([0.5], cache.get_scores("foo", [self.load_conf]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+import tarfile
+from tempfile import TemporaryDirectory
+import unittest
+
+from metomi.rose.indexed_tar import (
+    INDEX_EXT, dump_index, extract, load_index, write_tar_gz)
+
+
+class _TestIndexedTar(unittest.TestCase):
+    """Test writing and reading indexed TAR files."""
+
+    CONTENTS = {
+        "job/1/foo/01/job.out": b"foo" * 100000,
+        "job/1/foo/01/job.err": b"",
+        "job/1/bar/01/job.out": b"bar\n",
+        "job/1/bar/01/" + "x" * 200: b"long name\n"}
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.names = []
+        for name, content in sorted(self.CONTENTS.items()):
+            path = os.path.join(self.temp_dir.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as handle:
+                handle.write(content)
+            self.names.append((path, name))
+        self.path = os.path.join(self.temp_dir.name, "job-1.tar.gz")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, with_index=True):
+        """Write the indexed TAR file."""
+        with open(self.path, "wb") as handle:
+            index = write_tar_gz(handle, self.names, 6)
+            size = handle.tell()
+        if with_index:
+            with open(self.path + INDEX_EXT, "w") as handle:
+                dump_index(handle, index, size)
+        return index
+
+    def test_compatible(self):
+        """An indexed TAR file should be a normal gzip compressed TAR."""
+        self._write()
+        with tarfile.open(self.path, "r:gz") as tar:
+            self.assertEqual(
+                sorted(self.CONTENTS), sorted(tar.getnames()))
+            for name, content in self.CONTENTS.items():
+                self.assertEqual(content, tar.extractfile(name).read())
+
+    def test_index(self):
+        """The index should list the members."""
+        index = self._write()
+        self.assertEqual(index, load_index(self.path))
+        with tarfile.open(self.path, "r:gz") as tar:
+            self.assertEqual(
+                sorted((m.name, m.size, int(m.mtime))
+                       for m in tar.getmembers()),
+                sorted((name, size, mtime)
+                       for name, size, mtime, _, _ in index))
+
+    def test_extract(self):
+        """Members should be extracted with or without an index."""
+        for with_index in [True, False]:
+            self._write(with_index)
+            for name, content in self.CONTENTS.items():
+                self.assertEqual(content, extract(self.path, name))
+            with self.assertRaises(KeyError):
+                extract(self.path, "job/1/baz/01/job.out")
+
+    def test_load_index_bad(self):
+        """Missing or stale indexes should be ignored."""
+        self.assertIsNone(load_index(self.path))
+        self._write()
+        with open(self.path, "ab") as handle:
+            handle.write(b"\0")
+        self.assertIsNone(load_index(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import asyncio
+import unittest
+
+from metomi.rose.job_runner import JobManager, JobProxy, JobRunner
+
+
+class _Context(object):
+    """A minimal job context."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    def update(self, other):
+        pass
+
+
+class _JobProcessor(object):
+    """A job processor that records the concurrency and order of jobs."""
+
+    def __init__(self):
+        self.n_running = 0
+        self.n_running_max = 0
+        self.names = []
+
+    async def process_job(self, job):
+        self.n_running += 1
+        self.n_running_max = max(self.n_running_max, self.n_running)
+        self.names.append(job.name)
+        await asyncio.sleep(0.01)
+        self.n_running -= 1
+
+    def post_process_job(self, job):
+        pass
+
+    def handle_event(self, *args, **kwargs):
+        pass
+
+
+class TestJobRunner(unittest.TestCase):
+    """Test metomi.rose.job_runner.JobRunner."""
+
+    def setUp(self):
+        self.jobs = {}
+        for name in ["s0", "s1", "t0", "t1", "t2", "t3"]:
+            self.jobs[name] = JobProxy(_Context(name))
+        for i in range(4):
+            target = self.jobs["t%d" % i]
+            target.pending_for["s%d" % (i % 2)] = self.jobs["s%d" % (i % 2)]
+        # t2 is needed by t3, so s0 is deeper than s1
+        self.jobs["t3"].pending_for["t2"] = self.jobs["t2"]
+
+    def test_depths(self):
+        """Test dependency depths of jobs."""
+        self.assertEqual(
+            {"s0": 2, "s1": 1, "t0": 0, "t1": 0, "t2": 1, "t3": 0},
+            JobManager(self.jobs).depths)
+
+    def test_run(self):
+        """Test jobs are run in depth order with at most nproc at once."""
+        job_processor = _JobProcessor()
+        job_runner = JobRunner(job_processor, nproc=2)
+        job_runner(JobManager(self.jobs))
+        self.assertEqual(2, job_processor.n_running_max)
+        self.assertEqual(["s0", "s1"], job_processor.names[0:2])
+        self.assertLess(
+            job_processor.names.index("t2"), job_processor.names.index("t3"))
+        self.assertEqual(sorted(self.jobs), sorted(job_runner.timings))
+
+
+if __name__ == '__main__':
+    unittest.main()
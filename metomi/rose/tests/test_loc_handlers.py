@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import asyncio
+import os
+from tempfile import TemporaryDirectory
+from threading import Barrier
+import unittest
+
+from metomi.rose.config_processors.fileinstall import (
+    Loc, PullableLocHandlersManager)
+from metomi.rose.loc_handlers.rsync import RsyncLocHandler
+from metomi.rose.loc_handlers.svn import SvnInfoXMLParser, SvnLocHandler
+from metomi.rose.popen import RosePopenError
+
+
+class _Popener(object):
+    """A stub of RosePopener, which records its commands and their stdin.
+
+    Output of "ssh HOST ..." commands is outs[HOST], which is raised if it
+    is an exception. Other commands are run by run_func(*cmd).
+
+    """
+
+    def __init__(self, outs=None, run_func=None, barrier=None):
+        self.outs = outs or {}
+        self.run_func = run_func
+        self.barrier = barrier
+        self.cmds = []  # [(cmd, stdin), ...]
+
+    def which(self, name):
+        return "/usr/bin/" + name
+
+    def get_cmd(self, key, *args):
+        return [key] + list(args)
+
+    def __call__(self, *cmd, stdin=None):
+        self.cmds.append((list(cmd), stdin.read().decode()))
+        if self.barrier is not None:
+            self.barrier.wait()
+        out = self.outs[cmd[1]]
+        if isinstance(out, Exception):
+            raise out
+        return out, b""
+
+    def run(self, *cmd):
+        self.cmds.append((list(cmd), None))
+        return self.run_func(*cmd)
+
+    async def run_ok_async(self, *cmd, stdin=None):
+        self.cmds.append((list(cmd), stdin))
+
+
+class _Manager(object):
+    """A stub of PullableLocHandlersManager, with only a popen."""
+
+    def __init__(self, popen):
+        self.popen = popen
+
+
+class _TestSvnInfoXMLParser(unittest.TestCase):
+    """Test parsing output of "svn info --xml"."""
+
+    XML_STR = b"""<?xml version="1.0" encoding="UTF-8"?>
+<info>
+<entry kind="dir" path="a" revision="3">
+<url>file:///repos/a</url>
+<commit revision="2"><author>fred</author></commit>
+</entry>
+<entry kind="file" path="b" revision="3">
+<url>file:///repos/b</url>
+</entry>
+</info>
+"""
+
+    def test_parse(self):
+        """Parse should return the first entry."""
+        self.assertEqual(
+            {
+                "kind": "dir",
+                "path": "a",
+                "revision": "3",
+                "url": "file:///repos/a",
+                "commit": "",
+                "commit:revision": "2",
+                "commit:author": "fred",
+            },
+            SvnInfoXMLParser()(self.XML_STR))
+
+    def test_parse_entries(self):
+        """Parse entries should return all entries."""
+        entries = SvnInfoXMLParser().parse_entries(self.XML_STR)
+        self.assertEqual(2, len(entries))
+        self.assertEqual("a", entries[0]["path"])
+        self.assertEqual(
+            {
+                "kind": "file",
+                "path": "b",
+                "revision": "3",
+                "url": "file:///repos/b",
+            },
+            entries[1])
+
+
+class _TestRsyncLocHandler(unittest.TestCase):
+    """Test parsing output of the remote location scanner."""
+
+    def test_parse_lines_blob(self):
+        """A blob should get its access mode from the octal mode."""
+        loc = Loc("host:data/f1")
+        RsyncLocHandler._parse_lines(
+            loc,
+            [Loc.TYPE_BLOB, ["0o100644", "1500000000.0", "3", "data/f1"]])
+        self.assertEqual(Loc.TYPE_BLOB, loc.loc_type)
+        self.assertEqual(1, len(loc.paths))
+        self.assertEqual(0o100644, loc.paths[0].access_mode)
+        self.assertEqual(
+            "source=data/f1:mtime=1500000000.0:size=3",
+            loc.paths[0].checksum)
+
+    def test_parse_lines_tree(self):
+        """A tree should have a path for each directory and file."""
+        loc = Loc("host:data/d")
+        RsyncLocHandler._parse_lines(
+            loc,
+            [
+                Loc.TYPE_TREE,
+                ["-", "-", "-", "data/d/sub"],
+                ["0o100755", "1500000000.0", "5", "data/d/sub/f2"],
+            ])
+        self.assertEqual(Loc.TYPE_TREE, loc.loc_type)
+        self.assertEqual(
+            ["data/d/sub", "data/d/sub/f2"],
+            [path.name for path in loc.paths])
+        self.assertIsNone(loc.paths[0].checksum)
+        self.assertEqual(0o100755, loc.paths[1].access_mode)
+
+    def test_parse_lines_bad(self):
+        """Missing or unknown output should raise ValueError."""
+        for lines in [None, [], ["junk"]]:
+            self.assertRaises(
+                ValueError,
+                RsyncLocHandler._parse_lines, Loc("host:nope"), lines)
+
+
+class _TestRsyncLocHandlerParsePull(unittest.TestCase):
+    """Test "ssh" and "rsync" commands of RsyncLocHandler."""
+
+    OUTS = {
+        "h1": (
+            b"0 blob\n"
+            b"0o100644 1500000000.0 3 data/f1\n"
+            b"1 tree\n"
+            b"- - - /abs/d/sub\n"
+            b"0o100755 1500000001.0 5 /abs/d/sub/f2\n"),
+        "h2": RosePopenError(["ssh", "h2"], 255, b"", b"no route"),
+    }
+
+    def setUp(self):
+        self.popen = _Popener(self.OUTS)
+        self.handler = RsyncLocHandler(_Manager(self.popen))
+
+    def _pull(self, locs, cache_root):
+        """Pull locs concurrently, each to a cache under cache_root."""
+        for i, loc in enumerate(locs):
+            loc.cache = os.path.join(cache_root, str(i))
+
+        async def _pull_all():
+            await asyncio.gather(
+                *[self.handler.pull(loc, None) for loc in locs])
+
+        asyncio.get_event_loop().run_until_complete(_pull_all())
+
+    def test_parse_many(self):
+        """Each host should be scanned by one "ssh" command."""
+        locs = [
+            Loc("h1:data/f1"), Loc("h2:x"), Loc("h1:/abs/d"), Loc("h1:nope")]
+        excs = self.handler.parse_many(locs, None)
+        self.assertEqual(["h1:nope", "h2:x"], sorted(excs))
+        self.assertIsInstance(excs["h1:nope"], ValueError)
+        self.assertIs(self.OUTS["h2"], excs["h2:x"])
+        self.assertEqual(
+            [
+                ["ssh", "h1", "python3", "-", Loc.TYPE_BLOB, Loc.TYPE_TREE,
+                 "data/f1", "/abs/d", "nope"],
+                ["ssh", "h2", "python3", "-", Loc.TYPE_BLOB, Loc.TYPE_TREE,
+                 "x"],
+            ],
+            [cmd for cmd, _ in self.popen.cmds])
+        for _, stdin in self.popen.cmds:
+            self.assertIn("os.walk(path)", stdin)
+        self.assertEqual(["rsync"] * 4, [loc.scheme for loc in locs])
+        self.assertEqual(Loc.TYPE_BLOB, locs[0].loc_type)
+        self.assertEqual(
+            ["source=data/f1:mtime=1500000000.0:size=3"],
+            [path.checksum for path in locs[0].paths])
+        self.assertEqual(Loc.TYPE_TREE, locs[2].loc_type)
+        self.assertEqual(
+            ["/abs/d/sub", "/abs/d/sub/f2"],
+            [path.name for path in locs[2].paths])
+        self.assertEqual(0o100755, locs[2].paths[1].access_mode)
+
+    def test_group_locs(self):
+        """Locations should be grouped by host."""
+        locs = [Loc("h2:x"), Loc("h1:a"), Loc("h2:y")]
+        self.assertEqual(
+            [["h1:a"], ["h2:x", "h2:y"]],
+            [[loc.name for loc in h_locs]
+             for h_locs in self.handler.group_locs(locs)])
+
+    def test_pull_batch(self):
+        """Locations on the same host should be pulled together."""
+        locs = [
+            Loc("h1:data/f1"), Loc("h1:/abs/d"), Loc("h1:/abs/e"),
+            Loc("h1:~/f3"), Loc("h3:data/f4")]
+        for loc in locs:
+            loc.loc_type = Loc.TYPE_BLOB
+        self.handler.set_pull_locs(locs, None)
+        with TemporaryDirectory() as cache_root:
+            self._pull(locs, cache_root)
+            cache = os.path.join(cache_root, "0")
+            self.assertEqual(
+                [
+                    (["rsync", "--recursive", "--files-from=-", "h1:",
+                      os.path.join(cache, "home")],
+                     "data/f1\n"),
+                    (["rsync", "--recursive", "--files-from=-", "h1:/",
+                      os.path.join(cache, "root")],
+                     "abs/d\nabs/e\n"),
+                    (["rsync", "h1:~/f3", os.path.join(cache_root, "3")],
+                     None),
+                    (["rsync", "h3:data/f4", os.path.join(cache_root, "4")],
+                     None),
+                ],
+                sorted(self.popen.cmds))
+            self.assertTrue(os.path.isdir(os.path.join(cache, "root")))
+            self.assertTrue(os.path.isdir(os.path.join(cache, "home")))
+        self.assertEqual(
+            [
+                os.path.join(cache, "home", "data/f1"),
+                os.path.join(cache, "root", "abs/d"),
+                os.path.join(cache, "root", "abs/e"),
+                os.path.join(cache_root, "3"),
+                os.path.join(cache_root, "4"),
+            ],
+            [loc.cache for loc in locs])
+        self.assertEqual({}, self.handler.pull_batches)
+
+    def test_pull_some_out_of_date(self):
+        """Only locations set to be pulled should be pulled together."""
+        locs = [Loc("h1:data/f1"), Loc("h1:/abs/d"), Loc("h1:data/f2")]
+        self.handler.parse_many(locs, None)
+        locs[2].loc_type = Loc.TYPE_BLOB
+        # Only data/f1 and data/f2 are out of date
+        pull_locs = [locs[0], locs[2]]
+        self.popen.cmds.clear()
+        self.handler.set_pull_locs(pull_locs, None)
+        with TemporaryDirectory() as cache_root:
+            self._pull(pull_locs, cache_root)
+        cache = os.path.join(cache_root, "0")
+        self.assertEqual(
+            [
+                (["rsync", "--recursive", "--files-from=-", "h1:",
+                  os.path.join(cache, "home")],
+                 "data/f1\ndata/f2\n"),
+            ],
+            self.popen.cmds)
+        self.assertEqual(
+            [
+                os.path.join(cache, "home", "data/f1"),
+                os.path.join(cache, "home", "data/f2"),
+            ],
+            [loc.cache for loc in pull_locs])
+
+    def test_set_pull_locs_reset(self):
+        """Batches not pulled should not survive into the next run."""
+        locs = [Loc("h1:data/f1"), Loc("h1:data/f2")]
+        self.handler.set_pull_locs(locs, None)
+        self.assertEqual(
+            ["h1:data/f1", "h1:data/f2"], sorted(self.handler.pull_batches))
+        self.handler.set_pull_locs([], None)
+        self.assertEqual({}, self.handler.pull_batches)
+        # A lone location on a host is pulled on its own
+        locs[0].loc_type = Loc.TYPE_TREE
+        self.handler.set_pull_locs(locs[0:1], None)
+        with TemporaryDirectory() as cache_root:
+            self._pull(locs[0:1], cache_root)
+        self.assertEqual(
+            [(["rsync", "h1:data/f1/", os.path.join(cache_root, "0")],
+              None)],
+            self.popen.cmds)
+        self.assertEqual(os.path.join(cache_root, "0"), locs[0].cache)
+
+
+class _TestSvnLocHandlerParseMany(unittest.TestCase):
+    """Test "svn info" commands of SvnLocHandler.parse_many."""
+
+    @staticmethod
+    def _svn_info(*cmd):
+        """Return the result of "fcm info --xml NAME ..."."""
+        names = cmd[3:]
+        if any("bad" in name for name in names):
+            return 1, b"", b"bad"
+        entries = "".join(
+            '<entry kind="file" path="%s" revision="5">'
+            '<url>%s</url><commit revision="4"></commit></entry>' % (
+                os.path.basename(name), name)
+            for name in names)
+        return (
+            0, ('<?xml version="1.0"?><info>%s</info>' % entries).encode(),
+            b"")
+
+    def setUp(self):
+        self.popen = _Popener(run_func=self._svn_info)
+        self.handler = SvnLocHandler(_Manager(self.popen))
+        self.handler.INFO_MAX_ARGS = 2
+
+    def test_parse_many(self):
+        """Locations should be parsed in batches of up to INFO_MAX_ARGS."""
+        locs = [Loc("svn://h/r/%s" % name) for name in ["a", "b", "c"]]
+        self.assertEqual({}, self.handler.parse_many(locs, None))
+        self.assertEqual(
+            [
+                ["fcm", "info", "--xml", "svn://h/r/a", "svn://h/r/b"],
+                ["fcm", "info", "--xml", "svn://h/r/c"],
+            ],
+            [cmd for cmd, _ in self.popen.cmds])
+        self.assertEqual(
+            ["svn://h/r/a@5", "svn://h/r/b@5", "svn://h/r/c@5"],
+            [loc.real_name for loc in locs])
+        self.assertEqual(["4", "4", "4"], [loc.key for loc in locs])
+        self.assertEqual([Loc.TYPE_BLOB] * 3, [loc.loc_type for loc in locs])
+        self.assertEqual(["svn"] * 3, [loc.scheme for loc in locs])
+
+    def test_parse_many_fallback(self):
+        """Locations of a failed batch should be parsed one by one."""
+        locs = [Loc("svn://h/r/%s" % name) for name in ["a", "bad", "c"]]
+        excs = self.handler.parse_many(locs, None)
+        self.assertEqual(["svn://h/r/bad"], list(excs))
+        self.assertIsInstance(excs["svn://h/r/bad"], ValueError)
+        self.assertEqual(
+            [
+                ["fcm", "info", "--xml", "svn://h/r/a", "svn://h/r/bad"],
+                ["fcm", "info", "--xml", "svn://h/r/a"],
+                ["fcm", "info", "--xml", "svn://h/r/bad"],
+                ["fcm", "info", "--xml", "svn://h/r/c"],
+            ],
+            [cmd for cmd, _ in self.popen.cmds])
+        self.assertEqual(
+            ["svn://h/r/a@5", None, "svn://h/r/c@5"],
+            [loc.real_name for loc in locs])
+
+
+class _FsLocHandler(object):
+    """A stub handler of file system locations, without "parse_many"."""
+
+    SCHEME = "fs"
+
+    def __init__(self):
+        self.names = []
+
+    def parse(self, loc, _):
+        self.names.append(loc.name)
+        if not loc.name.startswith("/"):
+            raise ValueError(loc.name)
+        loc.scheme = self.SCHEME
+
+
+class _TestPullableLocHandlersManager(unittest.TestCase):
+    """Test PullableLocHandlersManager.parse_many and set_pull_locs."""
+
+    def setUp(self):
+        # Avoid loading handlers from the "rose" package.
+        self.manager = PullableLocHandlersManager.__new__(
+            PullableLocHandlersManager)
+        self.manager.can_handle = "can_pull"
+        self.popen = _Popener(
+            _TestRsyncLocHandlerParsePull.OUTS, barrier=Barrier(2, timeout=5))
+        self.manager.popen = self.popen
+        self.rsync_handler = RsyncLocHandler(self.manager)
+        self.fs_handler = _FsLocHandler()
+        self.manager.handlers = {
+            "rsync": self.rsync_handler, "fs": self.fs_handler}
+
+    def test_parse_many(self):
+        """Hosts should be scanned concurrently, errors collected by loc."""
+        locs = [
+            Loc("h1:data/f1", scheme="rsync"),
+            Loc("/etc/f0"),
+            Loc("h2:x", scheme="rsync"),
+            Loc("nope"),
+            Loc("unknown://x"),
+            Loc("h1:/abs/d", scheme="rsync"),
+        ]
+        excs = self.manager.parse_many(locs, None, nproc=2)
+        self.assertEqual(["h2:x", "nope", "unknown://x"], sorted(excs))
+        for name in ["nope", "unknown://x"]:
+            self.assertIsInstance(excs[name], ValueError)
+        self.assertIsInstance(excs["h2:x"], RosePopenError)
+        # One "ssh" for each host, waiting for each other at the barrier
+        self.assertEqual(
+            [["ssh", "h1"], ["ssh", "h2"]],
+            sorted(cmd[0:2] for cmd, _ in self.popen.cmds))
+        self.assertEqual(["/etc/f0", "nope"], sorted(self.fs_handler.names))
+        self.assertEqual(Loc.TYPE_BLOB, locs[0].loc_type)
+        self.assertEqual("fs", locs[1].scheme)
+        self.assertEqual(Loc.TYPE_TREE, locs[5].loc_type)
+
+    def test_set_pull_locs(self):
+        """Each handler should be told of its own locations to pull."""
+        locs = [
+            Loc("h1:data/f1", scheme="rsync"),
+            Loc("/etc/f0", scheme="fs"),
+            Loc("h1:data/f2", scheme="rsync"),
+        ]
+        self.manager.set_pull_locs(locs, None)
+        self.assertEqual(
+            ["h1:data/f1", "h1:data/f2"],
+            sorted(self.rsync_handler.pull_batches))
+        self.manager.set_pull_locs([], None)
+        self.assertEqual({}, self.rsync_handler.pull_batches)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import sys
+import unittest
+
+from metomi.rose.config import ConfigNode
+from metomi.rose.macro import (
+    MacroBase, MetadataIndex, combine_opt_config_map,
+    get_metadata_for_config_id, metadata_index, validate_config_map)
+import metomi.rose.macros.value
+
+
+class _TestCombineOptConfigMap(unittest.TestCase):
+    """Test combining optional configurations with a main configuration."""
+
+    def setUp(self):
+        self.main_config = ConfigNode()
+        self.main_config.set(["", "meta"], "app/HEAD")
+        self.main_config.set(["env", "FOO"], "foo", comments=["foo"])
+        self.main_config.set(["env", "BAR"], "bar")
+        self.main_config.set(["namelist:nl", "baz"], "1")
+        opt_config = ConfigNode()
+        opt_config.set(["env", "FOO"], "opt foo", "!")
+        opt_config.set(["namelist:nl"], {}, "!!")
+        opt_config.set(["namelist:new", "qux"], "2")
+        self.config_map = {None: self.main_config, "opt": opt_config}
+        self.main_config_str = str(self.main_config)
+        self.opt_config_str = str(opt_config)
+
+    def test_combine(self):
+        """Test combined configurations."""
+        combined_config_map = combine_opt_config_map(self.config_map)
+        self.assertEqual(self.main_config, combined_config_map[None])
+        self.assertIsNot(self.main_config, combined_config_map[None])
+        config = combined_config_map["opt"]
+        self.assertEqual("app/HEAD", config.get_value(["meta"]))
+        node = config.get(["env", "FOO"])
+        self.assertEqual(("opt foo", "!"), (node.value, node.state))
+        self.assertEqual("bar", config.get_value(["env", "BAR"]))
+        self.assertEqual("!!", config.get(["namelist:nl"]).state)
+        self.assertEqual("1", config.get(["namelist:nl", "baz"]).value)
+        self.assertEqual("2", config.get_value(["namelist:new", "qux"]))
+        # Main configuration is unchanged
+        self.assertEqual(self.main_config_str, str(self.main_config))
+
+    def test_copy_on_write(self):
+        """Test only modified nodes are copied from the main config."""
+        combined_config_map = combine_opt_config_map(self.config_map)
+        main_config = combined_config_map[None]
+        config = combined_config_map["opt"]
+        for keys in [["", "meta"], ["env", "BAR"], ["namelist:nl", "baz"]]:
+            self.assertIs(main_config.get(keys), config.get(keys))
+        for keys in [["env"], ["env", "FOO"], ["namelist:nl"]]:
+            self.assertIsNot(main_config.get(keys), config.get(keys))
+
+    def test_modify_combined(self):
+        """Test modifying combined configs leaves config_map unchanged."""
+        combined_config_map = combine_opt_config_map(self.config_map)
+        for config in combined_config_map.values():
+            config.set(["other", "C"], "modified")
+            config.get(["env", "BAR"]).value = "modified"
+            config.get(["namelist:nl", "baz"]).state = "!"
+            config.unset(["", "meta"])
+        self.assertEqual(self.main_config_str, str(self.main_config))
+        self.assertEqual(self.opt_config_str, str(self.config_map["opt"]))
+
+
+class _TestMetadataIndex(unittest.TestCase):
+    """Test metadata look up via a MetadataIndex."""
+
+    def setUp(self):
+        self.meta_config = ConfigNode()
+        self.meta_config.set(["namelist:foo", "title"], "Foo")
+        self.meta_config.set(["namelist:foo", "duplicate"], "true")
+        self.meta_config.set(["namelist:foo=bar", "title"], "Bar")
+        self.meta_config.set(["namelist:foo=bar", "length"], ":")
+        self.meta_config.set(["namelist:foo=bar", "type"], "integer")
+        self.meta_config.set(["namelist:foo=bar", "values"], "1", "!")
+        self.meta_config.set(["namelist:foo{baz}", "description"], "Baz")
+        self.meta_config.set(["namelist:qux", "title"], "Qux", "!!")
+        self.setting_ids = [
+            "namelist:foo", "namelist:foo(1)", "namelist:foo{baz}",
+            "namelist:foo{baz}(2)", "namelist:foo=bar",
+            "namelist:foo(1)=bar(3)", "namelist:foo=bar(1:2)",
+            "namelist:foo{baz}=bar", "namelist:qux", "namelist:none=bar"]
+
+    def test_get(self):
+        """Test index look up matches look up in the metadata config."""
+        index = MetadataIndex(self.meta_config)
+        for setting_id in self.setting_ids:
+            expected = get_metadata_for_config_id(
+                setting_id, self.meta_config)
+            self.assertEqual(expected, index.get(setting_id))
+            # Memoised, but a new dict for each call
+            metadata = index.get(setting_id)
+            metadata["id"] = None
+            self.assertEqual(expected, index.get(setting_id))
+        self.assertEqual(
+            {"id": "namelist:foo(1)=bar(3)", "title": "Bar (3)",
+             "type": "integer"},
+            index.get("namelist:foo(1)=bar(3)"))
+
+    def test_metadata_index(self):
+        """Test the index is only used within the context."""
+        self.assertEqual(
+            "Foo", get_metadata_for_config_id(
+                "namelist:foo", self.meta_config)["title"])
+        with metadata_index(self.meta_config):
+            self.meta_config.set(["namelist:foo", "title"], "New")
+            self.assertEqual(
+                "Foo", get_metadata_for_config_id(
+                    "namelist:foo", self.meta_config)["title"])
+        self.assertEqual(
+            "New", get_metadata_for_config_id(
+                "namelist:foo", self.meta_config)["title"])
+
+
+class _OddChecker(MacroBase):
+    """Test validator, reports odd values in config."""
+
+    def validate(self, config, meta_config=None):
+        self.reports = []
+        for keys, node in config.walk(no_ignore=True):
+            if not isinstance(node.value, dict) and int(node.value) % 2:
+                self.add_report(keys[0], keys[1], node.value, "odd")
+        return self.reports
+
+
+class _TestValidateConfigMap(unittest.TestCase):
+    """Test running validator macros on a map of configurations."""
+
+    def setUp(self):
+        meta_config = ConfigNode()
+        meta_config.set(["namelist:nl=a", "type"], "integer")
+        meta_config.set(["namelist:nl=a", "range"], "0:10")
+        config_map = {None: ConfigNode()}
+        for i in range(5):
+            config_map[None].set(["namelist:nl", "a"], str(i * 5))
+            config_map[None].set(["namelist:nl", "b"], str(i))
+            opt_config = ConfigNode()
+            opt_config.set(["namelist:nl", "a"], str(i * 7))
+            config_map["opt%d" % i] = opt_config
+        self.config_map = combine_opt_config_map(config_map)
+        self.meta_config = meta_config
+        self.modules = [metomi.rose.macros.value, sys.modules[__name__]]
+        self.macro_info_tuples = [
+            (__name__, "_OddChecker", "validate", None),
+            (metomi.rose.macros.value.__name__, "ValueChecker", "validate",
+             None)]
+        self.macro_names = [
+            ".".join(item[0:2]) for item in self.macro_info_tuples]
+
+    def test_n_jobs(self):
+        """Test parallel validation gives the same results as serial."""
+        results = []
+        for n_jobs in [None, 3]:
+            results.append([
+                (conf_key, sorted(
+                    (macro_name, [repr(report) for report in reports])
+                    for macro_name, reports in macro_problem_map.items()))
+                for conf_key, macro_problem_map in validate_config_map(
+                    self.config_map, self.meta_config, self.macro_names,
+                    self.modules, self.macro_info_tuples,
+                    opt_non_interactive=True, n_jobs=n_jobs)])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(
+            [None] + ["opt%d" % i for i in range(5)],
+            [conf_key for conf_key, _ in results[0]])
+        self.assertEqual(
+            ["metomi.rose.macros.value.ValueChecker"],
+            [macro_name for macro_name, _ in results[0][0][1]])
+        self.assertEqual(2, len(results[0][4][1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
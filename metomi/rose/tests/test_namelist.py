@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+from io import StringIO
+import unittest
+
+from metomi.rose.formats.namelist import parse
+
+
+class _NamedStringIO(StringIO):
+    """StringIO with a name, like an open file."""
+
+    name = "namelist"
+
+
+class TestNamelistParse(unittest.TestCase):
+    """Test metomi.rose.formats.namelist.parse."""
+
+    def _parse(self, text):
+        return parse([_NamedStringIO(text)])
+
+    def test_parse(self):
+        """Test parsing of groups, objects and values."""
+        groups = self._parse(
+            "junk before group\n"
+            "&foo\n"
+            " a=1, b(1:2)=.TRUE.,'x''y' ! comment\n"
+            "   -2.D0, 3*4.,\n"
+            " c%d(2)=2*, (1.0,2.)\n"
+            "/\n"
+            "&bar x=\"q\" /\n")
+        self.assertEqual(["foo", "bar"], [group.name for group in groups])
+        self.assertEqual(["namelist"] * 2, [group.file_ for group in groups])
+        self.assertEqual(
+            ["a=1,", "b(1:2)=.true.,'x''y',-2.0,4.0,4.0,4.0,",
+             "c%d(2)=,,(1.0,2.0),"],
+            sorted(str(obj) for obj in groups[0].objects))
+        self.assertEqual(
+            ["x='q',"], [str(obj) for obj in groups[1].objects])
+
+    def test_syntax_error(self):
+        """Test position of a syntax error."""
+        with self.assertRaises(SyntaxError) as ctx:
+            self._parse("&foo\n  a=1,\n  b=2, ?\n/\n")
+        exc = ctx.exception
+        self.assertEqual(
+            ("namelist", 3, 8, "  b=2, ?"),
+            (exc.filename, exc.lineno, exc.offset, exc.text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import gzip
+import os
+import tarfile
+from tempfile import TemporaryDirectory
+import unittest
+
+from metomi.rose.apps.rose_arch import RoseArchSource, RoseArchTarget
+from metomi.rose.apps.rose_arch_compressions.rose_arch_gzip import (
+    RoseArchGzip, gzip_file)
+from metomi.rose.apps.rose_arch_compressions.rose_arch_tar import (
+    RoseArchTarGzip)
+from metomi.rose.fs_util import FileSystemUtil
+
+
+class _AppRunner(object):
+    """A minimal application runner."""
+
+    fs_util = FileSystemUtil()
+
+
+class _TestStreamCompress(unittest.TestCase):
+    """Test the "stream" compress mode."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.work_dir = os.path.join(self.temp_dir.name, "work")
+        os.mkdir(self.work_dir)
+        self.contents = {}
+        for i in range(20):
+            name = os.path.join("d%d" % (i % 3), "f%d.txt" % i)
+            self.contents[name] = (b"hello %d\n" % i) * (i * 10000)
+            path = os.path.join(self.temp_dir.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as handle:
+                handle.write(self.contents[name])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _get_target(self, compress_scheme):
+        """Return a target with a source for each file."""
+        target = RoseArchTarget("target." + compress_scheme)
+        target.compress_scheme = compress_scheme
+        target.compress_mode = target.COMPRESS_MODE_STREAM
+        for name in self.contents:
+            target.sources[name] = RoseArchSource(
+                name, name, os.path.join(self.temp_dir.name, name))
+        return target
+
+    def test_gzip_file(self):
+        """Output should be readable by gzip, at any level."""
+        name = "d0/f3.txt"
+        path = os.path.join(self.temp_dir.name, name)
+        for level in (1, 9):
+            gzip_file(path, path + ".gz", level)
+            with gzip.open(path + ".gz") as handle:
+                self.assertEqual(self.contents[name], handle.read())
+
+    def test_gz(self):
+        """Each source should be compressed into the work directory."""
+        target = self._get_target("gz")
+        RoseArchGzip(_AppRunner()).compress_sources(target, self.work_dir)
+        for source in target.sources.values():
+            self.assertEqual(
+                os.path.join(self.work_dir, source.name + ".gz"),
+                source.path)
+            with gzip.open(source.path) as handle:
+                self.assertEqual(self.contents[source.name], handle.read())
+
+    def test_tar_gz(self):
+        """A single TAR-GZIP file should be written, with no TAR file."""
+        target = self._get_target("tar.gz")
+        target.compress_level = 1
+        RoseArchTarGzip(_AppRunner()).compress_sources(target, self.work_dir)
+        self.assertTrue(target.work_source_path.endswith(".tar.gz"))
+        self.assertEqual(
+            [os.path.basename(target.work_source_path)],
+            os.listdir(self.work_dir))
+        with tarfile.open(target.work_source_path, "r:gz") as handle:
+            for name, content in self.contents.items():
+                self.assertEqual(content, handle.extractfile(name).read())
+
+
+if __name__ == '__main__':
+    unittest.main()
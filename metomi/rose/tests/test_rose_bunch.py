@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+import sqlite3
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from metomi.rose.apps.rose_bunch import (
+    NotRunEvent, RoseBunchApp, RoseBunchDAO, SummaryEvent)
+from metomi.rose.config import ConfigNode
+from metomi.rose.config_tree import ConfigTree
+from metomi.rose.popen import RosePopener
+
+
+class _AppRunner(object):
+    """Minimal stand in for metomi.rose.app_run.AppRunner."""
+
+    def __init__(self):
+        self.events = []
+        self.popen = RosePopener(event_handler=self.handle_event)
+
+    def handle_event(self, event, **_):
+        """Record an event."""
+        self.events.append(event)
+
+    @staticmethod
+    def get_command(*_):
+        """Return no command, use [bunch]command-format."""
+        return None
+
+
+class _TestRoseBunchBase(unittest.TestCase):
+    """Run rose_bunch apps in a temporary directory."""
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        environ = patch.dict(os.environ)
+        environ.start()
+        self.addCleanup(environ.stop)
+        for key in ["CYLC_TASK_SUBMIT_NUMBER", "ROSE_TASK_LOG_DIR"]:
+            os.environ.pop(key, None)
+        self.log_file_name = os.path.join(self.temp_dir.name, "log")
+
+    def _get_conf_tree(self, ret_codes, sleeps=None, **settings):
+        """Return a conf tree to run commands that exit with ret_codes.
+
+        Each command sleeps for the matching item of sleeps (default 0.2s),
+        and logs its start and end to self.log_file_name.
+
+        """
+        if sleeps is None:
+            sleeps = [0.2] * len(ret_codes)
+        conf_tree = ConfigTree()
+        conf_tree.node = ConfigNode()
+        conf_tree.node.set(
+            ["bunch", "command-format"],
+            "echo start >>%s; sleep %%(sleep)s; echo end >>%s;"
+            " exit %%(rc)s" % (self.log_file_name, self.log_file_name))
+        conf_tree.node.set(
+            ["bunch", "names"],
+            " ".join("cmd%d" % i for i in range(len(ret_codes))))
+        conf_tree.node.set(
+            ["bunch-args", "rc"], " ".join(str(rc) for rc in ret_codes))
+        conf_tree.node.set(
+            ["bunch-args", "sleep"], " ".join(str(sleep) for sleep in sleeps))
+        for key, value in settings.items():
+            conf_tree.node.set(["bunch", key.replace("_", "-")], value)
+        return conf_tree
+
+    def _run(self, conf_tree):
+        """Run the app, return (ret_code, app_runner)."""
+        app_runner = _AppRunner()
+        ret_code = RoseBunchApp(manager=None).run(
+            app_runner, conf_tree, None, [], None, [])
+        return ret_code, app_runner
+
+    def _get_max_n_running(self):
+        """Return the maximum number of commands running at once."""
+        n_running = 0
+        max_n_running = 0
+        with open(self.log_file_name) as handle:
+            for line in handle:
+                if line.strip() == "start":
+                    n_running += 1
+                    max_n_running = max(max_n_running, n_running)
+                else:
+                    n_running -= 1
+        return max_n_running
+
+    @staticmethod
+    def _get_summary(app_runner):
+        """Return (n_ok, n_fail, n_skip, n_notrun) of the summary event."""
+        for event in app_runner.events:
+            if isinstance(event, SummaryEvent):
+                return tuple(event.args[0:4])
+
+
+class _TestRoseBunchApp(_TestRoseBunchBase):
+    """Test running commands with rose_bunch."""
+
+    def test_pool_size(self):
+        """Test no more than pool-size commands run at once."""
+        ret_code, app_runner = self._run(
+            self._get_conf_tree([0] * 6, pool_size="2"))
+        self.assertEqual(0, ret_code)
+        self.assertEqual((6, 0, 0, 0), self._get_summary(app_runner))
+        self.assertEqual(2, self._get_max_n_running())
+
+    def test_default_pool_size(self):
+        """Test all commands run at once by default."""
+        ret_code, _ = self._run(self._get_conf_tree([0] * 4))
+        self.assertEqual(0, ret_code)
+        self.assertEqual(4, self._get_max_n_running())
+
+    def test_fail_mode_continue(self):
+        """Test all commands run after a failure in continue mode."""
+        ret_code, app_runner = self._run(
+            self._get_conf_tree([0, 3, 0, 0], pool_size="1"))
+        self.assertEqual(1, ret_code)
+        self.assertEqual((3, 1, 0, 0), self._get_summary(app_runner))
+
+    def test_fail_mode_abort(self):
+        """Test no more commands start after a failure in abort mode."""
+        ret_code, app_runner = self._run(
+            self._get_conf_tree(
+                [0, 3, 0, 0], pool_size="1", fail_mode="abort"))
+        self.assertEqual(1, ret_code)
+        self.assertEqual((1, 1, 0, 2), self._get_summary(app_runner))
+        self.assertEqual(
+            ["cmd2", "cmd3"],
+            [event.args[0] for event in app_runner.events
+             if isinstance(event, NotRunEvent)])
+
+    def test_fail_mode_abort_running(self):
+        """Test running commands finish after a failure in abort mode."""
+        ret_code, app_runner = self._run(
+            self._get_conf_tree(
+                [3, 0, 0, 0], [0, 0.5, 0.5, 0.5], pool_size="2",
+                fail_mode="abort"))
+        self.assertEqual(1, ret_code)
+        self.assertEqual((1, 1, 0, 2), self._get_summary(app_runner))
+
+
+class _TestRoseBunchDAO(_TestRoseBunchBase):
+    """Test buffered recording of command states."""
+
+    def _get_db_states(self):
+        """Return {name: state, ...} in the database file."""
+        conn = sqlite3.connect(RoseBunchDAO.FILE_NAME)
+        try:
+            return dict(conn.execute("SELECT name, status FROM commands"))
+        finally:
+            conn.close()
+
+    def test_flush(self):
+        """Test states are written in batches, and read back."""
+        conf_tree = self._get_conf_tree([0])
+        dao = RoseBunchDAO(conf_tree)
+        dao.FLUSH_SIZE = 3
+        dao.FLUSH_DELAY = 3600.0
+        dao.add_command("a")
+        dao.add_command("b")
+        self.assertEqual({}, self._get_db_states())
+        # Batch is full
+        dao.add_command(2)
+        self.assertEqual(
+            {"a": dao.S_STARTED, "b": dao.S_STARTED, "2": dao.S_STARTED},
+            self._get_db_states())
+        dao.update_command_state("a", dao.S_PASS)
+        dao.update_command_state("b", dao.S_FAIL)
+        self.assertTrue(dao.check_has_succeeded("a"))
+        self.assertEqual(dao.S_STARTED, self._get_db_states()["a"])
+        # Pending states are written on close
+        dao.close()
+        self.assertEqual(
+            {"a": dao.S_PASS, "b": dao.S_FAIL, "2": dao.S_STARTED},
+            self._get_db_states())
+        dao = RoseBunchDAO(conf_tree)
+        self.assertTrue(dao.check_has_succeeded("a"))
+        self.assertFalse(dao.check_has_succeeded("b"))
+        self.assertFalse(dao.check_has_succeeded(2))
+        dao.close()
+
+    def test_flush_delay(self):
+        """Test states are written once FLUSH_DELAY has passed."""
+        dao = RoseBunchDAO(self._get_conf_tree([0]))
+        dao.add_command("a")
+        self.assertEqual({}, self._get_db_states())
+        dao.time_flushed -= dao.FLUSH_DELAY
+        dao.flush(force=False)
+        self.assertEqual({"a": dao.S_STARTED}, self._get_db_states())
+        dao.close()
+
+    def test_incremental_after_abort(self):
+        """Test states of a run that aborts are recorded for the next run."""
+        conf_tree = self._get_conf_tree(
+            ["`cat<rc%d`" % i for i in range(3)], pool_size="1",
+            fail_mode="abort")
+        for i, ret_code in enumerate([0, 3, 0]):
+            with open("rc%d" % i, "w") as handle:
+                handle.write(str(ret_code))
+        ret_code, app_runner = self._run(conf_tree)
+        self.assertEqual(1, ret_code)
+        self.assertEqual((1, 1, 0, 1), self._get_summary(app_runner))
+        self.assertEqual(
+            {"cmd0": RoseBunchDAO.S_PASS, "cmd1": RoseBunchDAO.S_FAIL},
+            self._get_db_states())
+        # Same configuration, cmd0 is skipped and the others run
+        with open("rc1", "w") as handle:
+            handle.write("0")
+        ret_code, app_runner = self._run(conf_tree)
+        self.assertEqual(0, ret_code)
+        self.assertEqual((2, 0, 1, 0), self._get_summary(app_runner))
+        ret_code, app_runner = self._run(conf_tree)
+        self.assertEqual(0, ret_code)
+        self.assertEqual((0, 0, 3, 0), self._get_summary(app_runner))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import os
+import shlex
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+from metomi.rose.apps.rose_prune import (
+    RosePruneApp, SharedFileSystemSkipEvent)
+from metomi.rose.config import ConfigNode
+from metomi.rose.config_tree import ConfigTree
+from metomi.rose.fs_util import FileSystemEvent
+from metomi.rose.popen import RosePopener
+
+
+class _HostSelector(object):
+    """Stand in for HostSelector, "localhost" is the only local host."""
+
+    def __init__(self, *_):
+        pass
+
+    @staticmethod
+    def get_local_host():
+        """Return the name of the local host."""
+        return "localhost"
+
+    @staticmethod
+    def is_local_host(host):
+        """Return True if host is the local host."""
+        return host == "localhost"
+
+
+class _Popener(RosePopener):
+    """Run "ssh" commands locally, in the home directory of each host.
+
+    Prune commands on job hosts are slowed down by delay seconds.
+
+    """
+
+    def __init__(self, event_handler, host_homes, delay):
+        RosePopener.__init__(self, event_handler)
+        self.host_homes = host_homes
+        self.delay = delay
+
+    def get_cmd(self, key, *args):
+        if key != "ssh":
+            return RosePopener.get_cmd(self, key, *args)
+        host, command = args
+        command = command.replace(
+            "rm -fr", "sleep %s; rm -fr" % self.delay)
+        return ["bash", "-c", "cd %s && %s" % (
+            shlex.quote(self.host_homes[host]), command)]
+
+
+class _SuiteEngineProc(object):
+    """Stand in for the suite engine processor."""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+
+    def get_suite_jobs_auths(self, *_):
+        """Return the job hosts."""
+        return list(self.hosts)
+
+    @staticmethod
+    def get_suite_dir_rel(suite_name):
+        """Return the path to the suite directory relative to $HOME."""
+        return os.path.join("cylc-run", suite_name)
+
+    def get_suite_dir(self, suite_name):
+        """Return the path to the suite directory."""
+        return os.path.join(
+            os.path.expanduser("~"), self.get_suite_dir_rel(suite_name))
+
+
+class _AppRunner(object):
+    """Minimal stand in for metomi.rose.app_run.AppRunner."""
+
+    def __init__(self, host_homes, delay):
+        self.events = []
+        self.popen = _Popener(self.handle_event, host_homes, delay)
+        self.suite_engine_proc = _SuiteEngineProc(sorted(host_homes))
+
+    def event_handler(self, event, **_):
+        """Record an event."""
+        self.events.append(event)
+
+    handle_event = event_handler
+
+
+class _TestRosePruneSharedFileSystem(unittest.TestCase):
+    """Test job hosts sharing a file system prune it once."""
+
+    PATHS = ["work/1/foo", "work/1/bar", "share/cycle/1/baz"]
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        environ = patch.dict(os.environ)
+        environ.start()
+        self.addCleanup(environ.stop)
+        for key in ["ROSE_TASK_CYCLE_TIME", "ROSE_CYCLING_MODE"]:
+            os.environ.pop(key, None)
+        os.environ["ROSE_CYCLING_MODE"] = "integer"
+        os.environ["ROSE_SUITE_NAME"] = "suite"
+        self.homes = {}
+        for name in ["local", "remote"]:
+            home = os.path.join(self.temp_dir.name, name)
+            for path in self.PATHS:
+                os.makedirs(os.path.join(home, "cylc-run", "suite", path))
+            self.homes[name] = home
+        os.environ["HOME"] = self.homes["local"]
+        host_selector = patch(
+            "metomi.rose.apps.rose_prune.HostSelector", _HostSelector)
+        host_selector.start()
+        self.addCleanup(host_selector.stop)
+        self.conf_tree = ConfigTree()
+        self.conf_tree.node = ConfigNode()
+        self.conf_tree.node.set(["prune", "prune-work-at"], "1")
+        self.conf_tree.node.set(["prune", "prune{share/cycle}"], "1")
+
+    def _run(self, host_homes, delay=0.0):
+        """Run the app with job hosts in host_homes, return the events."""
+        app_runner = _AppRunner(host_homes, delay)
+        RosePruneApp(manager=None).run(
+            app_runner, self.conf_tree, None, [], "a-uuid", [])
+        return app_runner.events
+
+    def _assert_pruned(self):
+        """Assert all paths are pruned and no marker files remain."""
+        for home in self.homes.values():
+            suite_dir = os.path.join(home, "cylc-run", "suite")
+            for name in ["work", "share/cycle"]:
+                self.assertEqual(
+                    [], os.listdir(os.path.join(suite_dir, name)))
+            self.assertEqual(
+                ["share", "work"], sorted(os.listdir(suite_dir)))
+
+    @staticmethod
+    def _get_deletes(events):
+        """Return sorted [(host, path), ...] of delete events."""
+        deletes = []
+        for event in events:
+            if (isinstance(event, FileSystemEvent) and
+                    event.action == FileSystemEvent.DELETE):
+                host, _, path = event.target.rpartition(":")
+                deletes.append((host or "localhost", path))
+        return sorted(deletes)
+
+    def test_job_hosts_share_file_system(self):
+        """Test job hosts sharing a file system prune each path once."""
+        events = self._run(
+            {"h1.invalid": self.homes["remote"],
+             "h2.invalid": self.homes["remote"]},
+            delay=0.5)
+        self._assert_pruned()
+        deletes = self._get_deletes(events)
+        self.assertEqual(
+            ["share/cycle/1", "share/cycle/1", "work/1", "work/1"],
+            sorted(path for _, path in deletes))
+        remote_hosts = set(
+            host for host, _ in deletes if host != "localhost")
+        self.assertEqual(1, len(remote_hosts))
+        skipped = [
+            event.args[0] for event in events
+            if isinstance(event, SharedFileSystemSkipEvent)]
+        self.assertEqual(
+            {"h1.invalid", "h2.invalid"} - remote_hosts, set(skipped))
+
+    def test_job_host_shares_suite_file_system(self):
+        """Test a job host sharing the suite host file system skips."""
+        events = self._run(
+            {"h1.invalid": self.homes["local"],
+             "h2.invalid": self.homes["remote"]})
+        self._assert_pruned()
+        self.assertEqual(
+            [("h2.invalid", "share/cycle/1"), ("h2.invalid", "work/1"),
+             ("localhost", "share/cycle/1"), ("localhost", "work/1")],
+            self._get_deletes(events))
+        self.assertEqual(
+            ["h1.invalid"],
+            [event.args[0] for event in events
+             if isinstance(event, SharedFileSystemSkipEvent)])
+
+
+if __name__ == "__main__":
+    unittest.main()
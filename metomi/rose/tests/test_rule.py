@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import unittest
+
+from metomi.rose.config import ConfigNode
+from metomi.rose.macros.rule import RuleEvaluator, RuleValueError
+
+
+class _TestRuleEvaluatorCache(unittest.TestCase):
+    """Compiled rules should give the same results as fresh evaluations."""
+
+    SETTING_ID = "namelist:foo=bar"
+
+    def _evaluate(self, rule, values, use_cache):
+        """Evaluate rule for each value of bar, return a list of results."""
+        results = []
+        evaluator = RuleEvaluator()
+        for value, baz_value in values:
+            if not use_cache:
+                RuleEvaluator._compiled_rules.clear()
+            config = ConfigNode()
+            config.set(["namelist:foo", "bar"], value)
+            config.set(["namelist:foo", "baz"], baz_value)
+            try:
+                results.append(evaluator.evaluate_rule(
+                    rule, self.SETTING_ID, config, ConfigNode()))
+            except (RuleValueError, TypeError, ValueError) as exc:
+                results.append(type(exc))
+        return results
+
+    def test_cache(self):
+        """Results with and without the cache should be the same."""
+        values = [
+            ("x", "1"), ("1", "1"), ("x", "x"), ("1,2,3", "1"), ("1,2", "2"),
+            ("0", "0"), ("2,1,0", "0"), ("'0A'", "x"), ("x", "0")]
+        for rule in [
+                'this == "x"',
+                'this == namelist:foo=baz',
+                '"x" == namelist:foo=baz or this > 1e0',
+                'any(this == 1) and len(namelist:foo=baz) == 1',
+                'len(this) > 2',
+                'this(2) == namelist:foo=baz',
+                'namelist:foo=qux > 0']:
+            RuleEvaluator._compiled_rules.clear()
+            self.assertEqual(
+                self._evaluate(rule, values, False),
+                self._evaluate(rule, values, True),
+                rule)
+
+    def test_compile_once(self):
+        """A rule should only be compiled once for similar values."""
+        RuleEvaluator._compiled_rules.clear()
+        rule = "this > namelist:foo=baz"
+        self.assertEqual(
+            [True, False, False],
+            self._evaluate(rule, [("2", "1"), ("1", "2"), ("3", "4")], True))
+        template = RuleEvaluator._compiled_rules[(rule, self.SETTING_ID)][0]
+        self._evaluate(rule, [("5", "1")], True)
+        self.assertIs(
+            template,
+            RuleEvaluator._compiled_rules[(rule, self.SETTING_ID)][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2012-2019 British Crown (Met Office) & Contributors.
+#
+# This file is part of Rose, a framework for meteorological suites.
+#
+# Rose is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Rose is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Rose. If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+import copy
+from io import StringIO
+import unittest
+
+import metomi.rose.config
+from metomi.rose.macros.trigger import TriggerMacro
+
+
+META_CONFIG = """
+[env=A]
+trigger=env=B: 1; env=C
+
+[env=B]
+trigger=env=D: 2, 3; namelist:qux
+
+[env=C]
+trigger=env=D
+
+[env=D]
+
+[env=X]
+trigger=env=Y: true
+
+[env=Y]
+
+[namelist:qux]
+
+[namelist:qux=a]
+trigger=namelist:qux=b: .true.
+
+[namelist:qux=b]
+
+[namelist:dup]
+duplicate=true
+
+[namelist:dup=c]
+trigger=namelist:dup=d: 0
+
+[namelist:dup=d]
+"""
+
+CONFIG = """
+[env]
+A=1
+B=2
+C=foo
+D=bar
+X=true
+Y=baz
+
+[namelist:qux]
+a=.true.
+b=1
+
+[namelist:dup(1)]
+c=0
+d=x
+
+[namelist:dup(2)]
+c=1
+d=y
+"""
+
+
+class _TestTriggerMacro(unittest.TestCase):
+    """Test incremental trigger updates against full updates."""
+
+    def setUp(self):
+        self.meta_config = metomi.rose.config.load(StringIO(META_CONFIG))
+        self.config = metomi.rose.config.load(StringIO(CONFIG))
+
+    @staticmethod
+    def _get_states(config):
+        """Return a dict of {keys: state} for all settings in config."""
+        return dict(
+            (tuple(keys), node.state) for keys, node in config.walk())
+
+    def test_ranked_trigger_ids(self):
+        """Ids should be ranked by their longest trigger chain."""
+        macro = TriggerMacro()
+        macro._setup_triggers(self.meta_config)
+        ranks = dict(
+            (id_, rank) for rank, id_ in macro._get_ranked_trigger_ids())
+        self.assertEqual(0, ranks["env=A"])
+        self.assertEqual(1, ranks["env=B"])
+        self.assertEqual(2, ranks["env=D"])
+        self.assertEqual(2, ranks["namelist:qux"])
+        self.assertEqual(0, ranks["env=X"])
+        self.assertEqual(1, ranks["env=Y"])
+
+    def test_ranked_trigger_ids_cyclic(self):
+        """Cyclic triggers should not hang ranking."""
+        meta_config = metomi.rose.config.ConfigNode()
+        meta_config.set(["env=A", "trigger"], "env=B")
+        meta_config.set(["env=B", "trigger"], "env=A")
+        macro = TriggerMacro()
+        macro._setup_triggers(meta_config)
+        self.assertEqual(
+            ["env=A", "env=B"],
+            sorted(id_ for _, id_ in macro._get_ranked_trigger_ids()))
+
+    def test_transform_changed(self):
+        """Incremental updates should give the same states as full ones."""
+        macro = TriggerMacro()
+        config, reports = macro.transform(self.config, self.meta_config)
+        self.assertTrue(reports)
+        for changes in [
+                [(["env", "A"], "0")],
+                [(["env", "A"], "1")],
+                [(["env", "B"], "3")],
+                [(["env", "B"], "4")],
+                [(["env", "X"], "false")],
+                [(["env", "A"], "1"), (["env", "X"], "true")],
+                [(["namelist:qux", "a"], ".false.")],
+                [(["namelist:dup(2)", "c"], "0")],
+                [(["namelist:dup(1)", "c"], "1")]]:
+            changed_ids = []
+            for keys, value in changes:
+                config.set(keys, value)
+                changed_ids.append("=".join(keys))
+            expected_config = copy.deepcopy(config)
+            expected_reports = TriggerMacro().transform(
+                expected_config, self.meta_config)[1]
+            reports = macro.transform_changed(
+                config, self.meta_config, changed_ids)[1]
+            self.assertEqual(
+                self._get_states(expected_config), self._get_states(config))
+            self.assertEqual(
+                sorted(str(r.__dict__) for r in expected_reports),
+                sorted(str(r.__dict__) for r in reports))
+
+    def test_transform_changed_unconnected(self):
+        """Unconnected triggers should not be re-evaluated."""
+        macro = TriggerMacro()
+        config = macro.transform(self.config, self.meta_config)[0]
+        config.set(["env", "X"], "false")
+        # Stale, but not connected to env=X.
+        config.set(["env", "D"], state=config.STATE_NORMAL)
+        reports = macro.transform_changed(
+            config, self.meta_config, ["env=X"])[1]
+        self.assertEqual(
+            [("env", "Y")], [(r.section, r.option) for r in reports])
+        self.assertEqual(config.STATE_NORMAL, config.get(["env", "D"]).state)
+
+
+if __name__ == "__main__":
+    unittest.main()